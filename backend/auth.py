@@ -1,11 +1,17 @@
 import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import database
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -17,12 +23,69 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# bcrypt is CPU bound, so it runs on a bounded pool instead of the event loop
+hash_executor = ThreadPoolExecutor(max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", 4)), thread_name_prefix="password-hash")
+
+UserPrincipal = namedtuple("UserPrincipal", ["id", "username", "is_active", "created_at"])
+
+class UserCache():
+    """
+    Per-process LRU cache of authenticated users, so requests skip the users lookup.
+    Nothing invalidates entries across workers or services: a changed user (e.g. is_active) is seen after at most
+    ttl_seconds, so keep USER_CACHE_TTL_SECONDS short or call invalidate() in the process that made the change.
+    """
+    def __init__(self, ttl_seconds: float = 60.0, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.container = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, username: str) -> UserPrincipal | None:
+        with self.lock:
+            item = self.container.get(username, None)
+            if item is None:
+                return None
+            expires_at, user = item
+            if expires_at < time.monotonic():
+                del self.container[username]
+                return None
+            self.container.move_to_end(username)
+            return user
+
+    def set(self, user: UserPrincipal):
+        if self.ttl_seconds <= 0:
+            return
+        with self.lock:
+            self.container[user.username] = (time.monotonic() + self.ttl_seconds, user)
+            self.container.move_to_end(user.username)
+            while len(self.container) > self.max_size:
+                self.container.popitem(last=False)
+
+    def invalidate(self, username: str):
+        with self.lock:
+            self.container.pop(username, None)
+
+    def clear(self):
+        with self.lock:
+            self.container.clear()
+
+user_cache = UserCache(
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", 60)),
+    max_size=int(os.getenv("USER_CACHE_MAX_SIZE", 10000)),
+)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_hashed_password(plain_password):
     return pwd_context.hash(plain_password)
 
+async def averify_password(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, verify_password, plain_password, hashed_password)
+
+async def aget_hashed_password(plain_password):
+    return await asyncio.get_running_loop().run_in_executor(hash_executor, get_hashed_password, plain_password)
+
 def create_access_token(data: dict, expires_minutes: int | None = None):
     if expires_minutes:
         expires_at = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
@@ -30,7 +93,7 @@ def create_access_token(data: dict, expires_minutes: int | None = None):
         expires_at = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     return jwt.encode({**data, "exp": expires_at}, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(access_token: str = Depends(oauth2_scheme), db: Session = Depends(database.GetRDB)):
+async def get_current_user(access_token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.GetAsyncRDB)):
     try:
         data = jwt.decode(access_token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.InvalidTokenError:
@@ -39,11 +102,19 @@ async def get_current_user(access_token: str = Depends(oauth2_scheme), db: Sessi
     username = data.get("username", None)
     if username is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
-    
-    user = db.query(
-        database.Users.id, database.Users.username, database.Users.is_active, database.Users.created_at
-    ).filter(database.Users.username == username).first()
+
+    # cache hit -> skip the database round trip
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+
+    user = (await db.execute(
+        select(database.Users.id, database.Users.username, database.Users.is_active, database.Users.created_at)
+        .where(database.Users.username == username)
+    )).first()
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
-    
+
+    user = UserPrincipal(user.id, user.username, user.is_active, user.created_at)
+    user_cache.set(user)
     return user
@@ -0,0 +1,70 @@
+import os
+import time
+import uuid
+import asyncio
+import argparse
+import httpx
+from dotenv import load_dotenv
+load_dotenv()
+
+async def run_load(name, n_requests, concurrency, request_fn):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    n_errors = 0
+
+    async def worker():
+        nonlocal n_errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await request_fn()
+                response.raise_for_status()
+            except Exception:
+                n_errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(n_requests)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{name}: requests={n_requests}, concurrency={concurrency}, errors={n_errors}, rps={n_requests / elapsed:.1f}, p50={p50:.1f}ms, p99={p99:.1f}ms")
+
+async def main(args):
+    username = f"bench-{uuid.uuid4().hex[:8]}@frony.com"
+    password = uuid.uuid4().hex
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        response = await client.post("/api/auth/signup", json={"username": username, "password": password})
+        response.raise_for_status()
+        response = await client.post("/api/auth/login", data={"username": username, "password": password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        await run_load(
+            "GET /api/auth/me", args.n_requests, args.concurrency,
+            lambda: client.get("/api/auth/me", headers=headers),
+        )
+        await run_load(
+            "POST /api/auth/login (storm)", args.n_logins, args.concurrency,
+            lambda: client.post("/api/auth/login", data={"username": username, "password": password}),
+        )
+        # /me requests issued while a login storm is running show event loop stalls
+        await asyncio.gather(
+            run_load(
+                "GET /api/auth/me (during login storm)", args.n_requests, args.concurrency,
+                lambda: client.get("/api/auth/me", headers=headers),
+            ),
+            run_load(
+                "POST /api/auth/login (concurrent storm)", args.n_logins, args.concurrency,
+                lambda: client.post("/api/auth/login", data={"username": username, "password": password}),
+            ),
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark authentication endpoints of a running backend")
+    parser.add_argument("--url", default=os.getenv("BACKEND_URL", "http://localhost:8000"))
+    parser.add_argument("--n-requests", type=int, default=2000)
+    parser.add_argument("--n-logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+import re
+import json
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from openai import OpenAI
+import schemas
+from prompt_builder import PromptBuilder, TokenCounter
+
+BLOCK_SIZE = 16
+
+def tokenize(text: str) -> list[str]:
+    return re.findall(r"\w+|[^\w\s]|\s+", text)
+
+def render(messages: list[dict]) -> list[str]:
+    # chat template of the stand-in: the prompt is the concatenation of all messages
+    return tokenize("".join(f"<|{m['role']}|>\n{m['content']}\n" for m in messages) + "<|assistant|>\n")
+
+class PrefixCache():
+    # block-level prefix cache as in vLLM: a block is reused when it and every block before it were seen
+    def __init__(self):
+        self.blocks = set()
+        self.lock = threading.Lock()
+
+    def lookup_and_insert(self, tokens: list[str]) -> int:
+        cached, parent, hit = 0, "", True
+        with self.lock:
+            for start in range(0, len(tokens) - len(tokens) % BLOCK_SIZE, BLOCK_SIZE):
+                parent = hashlib.sha1((parent + "\x00".join(tokens[start:start + BLOCK_SIZE])).encode("utf-8")).hexdigest()
+                if hit and (parent in self.blocks):
+                    cached += BLOCK_SIZE
+                else:
+                    hit = False
+                    self.blocks.add(parent)
+        return cached
+
+def make_handler(cache: PrefixCache):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            tokens = render(body["messages"])
+            cached = cache.lookup_and_insert(tokens)
+            answer = f"answer to turn {len(body['messages'])}: " + " ".join(random.choice(["retrieval", "context", "vector", "문서", "요약"]) for _ in range(60))
+            payload = json.dumps({
+                "id": "cmpl-bench", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": len(tokens), "completion_tokens": 60, "total_tokens": len(tokens) + 60,
+                    "prompt_tokens_details": {"cached_tokens": cached},
+                },
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def simulate(client, model, builder, n_turns, n_chunks, seed=0):
+    # one conversation: every turn retrieves different chunks and sends the whole history again
+    rng = random.Random(seed)
+    pool = [" ".join(rng.choice(["vector", "index", "검색", "문서", "page", "search", "token"]) for _ in range(80)) + "." for _ in range(50)]
+    history = []
+    prompt_tokens, cached_tokens = 0, 0
+    for turn in range(n_turns):
+        question = f"question {turn}: " + " ".join(rng.choice(["how", "what", "why", "요약", "설명"]) for _ in range(12)) + "?"
+        docs = [schemas.RetrieveDocument(id=str(i), doc_id=1, page_number=1, chunk_content=chunk) for i, chunk in enumerate(rng.sample(pool, n_chunks))]
+        messages, _ = builder.build(question, docs, history[::-1])
+        completion = client.chat.completions.create(model=model, messages=messages)
+        usage = completion.usage
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+        if turn > 0:
+            # the first turn has nothing to reuse
+            prompt_tokens += usage.prompt_tokens
+            cached_tokens += cached
+        history.append(schemas.ChatMessage(user=question, assistant=completion.choices[0].message.content))
+    return prompt_tokens, cached_tokens
+
+def main(args):
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(PrefixCache()))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    client = OpenAI(base_url=base_url, api_key=args.api_key, max_retries=0)
+    counter = TokenCounter(args.model, args.tokenizer)
+    print(f"base_url={base_url}, turns={args.turns}, chunks={args.chunks}, conversations={args.conversations}")
+    print("layout | prompt tokens (turns 2..n) | cached tokens | prefix reuse")
+    for layout in ["legacy", "prefix_cache"]:
+        builder = PromptBuilder(counter, max_prompt_tokens=args.max_prompt_tokens, layout=layout)
+        totals = [0, 0]
+        for conversation in range(args.conversations):
+            prompt_tokens, cached_tokens = simulate(client, args.model, builder, args.turns, args.chunks, seed=conversation)
+            totals[0] += prompt_tokens
+            totals[1] += cached_tokens
+        print(f"{layout} | {totals[0]} | {totals[1]} | {totals[1] / max(1, totals[0]):.1%}")
+    if server is not None:
+        server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure prompt-prefix reuse across chat turns for each prompt layout")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint reporting usage.prompt_tokens_details.cached_tokens (default: local stand-in)")
+    parser.add_argument("--api-key", default="token-abc123")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--tokenizer", default=None, help="HuggingFace tokenizer path for budget counting (default: tiktoken)")
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--max-prompt-tokens", type=int, default=6000)
+    main(parser.parse_args())
@@ -0,0 +1,241 @@
+# Generated from shared/llm_scheduler.py by shared/sync.py: edit the source and run `python shared/sync.py`, not this copy.
+import os
+import time
+import random
+import asyncio
+import heapq
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+import openai
+from dotenv import load_dotenv
+load_dotenv()
+
+# lower value = served first
+PRIORITY_CLASSES = {"interactive": 0, "ingestion": 1}
+RETRYABLE_STATUS_CODES = [408, 409, 429, 500, 502, 503, 504]
+
+def estimate_tokens(messages: list[dict], max_tokens: int = 0, n: int = 1, tokens_per_image: int = 1000):
+    # rough budget (~4 characters per token) used for rate limiting only
+    n_chars, n_images = 0, 0
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            n_chars += len(content)
+        else:
+            for part in content:
+                if part.get("type") == "text":
+                    n_chars += len(part.get("text", ""))
+                else:
+                    n_images += 1
+    return n_chars // 4 + n_images * tokens_per_image + max_tokens * n
+
+def get_retry_after(e: Exception):
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(headers["retry-after"]).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+def is_retryable(e: Exception):
+    if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return getattr(e, "status_code", None) in RETRYABLE_STATUS_CODES
+
+class TokenBucket():
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0):
+        # seconds until `amount` can be taken while leaving `reserve` in the bucket
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity * (1 - reserve))
+        missing = amount + self.capacity * reserve - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+class LLMScheduler():
+    """
+    Admission control for LLM calls: request/token buckets, strict priority between classes,
+    exponential backoff with jitter that honours Retry-After, and per-class queue metrics.
+
+    Services run in separate processes, so interactive traffic is also announced through
+    `signal_path` (a file touched on every interactive call); while it is fresh, ingestion
+    calls leave `interactive_reserve` of each bucket free for chat.
+    """
+    def __init__(
+            self, requests_per_minute=0, tokens_per_minute=0, max_retries=5, base_delay=1.0, max_delay=60.0,
+            signal_path=None, signal_window=10.0, interactive_reserve=0.5,
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.signal_path = signal_path
+        self.signal_window = signal_window
+        self.interactive_reserve = interactive_reserve
+        self.signal_checked_at = 0.0
+        self.signal_active = False
+        self.blocked_until = 0.0
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.metrics = {
+            name: {"queue_depth": 0, "requests": 0, "retries": 0, "rate_limited": 0, "errors": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+            for name in PRIORITY_CLASSES
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0)),
+            tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", 0)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", 5)),
+            base_delay=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 1.0)),
+            max_delay=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 60.0)),
+            signal_path=os.getenv("LLM_SCHEDULER_SIGNAL_PATH"),
+            interactive_reserve=float(os.getenv("LLM_INTERACTIVE_RESERVE", 0.5)),
+        )
+
+    def mark_interactive(self):
+        if self.signal_path is None:
+            return
+        try:
+            with open(self.signal_path, "a"):
+                os.utime(self.signal_path)
+        except OSError as e:
+            print(f"ERROR in LLMScheduler.mark_interactive -> msg={e}")
+
+    def interactive_active(self, now: float):
+        if self.signal_path is None:
+            return False
+        # stat at most twice per second
+        if now - self.signal_checked_at > 0.5:
+            self.signal_checked_at = now
+            try:
+                self.signal_active = (time.time() - os.stat(self.signal_path).st_mtime) < self.signal_window
+            except OSError:
+                self.signal_active = False
+        return self.signal_active
+
+    def acquire(self, priority_class: str = "ingestion", n_tokens: int = 1):
+        if priority_class == "interactive":
+            self.mark_interactive()
+        metrics = self.metrics[priority_class]
+        started_at = time.monotonic()
+        with self.cond:
+            ticket = (PRIORITY_CLASSES[priority_class], next(self.sequence))
+            heapq.heappush(self.waiting, ticket)
+            metrics["queue_depth"] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.waiting[0] != ticket:
+                        self.cond.wait(timeout=1.0)
+                        continue
+                    self.request_bucket.refill(now)
+                    self.token_bucket.refill(now)
+                    reserve = self.interactive_reserve if (priority_class != "interactive") and self.interactive_active(now) else 0.0
+                    wait = max(
+                        self.request_bucket.wait_time(1, reserve),
+                        self.token_bucket.wait_time(n_tokens, reserve),
+                        self.blocked_until - now,
+                    )
+                    if wait <= 0:
+                        self.request_bucket.consume(1)
+                        self.token_bucket.consume(n_tokens)
+                        break
+                    self.cond.wait(timeout=min(wait, 1.0))
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                metrics["queue_depth"] -= 1
+                self.cond.notify_all()
+        waited = time.monotonic() - started_at
+        metrics["requests"] += 1
+        metrics["wait_seconds_total"] += waited
+        metrics["wait_seconds_max"] = max(metrics["wait_seconds_max"], waited)
+        return waited
+
+    def get_backoff(self, e: Exception, attempt: int, priority_class: str):
+        delay = get_retry_after(e)
+        if delay is None:
+            # full jitter
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if getattr(e, "status_code", None) == 429:
+            self.metrics[priority_class]["rate_limited"] += 1
+            # the endpoint is saturated: hold every class back, not only this caller
+            with self.cond:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                self.cond.notify_all()
+        return delay
+
+    def call(self, fn, priority_class: str = "ingestion", n_tokens: int = 1, max_retries: int | None = None):
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self.acquire(priority_class, n_tokens)
+            try:
+                return fn()
+            except Exception as e:
+                if (attempt >= max_retries) or (not is_retryable(e)):
+                    self.metrics[priority_class]["errors"] += 1
+                    raise
+                delay = self.get_backoff(e, attempt, priority_class)
+                attempt += 1
+                self.metrics[priority_class]["retries"] += 1
+                print(f"LLMScheduler / retry in {delay:.1f}s (class={priority_class}, attempt={attempt}, msg={e})")
+                time.sleep(delay)
+
+    async def acall(self, fn, priority_class: str = "interactive", n_tokens: int = 1, max_retries: int | None = None):
+        # fn returns an awaitable (e.g. AsyncOpenAI call)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await asyncio.to_thread(self.acquire, priority_class, n_tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                if (attempt >= max_retries) or (not is_retryable(e)):
+                    self.metrics[priority_class]["errors"] += 1
+                    raise
+                delay = self.get_backoff(e, attempt, priority_class)
+                attempt += 1
+                self.metrics[priority_class]["retries"] += 1
+                print(f"LLMScheduler / retry in {delay:.1f}s (class={priority_class}, attempt={attempt}, msg={e})")
+                await asyncio.sleep(delay)
+
+    def stats(self):
+        stats = {}
+        for name, metrics in self.metrics.items():
+            stats[name] = {
+                **metrics,
+                "wait_seconds_avg": (metrics["wait_seconds_total"] / metrics["requests"]) if metrics["requests"] else 0.0,
+            }
+        return stats
+
+scheduler = LLMScheduler.from_env()
@@ -1,18 +1,41 @@
 import os
+import json
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-import auth, schemas, database, prompts
-from openai import OpenAI
+from fastapi.responses import StreamingResponse, Response, JSONResponse
+from sqlalchemy import select, delete, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+import auth, schemas, database
+from spool import spool_upload, remove_spooled_file
+from openai import AsyncOpenAI
+from llm_scheduler import scheduler, estimate_tokens
+from prompt_builder import PromptBuilder
+import metrics
+import tracing
+from components import registry
 from typing import List
 import httpx
 from dotenv import load_dotenv
 load_dotenv()
 
+tracing.setup_tracing("backend")
+
+# tokenizers are loaded (and BPE files fetched) by the lifespan, not at import time
+registry.register("prompt_builder", PromptBuilder.from_env, warmup=lambda builder: builder.counter.count("warm-up"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.start_sampler()
+    registry.start()
+    yield
+    await registry.stop()
+
 # Create FastAPI App
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[os.getenv('FRONTEND_URL')],
@@ -21,9 +44,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Queue depth gauges, evaluated when /metrics is scraped
+for priority_class in ["interactive", "ingestion"]:
+    metrics.register_queue(f"llm_{priority_class}", lambda priority_class=priority_class: scheduler.metrics[priority_class]["queue_depth"])
+
 # Create LLM API Client
 if os.getenv("GEN_MODEL_TYPE") == "openai":
-    llm_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    llm_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
     sampling_params = {
         "max_tokens": 512,
         "temperature": 0.5,
@@ -31,7 +58,7 @@ if os.getenv("GEN_MODEL_TYPE") == "openai":
         "frequency_penalty": 0.5,
     }
 else:
-    llm_client = OpenAI(api_key=os.getenv("LLM_API_KEY"), base_url=os.getenv("LLM_MODEL_URL"))
+    llm_client = AsyncOpenAI(api_key=os.getenv("LLM_API_KEY"), base_url=os.getenv("LLM_MODEL_URL"), max_retries=0)
     sampling_params = {
         "max_tokens": 512,
         "temperature": 0.5,
@@ -43,39 +70,64 @@ else:
 @app.post("/api/auth/signup")
 async def signup(
     form_data: schemas.RequestSignup,
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     # check if user already exists
-    user = db.query(database.Users).filter(database.Users.username == form_data.username).first()
+    user = (await db.execute(
+        select(database.Users).where(database.Users.username == form_data.username)
+    )).scalars().first()
     if user:
         raise HTTPException(status_code=400, detail="Email already registered")
     # create new user
     user = database.Users(
         username=form_data.username.strip(),
-        hashed_password=auth.get_hashed_password(form_data.password.strip()),
+        hashed_password=await auth.aget_hashed_password(form_data.password.strip()),
     )
     try:
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
     return {"message": "Registration successful"}
 
 @app.post("/api/auth/login")
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     # check if user exists
-    user = db.query(database.Users).filter(database.Users.username == form_data.username).first()
-    if (not user) or not (auth.verify_password(form_data.password, user.hashed_password)):
+    user = (await db.execute(
+        select(database.Users).where(database.Users.username == form_data.username)
+    )).scalars().first()
+    if (not user) or not (await auth.averify_password(form_data.password, user.hashed_password)):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password", headers={"WWW-Authenticate": "Bearer"})
     # create access token
     access_token = auth.create_access_token({"username": user.username})
     return {"message": "Login successful", "access_token": access_token, "token_type": "bearer"}
 
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    return JSONResponse(status_code=200 if registry.is_ready() else 503, content=registry.status())
+
+@app.get("/api/system/db-pool")
+async def db_pool_status():
+    return database.get_pool_status()
+
+@app.get("/api/system/llm-scheduler")
+async def llm_scheduler_status():
+    return scheduler.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    content, content_type = metrics.render_metrics()
+    return Response(content=content, media_type=content_type)
+
 @app.get("/api/auth/me")
 async def read_me(
     current_user: database.Users = Depends(auth.get_current_user)
@@ -85,70 +137,216 @@ async def read_me(
         **{col: getattr(current_user, col) for col in ["id", "username", "is_active", "created_at"]}
     }
 
-async def api_retrieval(form_data: schemas.RequestQuery, num_history_msgs: int):
+async def api_retrieval(form_data: schemas.RequestQuery, num_history_msgs: int, context=None):
+    started_at = time.perf_counter()
+    with tracing.tracer.start_as_current_span("api_retrieval", context=context) as span:
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{os.getenv('DOCUMENT_MANAGER_URL')}/api/document-manager/retrieval",
+                    json={
+                        "chat_id": form_data.chat_id,
+                        "messages": 
+                        [
+                            {
+                                "user": msg.user,
+                                "assistant": msg.assistant,
+                                "doc_ids": msg.doc_ids,
+                                "chunk_ids": msg.chunk_ids,
+                            } for msg in form_data.messages[-(num_history_msgs + 1):]
+                        ]
+                    },
+                    headers=tracing.inject_headers(),
+                )
+                response.raise_for_status()
+                response = response.json()
+                output =  {
+                    "searched_docs": [schemas.RetrieveDocument(**doc) for doc in response["searched_docs"]],
+                    "retrieved_docs": [schemas.RetrieveDocument(**doc) for doc in response["retrieved_docs"]],
+                    "selection": response.get("selection"),
+                }
+                span.set_attribute("retrieval.searched_docs", len(output["searched_docs"]))
+                span.set_attribute("retrieval.retrieved_docs", len(output["retrieved_docs"]))
+                metrics.RETRIEVAL_SECONDS.labels("ok").observe(time.perf_counter() - started_at)
+                return output
+        except Exception as e:
+            print(f"Error in retrieval: {e}")
+            tracing.record_error(span, e)
+            metrics.RETRIEVAL_SECONDS.labels("error").observe(time.perf_counter() - started_at)
+            return {"searched_docs": [], "retrieved_docs": [], "selection": None}
+
+async def fn_measure_stream(completion, stream_format: str, started_at: float, context=None):
+    # passes the stream through, recording time to first token, generation speed and completion tokens
+    span, _ = tracing.start_span("llm.stream", context=context)
+    first_token_at, n_deltas, completion_tokens = None, 0, None
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{os.getenv('DOCUMENT_MANAGER_URL')}/api/document-manager/retrieval",
-                json={
-                    "chat_id": form_data.chat_id,
-                    "messages": 
-                    [
-                        {
-                            "user": msg.user,
-                            "assistant": msg.assistant,
-                            "doc_ids": msg.doc_ids,
-                            "chunk_ids": msg.chunk_ids,
-                        } for msg in form_data.messages[-(num_history_msgs + 1):]
-                    ]
-                },
-            )
-            response.raise_for_status()
-            response = response.json()
-            output =  {
-                "searched_docs": [schemas.RetrieveDocument(**doc) for doc in response["searched_docs"]],
-                "retrieved_docs": [schemas.RetrieveDocument(**doc) for doc in response["retrieved_docs"]]
-            }
-            return output
+        async for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    metrics.LLM_TTFT_SECONDS.labels(stream_format).observe(first_token_at - started_at)
+                    span.add_event("first_token")
+                n_deltas += 1
+            if getattr(chunk, "usage", None) is not None:
+                completion_tokens = chunk.usage.completion_tokens
+            yield chunk
     except Exception as e:
-        print(f"Error in retrieval: {e}")
-        return {"searched_docs": [], "retrieved_docs": []}
+        tracing.record_error(span, e)
+        raise
+    finally:
+        span.set_attribute("llm.completion_deltas", n_deltas)
+        span.end()
+    # without usage in the stream, one content delta is counted as one token
+    n_tokens = n_deltas if completion_tokens is None else completion_tokens
+    metrics.LLM_COMPLETION_TOKENS.labels(stream_format).inc(n_tokens)
+    if (first_token_at is not None) and (n_tokens > 1):
+        elapsed = time.perf_counter() - first_token_at
+        if elapsed > 0:
+            metrics.LLM_TOKENS_PER_SECOND.labels(stream_format).observe((n_tokens - 1) / elapsed)
+    metrics.log_sampled("stream_chat", format=stream_format, completion_tokens=n_tokens, seconds=round(time.perf_counter() - started_at, 3))
 
-def fn_create_prompt(user_input: str, retrieve_docs: list[schemas.RetrieveDocument]) -> str:
-    context = "\n".join([f"<content={i+1}>\n{doc.chunk_content}\n<content={i+1}>" for i, doc in enumerate(retrieve_docs)])
-    question = user_input
-    return prompts.RAG["user"].format(context=context, question=question)
+async def fn_open_completion(history_messages: List[schemas.ChatMessage], num_history_msgs: int, retrieved_docs: list[schemas.RetrieveDocument], stream_format: str = "legacy", context=None, **kwargs):
+    # reverse history messages
+    history_messages = history_messages[::-1]
+    current_message = history_messages[0]
+    # question, then retrieved chunks, then newest history turns, within PROMPT_MAX_TOKENS
+    with tracing.tracer.start_as_current_span("build_prompt", context=context) as span:
+        formatted_messages, breakdown = registry.get("prompt_builder").build(current_message.user, retrieved_docs, history_messages[1:][:num_history_msgs])
+        span.set_attributes({f"prompt.{key}": value for key, value in breakdown.items()})
+    metrics.PROMPT_TOKENS.labels(breakdown["layout"]).observe(breakdown["total"])
+    metrics.log_sampled("prompt", **breakdown)
+
+    # chat is interactive: it is served ahead of queued ingestion calls
+    started_at = time.perf_counter()
+    with tracing.tracer.start_as_current_span("llm.open", context=context):
+        completion = await scheduler.acall(
+            lambda: llm_client.chat.completions.create(
+                model=os.getenv("GEN_MODEL_ID"),
+                messages=formatted_messages,
+                **sampling_params,
+                stream=True,
+                **kwargs,
+            ),
+            priority_class="interactive",
+            n_tokens=estimate_tokens(formatted_messages, max_tokens=sampling_params["max_tokens"]),
+        )
+    return fn_measure_stream(completion, stream_format, started_at, context), breakdown
+
+def fn_sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+KEEPALIVE = object()
+
+async def fn_with_keepalive(awaitable, interval: float):
+    # yields KEEPALIVE every `interval` seconds until the awaitable finishes, then its result
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=interval)
+            if done:
+                yield task.result()
+                return
+            yield KEEPALIVE
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def fn_stream_events(form_data: schemas.RequestQuery, num_history_msgs: int, keepalive_interval: float):
+    """
+    SSE protocol (stream_format="sse"):
+        sources  {"doc_ids", "chunk_ids", "documents"}   as soon as retrieval returns, before generation
+        token    {"content"}                             per generated delta
+        usage    {"prompt_tokens", "completion_tokens", "total_tokens", "prompt"}
+        error    {"message"}                             generation failed, the stream still ends with done
+        done     {}
+    ": keepalive" comments are sent while waiting for retrieval, admission and tokens.
+    """
+    span, context = tracing.start_span("stream_chat", **{"chat.stream_format": "sse", "chat.messages": len(form_data.messages)})
+    try:
+        retrieval_result = None
+        async for result in fn_with_keepalive(api_retrieval(form_data, num_history_msgs, context), keepalive_interval):
+            if result is KEEPALIVE:
+                yield ": keepalive\n\n"
+            else:
+                retrieval_result = result
+        searched_docs = retrieval_result["searched_docs"]
+        yield fn_sse_event("sources", {
+            "doc_ids": list(dict.fromkeys(doc.doc_id for doc in searched_docs)),
+            "chunk_ids": [doc.id for doc in searched_docs],
+            "documents": [{"id": doc.id, "doc_id": doc.doc_id, "page_number": doc.page_number, "score": doc.score} for doc in searched_docs],
+        })
+
+        opened = None
+        async for result in fn_with_keepalive(
+            fn_open_completion(form_data.messages, num_history_msgs, retrieval_result["retrieved_docs"], stream_format="sse", context=context, stream_options={"include_usage": True}),
+            keepalive_interval,
+        ):
+            if result is KEEPALIVE:
+                yield ": keepalive\n\n"
+            else:
+                opened = result
+        completion, breakdown = opened
+
+        iterator = completion.__aiter__()
+        while True:
+            chunk = None
+            async for result in fn_with_keepalive(anext(iterator, None), keepalive_interval):
+                if result is KEEPALIVE:
+                    yield ": keepalive\n\n"
+                else:
+                    chunk = result
+            if chunk is None:
+                break
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield fn_sse_event("token", {"content": chunk.choices[0].delta.content})
+            if chunk.usage is not None:
+                yield fn_sse_event("usage", {
+                    "prompt_tokens": chunk.usage.prompt_tokens,
+                    "completion_tokens": chunk.usage.completion_tokens,
+                    "total_tokens": chunk.usage.total_tokens,
+                    "prompt": breakdown,
+                })
+        metrics.CHAT_REQUESTS.labels("sse", "ok").inc()
+    except Exception as e:
+        print(f"ERROR in fn_stream_events -> msg={e}")
+        metrics.CHAT_REQUESTS.labels("sse", "error").inc()
+        tracing.record_error(span, e)
+        yield fn_sse_event("error", {"message": str(e)})
+    finally:
+        span.end()
+    yield fn_sse_event("done", {})
 
 @app.post("/api/ai-search/stream-chat")
 async def stream_chat(
     form_data: schemas.RequestQuery,
 ):
-    retrieval_result = await api_retrieval(form_data, int(os.getenv("NUM_HISTORY_MSGS")))
+    num_history_msgs = int(os.getenv("NUM_HISTORY_MSGS"))
+    stream_format = form_data.stream_format or os.getenv("CHAT_STREAM_FORMAT", "legacy")
+    if stream_format == "sse":
+        return StreamingResponse(
+            fn_stream_events(form_data, num_history_msgs, float(os.getenv("CHAT_KEEPALIVE_INTERVAL", 10))),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    # legacy: raw text followed by "|doc_ids=...</s>chunk_ids=..." (parsed by the current frontend)
+    span, context = tracing.start_span("stream_chat", **{"chat.stream_format": "legacy", "chat.messages": len(form_data.messages)})
+    retrieval_result = await api_retrieval(form_data, num_history_msgs, context)
 
     async def stream_response(history_messages: List[schemas.ChatMessage], num_history_msgs: int, searched_docs: list[schemas.RetrieveDocument], retrieved_docs: list[schemas.RetrieveDocument]):
-        # reverse history messages
-        formatted_messages = []
-        history_messages = history_messages[::-1]
-        current_message = history_messages[0]
-        formatted_messages.append({"role": "user", "content": fn_create_prompt(current_message.user, retrieved_docs)})
-        # append history messages
-        if len(history_messages) > 1:
-            history_messages = history_messages[1:][:num_history_msgs]
-            for msg in history_messages:
-                formatted_messages.append({"role": "assistant", "content": msg.assistant if msg.assistant else ""})
-                formatted_messages.append({"role": "user", "content": msg.user if msg.user else ""})
-        history_messages = history_messages[::-1]
-
-        completion = llm_client.chat.completions.create(
-            model=os.getenv("GEN_MODEL_ID"),
-            messages=formatted_messages,
-            **sampling_params,
-            stream=True,
-        )
-        for chunk in completion:
-            data = chunk.choices[0].delta.content
-            if data:
-                yield data.encode('utf-8')
+        try:
+            completion, _ = await fn_open_completion(history_messages, num_history_msgs, retrieved_docs, context=context)
+            async for chunk in completion:
+                data = chunk.choices[0].delta.content if chunk.choices else None
+                if data:
+                    yield data.encode('utf-8')
+        except Exception as e:
+            metrics.CHAT_REQUESTS.labels("legacy", "error").inc()
+            tracing.record_error(span, e)
+            raise
+        finally:
+            span.end()
+        metrics.CHAT_REQUESTS.labels("legacy", "ok").inc()
         
         # 검색된 문서가 없는 경우 빈 문자열 반환
         if not searched_docs:
@@ -159,7 +357,7 @@ async def stream_chat(
             yield f"|doc_ids={doc_ids}</s>chunk_ids={chunk_ids}"
     try:
         return StreamingResponse(
-            stream_response(form_data.messages, int(os.getenv("NUM_HISTORY_MSGS")), retrieval_result["searched_docs"], retrieval_result["retrieved_docs"]),
+            stream_response(form_data.messages, num_history_msgs, retrieval_result["searched_docs"], retrieval_result["retrieved_docs"]),
             media_type='text/event-stream'
         )
     except Exception as e:
@@ -169,7 +367,7 @@ async def stream_chat(
 async def save_chat(
     form_data: schemas.RequestSaveChat, 
     current_user: database.Users = Depends(auth.get_current_user), 
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     try:
         new_chat = database.Chats(
@@ -177,8 +375,8 @@ async def save_chat(
             title=form_data.title
         )
         db.add(new_chat)
-        db.commit()
-        db.refresh(new_chat)
+        await db.commit()
+        await db.refresh(new_chat)
         
         # 채팅 메시지들 저장
         if form_data.messages:
@@ -194,7 +392,7 @@ async def save_chat(
             ]
             
             db.add_all(chat_messages)
-            db.commit()
+            await db.commit()
 
         return {
             "message": "Chat saved successfully",   
@@ -202,18 +400,20 @@ async def save_chat(
             "created_at": new_chat.created_at,
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/ai-search/load-chat")
 async def load_chat(
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     # 사용자의 모든 채팅 조회
-    chats = db.query(database.Chats).filter(
-        database.Chats.username == current_user.username
-    ).order_by(database.Chats.created_at.desc()).all()
+    chats = (await db.execute(
+        select(database.Chats).where(
+            database.Chats.username == current_user.username
+        ).order_by(database.Chats.created_at.desc())
+    )).scalars().all()
     
     if not chats:
         return []
@@ -222,9 +422,11 @@ async def load_chat(
     chat_ids = [chat.id for chat in chats]
     
     # 모든 채팅의 메시지들 조회
-    messages = db.query(database.ChatMessages).filter(
-        database.ChatMessages.chat_id.in_(chat_ids)
-    ).order_by(database.ChatMessages.created_at).all()
+    messages = (await db.execute(
+        select(database.ChatMessages).where(
+            database.ChatMessages.chat_id.in_(chat_ids)
+        ).order_by(database.ChatMessages.created_at)
+    )).scalars().all()
     
     # 채팅 ID별로 메시지 그룹화
     messages_by_chat = {}
@@ -250,64 +452,72 @@ async def load_chat(
 async def update_chat_title(
     form_data: schemas.RequestUpdateChat,
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     try:
-        chat = db.query(database.Chats).filter(
-            database.Chats.id == form_data.chat_id,
-            database.Chats.username == current_user.username
-        ).first()
+        chat = (await db.execute(
+            select(database.Chats).where(
+                database.Chats.id == form_data.chat_id,
+                database.Chats.username == current_user.username
+            )
+        )).scalars().first()
         
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
         
         chat.title = form_data.title
-        db.commit()
+        await db.commit()
         
         return {"message": "Chat title updated successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ai-search/delete-chat")
 async def delete_chat(
     form_data: schemas.RequestDeleteChat,
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     try:
         # 채팅 메시지 먼저 삭제
-        db.query(database.ChatMessages).filter(
-            database.ChatMessages.chat_id == form_data.chat_id
-        ).delete()
+        await db.execute(
+            delete(database.ChatMessages).where(
+                database.ChatMessages.chat_id == form_data.chat_id
+            )
+        )
 
         # 채팅 삭제
-        result = db.query(database.Chats).filter(
-            database.Chats.id == form_data.chat_id,
-            database.Chats.username == current_user.username
-        ).delete()
+        result = (await db.execute(
+            delete(database.Chats).where(
+                database.Chats.id == form_data.chat_id,
+                database.Chats.username == current_user.username
+            )
+        )).rowcount
         
         if not result:
             raise HTTPException(status_code=404, detail="Chat not found")
         
-        db.commit()
+        await db.commit()
         return {"message": "Chat deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ai-search/save-message")
 async def save_message(
     form_data: schemas.RequestSaveMessage,
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     try:
         # 채팅이 현재 사용자의 것인지 확인
-        chat = db.query(database.Chats).filter(
-            database.Chats.id == form_data.chat_id,
-            database.Chats.username == current_user.username
-        ).first()
+        chat = (await db.execute(
+            select(database.Chats).where(
+                database.Chats.id == form_data.chat_id,
+                database.Chats.username == current_user.username
+            )
+        )).scalars().first()
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
         # 메시지 저장
@@ -319,86 +529,113 @@ async def save_message(
             chunk_ids=form_data.chunk_ids,
         )
         db.add(chat_message)
-        db.commit()
+        await db.commit()
         return {"message": "Message saved successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ai-search/delete-all-chats")
 async def delete_all_chats(
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     try:
         # 사용자의 모든 채팅 ID 조회
-        chat_ids = [chat.id for chat in db.query(database.Chats.id).filter(
-            database.Chats.username == current_user.username
-        ).all()]
+        chat_ids = (await db.execute(
+            select(database.Chats.id).where(
+                database.Chats.username == current_user.username
+            )
+        )).scalars().all()
         
         # 모든 채팅 메시지 삭제
-        db.query(database.ChatMessages).filter(
-            database.ChatMessages.chat_id.in_(chat_ids)
-        ).delete(synchronize_session=False)
+        await db.execute(
+            delete(database.ChatMessages).where(
+                database.ChatMessages.chat_id.in_(chat_ids)
+            ).execution_options(synchronize_session=False)
+        )
         
         # 모든 채팅 삭제
-        db.query(database.Chats).filter(
-            database.Chats.username == current_user.username
-        ).delete()
+        await db.execute(
+            delete(database.Chats).where(
+                database.Chats.username == current_user.username
+            )
+        )
         
-        db.commit()
+        await db.commit()
         return {"message": "All chats deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-async def api_process_document(file_content: bytes, filename: str, doc_id: int, extension: str, proc_type: str):
+async def fn_mark_failed(doc_id: int):
+    # document-manager could not report the outcome (unreachable, restarted mid-job): persist the failed state (-1)
+    try:
+        async with database.async_rdb_session() as db:
+            await db.execute(
+                update(database.Documents).where(database.Documents.id == doc_id, database.Documents.progress < 100).values(progress=-1)
+            )
+            await db.commit()
+    except Exception as e:
+        print(f"Error in mark failed: {e}")
+
+async def api_process_document(file_path: str, content_hash: str, doc_id: int, extension: str, proc_type: str):
+    span, context = tracing.start_span("api_process_document", doc_id=doc_id, extension=extension, proc_type=proc_type)
     try:
         async with httpx.AsyncClient() as client:
+            # document-manager opens the spooled file directly, no re-upload of the bytes
             response = await client.post(
-                f"{os.getenv('DOCUMENT_MANAGER_URL')}/api/document-manager/process-document",
-                files={'file': (filename, file_content, 'application/octet-stream')},
-                data={'doc_id': doc_id, 'extension': extension, 'proc_type': proc_type},
+                f"{os.getenv('DOCUMENT_MANAGER_URL')}/api/document-manager/process-document-ref",
+                json={'file_path': file_path, 'content_hash': content_hash, 'doc_id': doc_id, 'extension': extension, 'proc_type': proc_type},
+                headers=tracing.inject_headers(context),
                 timeout=3600
             )
             response.raise_for_status()
     except Exception as e:
-        pass
+        print(f"Error in process document: {e}")
+        tracing.record_error(span, e)
+        await fn_mark_failed(doc_id)
+    finally:
+        span.end()
+        remove_spooled_file(file_path)
 
 @app.post("/api/ai-search/upload-document")
 async def upload_document(
     files: List[UploadFile] = File(...),
     proc_type: str = Form(...),
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB),
+    db: AsyncSession = Depends(database.GetAsyncRDB),
     background_tasks: BackgroundTasks = None,
 ):
+    spooled_files = []
     try:
-        uploaded_docs = []
-        
+        # 파일을 청크 단위로 spool 디렉토리에 저장 (해시 동시 계산)
         for file in files:
-            # DB 저장
-            extension = os.path.splitext(file.filename)[1].lower()[1:]
-            new_document = database.Documents(
+            spooled_files.append(await spool_upload(file))
+
+        # DB 저장 (단일 트랜잭션)
+        new_documents = [
+            database.Documents(
                 user_username=current_user.username,
                 title=file.filename,
-                extension=extension,
-                proc_type=proc_type
+                extension=os.path.splitext(file.filename)[1].lower()[1:],
+                proc_type=proc_type,
+                content_hash=spooled["content_hash"],
             )
-            db.add(new_document)
-            db.commit()
-            db.refresh(new_document)
+            for file, spooled in zip(files, spooled_files)
+        ]
+        db.add_all(new_documents)
+        await db.commit()
 
-            # 파일 내용 읽기
-            file_content = await file.read()
-            
+        uploaded_docs = []
+        for new_document, spooled in zip(new_documents, spooled_files):
             # 백그라운드 태스크 추가
             background_tasks.add_task(
                 api_process_document,
-                file_content,
-                file.filename,
+                spooled["file_path"],
+                spooled["content_hash"],
                 new_document.id,
-                extension,
+                new_document.extension,
                 proc_type
             )
 
@@ -415,19 +652,91 @@ async def upload_document(
         }
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        for spooled in spooled_files:
+            remove_spooled_file(spooled["file_path"])
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def api_replace_document(file_path: str, content_hash: str, doc_id: int, extension: str, proc_type: str):
+    span, context = tracing.start_span("api_replace_document", doc_id=doc_id, extension=extension, proc_type=proc_type)
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{os.getenv('DOCUMENT_MANAGER_URL')}/api/document-manager/replace-document-ref",
+                json={'file_path': file_path, 'content_hash': content_hash, 'doc_id': doc_id, 'extension': extension, 'proc_type': proc_type},
+                headers=tracing.inject_headers(context),
+                timeout=3600
+            )
+            response.raise_for_status()
+            print(f"replace document / doc_id={doc_id}, result={response.json()}")
+    except Exception as e:
+        print(f"Error in replace document: {e}")
+        tracing.record_error(span, e)
+        await fn_mark_failed(doc_id)
+    finally:
+        span.end()
+        remove_spooled_file(file_path)
+
+@app.post("/api/ai-search/replace-document")
+async def replace_document(
+    file: UploadFile = File(...),
+    doc_id: int = Form(...),
+    current_user: database.Users = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.GetAsyncRDB),
+    background_tasks: BackgroundTasks = None,
+):
+    spooled = None
+    try:
+        document = (await db.execute(
+            select(database.Documents).where(
+                database.Documents.id == doc_id,
+                database.Documents.user_username == current_user.username
+            )
+        )).scalars().first()
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        extension = os.path.splitext(file.filename)[1].lower()[1:]
+        if extension != document.extension:
+            raise HTTPException(status_code=400, detail=f"File extension does not match (expected={document.extension}, received={extension})")
+
+        spooled = await spool_upload(file)
+        if spooled["content_hash"] == document.content_hash:
+            remove_spooled_file(spooled["file_path"])
+            return {"message": "Document is unchanged", "doc_id": document.id}
+
+        document.title = file.filename
+        document.progress = 0
+        await db.commit()
+
+        # 변경된 페이지만 다시 처리 (document-manager)
+        background_tasks.add_task(
+            api_replace_document,
+            spooled["file_path"],
+            spooled["content_hash"],
+            document.id,
+            document.extension,
+            document.proc_type
+        )
+        return {"message": "Document replacement started", "doc_id": document.id}
+
+    except Exception as e:
+        await db.rollback()
+        if spooled is not None:
+            remove_spooled_file(spooled["file_path"])
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/ai-search/get-documents")
 async def get_documents(
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     try:
         # 사용자의 모든 문서 조회
-        documents = db.query(database.Documents).filter(
-            database.Documents.user_username == current_user.username
-        ).order_by(database.Documents.created_at.desc()).all()
+        documents = (await db.execute(
+            select(database.Documents).where(
+                database.Documents.user_username == current_user.username
+            ).order_by(database.Documents.created_at.desc())
+        )).scalars().all()
         
         # 문서 타입별로 그룹화
         grouped_docs = {
@@ -451,24 +760,123 @@ async def get_documents(
         print(f"Error in get_documents: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def api_document_progress(client: httpx.AsyncClient, doc_ids: list[int]):
+    response = await client.post(
+        f"{os.getenv('DOCUMENT_MANAGER_URL')}/api/document-manager/progress",
+        json={"doc_ids": doc_ids},
+    )
+    response.raise_for_status()
+    return response.json()["jobs"]
+
+@app.get("/api/ai-search/document-progress")
+async def stream_document_progress(
+    current_user: database.Users = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.GetAsyncRDB)
+):
+    # 진행 중인 문서만 한 번 조회 (이후 진행 상황은 document-manager 메모리에서 조회)
+    # 100 (done) and -1 (failed) are terminal
+    doc_ids = (await db.execute(
+        select(database.Documents.id).where(
+            database.Documents.user_username == current_user.username,
+            database.Documents.progress >= 0,
+            database.Documents.progress < 100
+        )
+    )).scalars().all()
+
+    async def fn_finished_documents(doc_ids: set[int]):
+        async with database.async_rdb_session() as db:
+            return (await db.execute(
+                select(database.Documents.id, database.Documents.progress).where(
+                    database.Documents.id.in_(doc_ids),
+                    or_(database.Documents.progress >= 100, database.Documents.progress < 0)
+                )
+            )).all()
+
+    async def event_stream(doc_ids: set[int], interval: float, timeout: float, recheck_interval: float):
+        last_events = {}
+        started_at = time.monotonic()
+        checked_at = None
+        async with httpx.AsyncClient() as client:
+            while doc_ids and (time.monotonic() - started_at < timeout):
+                try:
+                    jobs = await api_document_progress(client, sorted(doc_ids))
+                except Exception as e:
+                    print(f"Error in document progress: {e}")
+                    jobs = []
+                for job in jobs:
+                    event = {k: v for k, v in job.items() if k != "updated_at"}
+                    if last_events.get(job["doc_id"]) != event:
+                        last_events[job["doc_id"]] = event
+                        yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+                    if job["stage"] in ["done", "failed"]:
+                        doc_ids.discard(job["doc_id"])
+                # not in the tracker: not started yet, or finished and evicted / lost in a restart -> the database tells
+                unknown = doc_ids - {job["doc_id"] for job in jobs}
+                if unknown and ((checked_at is None) or (time.monotonic() - checked_at >= recheck_interval)):
+                    checked_at = time.monotonic()
+                    try:
+                        finished = await fn_finished_documents(unknown)
+                    except Exception as e:
+                        print(f"Error in document progress: {e}")
+                        finished = []
+                    for doc_id, progress in finished:
+                        event = {"doc_id": doc_id, "stage": "done" if progress >= 100 else "failed", "progress": progress}
+                        yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+                        doc_ids.discard(doc_id)
+                if not jobs:
+                    yield ": keepalive\n\n"
+                await asyncio.sleep(interval)
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        event_stream(
+            set(doc_ids), float(os.getenv("PROGRESS_STREAM_INTERVAL", 1.0)), float(os.getenv("PROGRESS_STREAM_TIMEOUT", 3600)),
+            float(os.getenv("PROGRESS_STREAM_RECHECK_INTERVAL", 10.0)),
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def api_delete_document(doc_id: int):
+    with tracing.tracer.start_as_current_span("api_delete_document", attributes={"doc_id": doc_id}):
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{os.getenv('DOCUMENT_MANAGER_URL')}/api/document-manager/delete-document",
+                json={"doc_id": doc_id},
+                headers=tracing.inject_headers(),
+            )
+        response.raise_for_status()
+        return response.json()
+
 @app.post("/api/ai-search/delete-document/")
 async def delete_document(
     form_data: schemas.RequestDeleteDocument,
     current_user: database.Users = Depends(auth.get_current_user),
-    db: Session = Depends(database.GetRDB)
+    db: AsyncSession = Depends(database.GetAsyncRDB)
 ):
     try:
-        result = db.query(database.Documents).filter(
-            database.Documents.id == form_data.doc_id,
-            database.Documents.user_username == current_user.username
-        ).delete()
+        document = (await db.execute(
+            select(database.Documents.id).where(
+                database.Documents.id == form_data.doc_id,
+                database.Documents.user_username == current_user.username
+            )
+        )).first()
         
-        if not result:
+        if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        db.commit()
+        # 벡터 삭제 (다른 문서가 같은 청크를 참조 중이면 참조만 해제)
+        await api_delete_document(form_data.doc_id)
+
+        await db.execute(
+            delete(database.Documents).where(
+                database.Documents.id == form_data.doc_id,
+                database.Documents.user_username == current_user.username
+            )
+        )
+        await db.commit()
         return {"message": "Document deleted successfully"}
 
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
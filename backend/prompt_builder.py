@@ -0,0 +1,142 @@
+import os
+import re
+import tiktoken
+import schemas, prompts
+from dotenv import load_dotenv
+load_dotenv()
+
+SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s|\n")
+
+class TokenCounter():
+    # tokenizer of the generation model: tiktoken for OpenAI models, a HuggingFace tokenizer for self-hosted ones
+    def __init__(self, model_name: str | None = None, tokenizer_path: str | None = None):
+        if tokenizer_path:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+            self.encode = lambda text: tokenizer.encode(text, add_special_tokens=False)
+            self.decode = tokenizer.decode
+        else:
+            try:
+                encoding = tiktoken.encoding_for_model(model_name or "")
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            self.encode = lambda text: encoding.encode(text, disallowed_special=())
+            self.decode = encoding.decode
+
+    def count(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        # cut to max_tokens, then back to the last sentence (or line) end if one is in the second half
+        tokens = self.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        prefix = self.decode(tokens[:max(max_tokens, 0)])
+        ends = [m.start() for m in SENTENCE_END.finditer(prefix)]
+        if ends and ends[-1] >= len(prefix) // 2:
+            return prefix[:ends[-1] + 1].rstrip()
+        return prefix[:prefix.rfind(" ")].rstrip() if " " in prefix else prefix
+
+def format_context(chunks: list[str]) -> str:
+    return "\n".join([f"<content={i+1}>\n{chunk}\n<content={i+1}>" for i, chunk in enumerate(chunks)])
+
+class PromptBuilder():
+    """
+    Fills a prompt token budget in priority order: current question, then retrieved chunks (rank order),
+    then history turns (newest first). The last chunk that does not fit is truncated at a sentence boundary
+    when at least min_chunk_tokens remain; history turns are kept or dropped whole.
+
+    layout
+        legacy: [user(context + question), assistant, user, ...] with history newest first
+        prefix_cache: [system(instructions), user, assistant, ... (chronological), user(context + question)]
+            every turn extends the previous turn's prefix, so server-side prefix caching can reuse it
+    """
+    def __init__(self, counter: TokenCounter, max_prompt_tokens: int = 6000, message_overhead: int = 4, min_chunk_tokens: int = 64, layout: str = "legacy"):
+        if layout not in ["legacy", "prefix_cache"]:
+            raise ValueError(f"Invalid prompt layout (layout={layout})")
+        self.counter = counter
+        self.max_prompt_tokens = max_prompt_tokens
+        self.message_overhead = message_overhead
+        self.min_chunk_tokens = min_chunk_tokens
+        self.layout = layout
+        self.template = prompts.RAG if layout == "legacy" else prompts.RAG_CACHED
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            TokenCounter(os.getenv("GEN_MODEL_ID"), os.getenv("GEN_TOKENIZER_PATH")),
+            max_prompt_tokens=int(os.getenv("PROMPT_MAX_TOKENS", 6000)),
+            min_chunk_tokens=int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", 64)),
+            layout=os.getenv("PROMPT_LAYOUT", "legacy"),
+        )
+
+    def select_chunks(self, retrieved_docs: list[schemas.RetrieveDocument], budget: int):
+        chunks, used = [], 0
+        n_truncated = 0
+        for i, doc in enumerate(retrieved_docs):
+            # per-chunk cost includes its <content=i> wrapper
+            wrapper = self.counter.count(f"<content={i+1}>\n\n<content={i+1}>\n")
+            content_tokens = self.counter.count(doc.chunk_content)
+            if used + wrapper + content_tokens <= budget:
+                chunks.append(doc.chunk_content)
+                used += wrapper + content_tokens
+                continue
+            remaining = budget - used - wrapper
+            if remaining >= self.min_chunk_tokens:
+                chunks.append(self.counter.truncate(doc.chunk_content, remaining))
+                used += wrapper + self.counter.count(chunks[-1])
+                n_truncated += 1
+            break
+        return chunks, used, n_truncated
+
+    def build(self, question: str, retrieved_docs: list[schemas.RetrieveDocument], history_messages: list[schemas.ChatMessage]):
+        """
+        history_messages: previous turns, newest first.
+        Returns (messages, breakdown).
+        """
+        template_tokens = self.counter.count(self.template["user"].format(context="", question="")) + self.message_overhead
+        if self.template["system"].strip():
+            template_tokens += self.counter.count(self.template["system"].strip()) + self.message_overhead
+        question_tokens = self.counter.count(question)
+        budget = self.max_prompt_tokens - template_tokens - question_tokens
+
+        chunks, context_tokens, n_truncated = self.select_chunks(retrieved_docs, max(budget, 0))
+        budget -= context_tokens
+
+        history_turns, history_tokens = [], 0
+        for msg in history_messages:
+            turn_tokens = self.counter.count(msg.user or "") + self.counter.count(msg.assistant or "") + 2 * self.message_overhead
+            if turn_tokens > budget:
+                break
+            history_turns.append(msg)
+            history_tokens += turn_tokens
+            budget -= turn_tokens
+
+        user_prompt = self.template["user"].format(context=format_context(chunks), question=question)
+        if self.layout == "legacy":
+            messages = [{"role": "user", "content": user_prompt}]
+            for msg in history_turns:
+                messages.append({"role": "assistant", "content": msg.assistant if msg.assistant else ""})
+                messages.append({"role": "user", "content": msg.user if msg.user else ""})
+        else:
+            messages = [{"role": "system", "content": self.template["system"].strip()}]
+            for msg in history_turns[::-1]:
+                messages.append({"role": "user", "content": msg.user if msg.user else ""})
+                messages.append({"role": "assistant", "content": msg.assistant if msg.assistant else ""})
+            messages.append({"role": "user", "content": user_prompt.strip()})
+
+        breakdown = {
+            "layout": self.layout,
+            "budget": self.max_prompt_tokens,
+            "template": template_tokens,
+            "question": question_tokens,
+            "context": context_tokens,
+            "history": history_tokens,
+            "total": template_tokens + question_tokens + context_tokens + history_tokens,
+            "chunks_used": len(chunks),
+            "chunks_truncated": n_truncated,
+            "chunks_dropped": len(retrieved_docs) - len(chunks),
+            "history_turns_used": len(history_turns),
+            "history_turns_dropped": len(history_messages) - len(history_turns),
+        }
+        return messages, breakdown
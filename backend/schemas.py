@@ -21,6 +21,8 @@ class RequestSignup(BaseModel):
 class RequestQuery(BaseModel):
     chat_id: int
     messages: List[ChatMessage]
+    # "legacy" (text + |doc_ids=...) or "sse" (structured events), CHAT_STREAM_FORMAT when omitted
+    stream_format: str | None = None
 
 class RequestSaveChat(BaseModel):
     title: str
@@ -0,0 +1,39 @@
+import os
+import uuid
+import hashlib
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+load_dotenv()
+
+SPOOL_DIR = os.path.abspath(os.getenv("SPOOL_DIR", "./.spool/"))
+SPOOL_CHUNK_SIZE = int(os.getenv("SPOOL_CHUNK_SIZE", 1024 * 1024))
+
+async def spool_upload(file: UploadFile, spool_dir: str = SPOOL_DIR, chunk_size: int = SPOOL_CHUNK_SIZE):
+    # stream the upload to disk chunk by chunk, hashing on the fly
+    if not os.path.exists(spool_dir):
+        os.makedirs(spool_dir, exist_ok=True)
+    extension = os.path.splitext(file.filename)[1].lower()
+    file_path = os.path.join(spool_dir, f"{uuid.uuid4().hex}{extension}")
+    sha256 = hashlib.sha256()
+    file_size = 0
+    try:
+        with open(file_path, "wb") as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                file_size += len(chunk)
+                await run_in_threadpool(f.write, chunk)
+    except Exception:
+        remove_spooled_file(file_path)
+        raise
+    return {"file_path": file_path, "content_hash": sha256.hexdigest(), "file_size": file_size}
+
+def remove_spooled_file(file_path: str):
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except Exception as e:
+        print(f"Error in removing spooled file: {e}")
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pytest
+
+import auth
+from auth import UserCache, UserPrincipal
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth.time, "monotonic", clock)
+    return clock
+
+def user(username, is_active=True):
+    return UserPrincipal(1, username, is_active, datetime(2024, 1, 1))
+
+def test_entries_expire_after_ttl(clock):
+    cache = UserCache(ttl_seconds=60)
+    cache.set(user("alice"))
+    clock.now += 59
+    assert cache.get("alice") == user("alice")
+    clock.now += 2
+    assert cache.get("alice") is None
+    assert "alice" not in cache.container
+
+def test_set_refreshes_ttl(clock):
+    cache = UserCache(ttl_seconds=60)
+    cache.set(user("alice"))
+    clock.now += 50
+    cache.set(user("alice", is_active=False))
+    clock.now += 50
+    assert cache.get("alice").is_active is False
+
+def test_zero_ttl_disables_cache(clock):
+    cache = UserCache(ttl_seconds=0)
+    cache.set(user("alice"))
+    assert cache.get("alice") is None
+
+def test_least_recently_used_is_evicted(clock):
+    cache = UserCache(ttl_seconds=60, max_size=2)
+    cache.set(user("alice"))
+    cache.set(user("bob"))
+    # reading alice makes bob the least recently used entry
+    assert cache.get("alice") is not None
+    cache.set(user("carol"))
+    assert cache.get("bob") is None
+    assert cache.get("alice") is not None
+    assert cache.get("carol") is not None
+    assert len(cache.container) == 2
+
+def test_invalidate_and_clear(clock):
+    cache = UserCache(ttl_seconds=60)
+    cache.set(user("alice"))
+    cache.set(user("bob"))
+    cache.invalidate("alice")
+    cache.invalidate("unknown")
+    assert cache.get("alice") is None
+    assert cache.get("bob") is not None
+    cache.clear()
+    assert cache.get("bob") is None
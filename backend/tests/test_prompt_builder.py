@@ -0,0 +1,90 @@
+import pytest
+
+import schemas
+from prompt_builder import PromptBuilder, TokenCounter
+
+class CharCounter(TokenCounter):
+    # one token per character: budgets can be computed by hand (tiktoken downloads its encodings on first use)
+    def __init__(self):
+        self.encode = list
+        self.decode = "".join
+
+WRAPPER = len("<content=1>\n\n<content=1>\n")
+
+def doc(content, id="c1"):
+    return schemas.RetrieveDocument(id=id, doc_id=1, page_number=1, chunk_content=content)
+
+def turn(user, assistant):
+    return schemas.ChatMessage(user=user, assistant=assistant)
+
+@pytest.fixture
+def builder():
+    return PromptBuilder(CharCounter(), min_chunk_tokens=20)
+
+def test_truncate_keeps_short_text():
+    assert CharCounter().truncate("short text.", 100) == "short text."
+
+def test_truncate_at_sentence_end():
+    assert CharCounter().truncate("First sentence. Second sentence here.", 25) == "First sentence."
+
+def test_truncate_without_sentence_break_cuts_at_a_word():
+    assert CharCounter().truncate("alpha beta gamma delta", 13) == "alpha beta"
+    # no sentence end in the second half of the cut
+    assert CharCounter().truncate("Hi. alpha beta gamma delta", 21) == "Hi. alpha beta gamma"
+
+def test_truncate_without_any_break_cuts_hard():
+    assert CharCounter().truncate("a" * 50, 10) == "a" * 10
+
+def test_chunk_that_exactly_fits(builder):
+    content = "x" * 75
+    chunks, used, n_truncated = builder.select_chunks([doc(content)], WRAPPER + 75)
+    assert (chunks, used, n_truncated) == ([content], WRAPPER + 75, 0)
+
+def test_last_chunk_is_truncated(builder):
+    first, second = "y" * 50, "Sentence one. Sentence two is longer."
+    chunks, used, n_truncated = builder.select_chunks([doc(first), doc(second, id="c2")], 2 * WRAPPER + 50 + 25)
+    assert chunks == [first, "Sentence one."]
+    assert used == 2 * WRAPPER + 50 + len("Sentence one.")
+    assert n_truncated == 1
+
+def test_chunk_below_min_chunk_tokens_is_dropped(builder):
+    first, second = "y" * 50, "z" * 100
+    # 19 tokens left for the second chunk, min_chunk_tokens is 20
+    chunks, used, n_truncated = builder.select_chunks([doc(first), doc(second, id="c2")], 2 * WRAPPER + 50 + 19)
+    assert (chunks, used, n_truncated) == ([first], WRAPPER + 50, 0)
+
+def base_tokens(layout):
+    _, breakdown = PromptBuilder(CharCounter(), max_prompt_tokens=100000, layout=layout).build("question?", [doc("context")], [])
+    return breakdown["total"]
+
+def test_history_turns_are_dropped_whole():
+    newest, older, oldest = turn("q3", "a3"), turn("older question", "older answer"), turn("q1", "a1")
+    newest_tokens = 2 + 2 + 2 * 4
+    # room for the newest turn and part of the older one
+    builder = PromptBuilder(CharCounter(), max_prompt_tokens=base_tokens("legacy") + newest_tokens + 20)
+    messages, breakdown = builder.build("question?", [doc("context")], [newest, older, oldest])
+    assert breakdown["history"] == newest_tokens
+    assert (breakdown["history_turns_used"], breakdown["history_turns_dropped"]) == (1, 2)
+    # the small oldest turn would fit, but turns after a dropped one are not used
+    assert [m["content"] for m in messages[1:]] == ["a3", "q3"]
+    assert "older" not in str(messages)
+
+def test_prefix_cache_layout_order():
+    builder = PromptBuilder(CharCounter(), max_prompt_tokens=100000, layout="prefix_cache")
+    messages, breakdown = builder.build("question?", [doc("context")], [turn("q2", "a2"), turn("q1", "a1")])
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user", "assistant", "user"]
+    # history is chronological, the retrieved context comes last so earlier turns keep a stable prefix
+    assert [m["content"] for m in messages[1:5]] == ["q1", "a1", "q2", "a2"]
+    assert "context" in messages[-1]["content"] and messages[-1]["content"].endswith("question?")
+    assert "context" not in messages[0]["content"]
+    assert breakdown["layout"] == "prefix_cache"
+
+def test_legacy_layout_order():
+    builder = PromptBuilder(CharCounter(), max_prompt_tokens=100000)
+    messages, _ = builder.build("question?", [doc("context")], [turn("q2", "a2"), turn("q1", "a1")])
+    assert [m["content"] for m in messages[1:]] == ["a2", "q2", "a1", "q1"]
+    assert "context" in messages[0]["content"]
+
+def test_invalid_layout():
+    with pytest.raises(ValueError):
+        PromptBuilder(CharCounter(), layout="chronological")
@@ -0,0 +1,103 @@
+import time
+import argparse
+import pdfplumber
+import pandas as pd
+from parser import ParserPDF
+
+def get_page_data_legacy(parser, page):
+    # original pandas implementation of ParserPDF.get_page_data, kept as the reference for --verify and tests/fixtures
+    page_data = {"text": [], "table": []}
+    # create text data
+    for word in page.extract_words(keep_blank_chars=True):
+        page_data["text"].append({
+            "content": word["text"],
+            "coord": (word["x0"], word["top"], word["x1"], word["bottom"]),
+        })
+    # create table data
+    for table in page.find_tables():
+        data = parser.extract_table(page, table)
+        if len(data) >= 2:
+            tb = pd.DataFrame(data[1:], columns=data[0])
+            tb.columns = tb.columns.fillna("")
+            tb = tb.fillna("")
+            tb = tb.drop(tb.columns[tb.nunique() == 1], axis=1)
+            page_data["table"].append({
+                "content": tb.to_markdown(),
+                "coord": table.bbox,
+            })
+    # create dataframe
+    page_data = {k: pd.DataFrame(v) for k, v in page_data.items()}
+    # post-processing for text
+    if len(page_data["text"]) > 0:
+        page_data["text"] = page_data["text"].groupby(page_data["text"]["coord"].apply(lambda x: (x[1] + x[3] / 2)).astype("int"), sort=False, as_index=False).agg({"content": " ".join, "coord": "first"})
+    # post-processing for table
+    if len(page_data["table"]) > 0:
+        page_data["table"] = page_data["table"].groupby(page_data["table"]["coord"].apply(lambda x: (x[1] + x[3] / 2)).astype("int"), sort=False, as_index=False).agg({"content": " ".join, "coord": "first"})
+        page_data["table"]["content"] = page_data["table"]["content"].apply(lambda x: f"<표>\n{x}\n</표>")
+        for tb_coord in page_data["table"]["coord"]:
+            mask = page_data["text"]["coord"].apply(lambda x: not parser.is_overlap(x, tb_coord))
+            page_data["text"] = page_data["text"][mask].reset_index(drop=True)
+    df = pd.concat([pd.DataFrame(page_data["text"]), pd.DataFrame(page_data["table"])], axis=0).reset_index(drop=True)
+    df = df.iloc[df["coord"].apply(lambda x: x[1]).argsort()].reset_index(drop=True)
+    return "\n".join(df["content"])
+
+def bench(pdf_path, n_pages, n_workers, n_repeats):
+    parser = ParserPDF(n_workers=n_workers)
+    elapsed = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        page_container = parser.parse(pdf_path, max_pages=n_pages)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), len(page_container)
+
+def verify(pdf_path, max_pages):
+    # golden check: vectorized get_page_data against the original pandas implementation
+    parser = ParserPDF(n_workers=1)
+    n_checked, mismatches, elapsed = 0, [], {"legacy": 0.0, "vectorized": 0.0}
+    with pdfplumber.open(pdf_path) as doc:
+        for page_number, page in enumerate(doc.pages[:max_pages]):
+            start = time.perf_counter()
+            try:
+                expected = get_page_data_legacy(parser, page)
+            except Exception as e:
+                print(f"page={page_number + 1} skipped, legacy parser failed -> {e}")
+                continue
+            elapsed["legacy"] += time.perf_counter() - start
+            start = time.perf_counter()
+            output = parser.get_page_data(page)
+            elapsed["vectorized"] += time.perf_counter() - start
+            n_checked += 1
+            if output != expected:
+                mismatches.append(page_number + 1)
+    print(f"verified pages={n_checked}, mismatches={len(mismatches)} {mismatches[:20]}")
+    print(f"legacy={elapsed['legacy']:.2f}s, vectorized={elapsed['vectorized']:.2f}s")
+    return len(mismatches) == 0
+
+def main(args):
+    if args.verify:
+        raise SystemExit(0 if verify(args.pdf, max(int(x) for x in args.pages.split(","))) else 1)
+    workers = [int(x) for x in args.workers.split(",")]
+    page_counts = [int(x) for x in args.pages.split(",")]
+    # warm up the process pools so that worker start-up is not measured
+    for n_workers in workers:
+        if n_workers > 1:
+            ParserPDF(n_workers=n_workers).parse(args.pdf, max_pages=n_workers * 16)
+    print(f"pdf={args.pdf}")
+    print("pages | " + " | ".join(f"workers={n} (sec, speedup)" for n in workers))
+    for n_pages in page_counts:
+        baseline = None
+        cells = []
+        for n_workers in workers:
+            elapsed, n_parsed = bench(args.pdf, n_pages, n_workers, args.repeats)
+            baseline = elapsed if baseline is None else baseline
+            cells.append(f"{elapsed:.2f}s, x{baseline / elapsed:.2f}")
+        print(f"{n_parsed} | " + " | ".join(cells))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial vs parallel ParserPDF.parse")
+    parser.add_argument("--pdf", required=True)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--pages", default="10,50,100,250,500")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--verify", action="store_true", help="compare get_page_data with get_page_data_legacy page by page")
+    main(parser.parse_args())
@@ -0,0 +1,49 @@
+import time
+import random
+import argparse
+import pandas as pd
+from chunker import RuleBasedTextChunker
+
+WORDS = ["문서", "검색", "요약", "데이터", "모델", "page", "vector", "search", "index", "token", "분석", "결과"]
+
+def make_pages(n_pages, chars_per_page, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(n_pages):
+        sentences = []
+        while sum(len(x) for x in sentences) < chars_per_page:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 20))) + rng.choice([".", "?", "!", "다."])
+            sentences.append(sentence + ("\n" if rng.random() < 0.2 else " "))
+        pages.append("".join(sentences))
+    return pd.DataFrame({"page_number": range(1, n_pages + 1), "page_content": pages})
+
+def bench(chunker, page_container, n_repeats):
+    elapsed = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        chunk_generator = chunker.chunk(page_container)
+        total_chunks = next(chunk_generator)
+        chunks = list(chunk_generator)
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), total_chunks, chunks
+
+def main(args):
+    print(f"tokenizer={args.tokenizer}, chars_per_page={args.chars_per_page}")
+    print("pages | langchain (sec, chunks) | native (sec, chunks, speedup) | native chunks ending at a break")
+    for n_pages in [int(x) for x in args.pages.split(",")]:
+        page_container = make_pages(n_pages, args.chars_per_page)
+        cells = []
+        for backend in ["langchain", "native"]:
+            chunker = RuleBasedTextChunker(tokenizer_path=args.tokenizer, splitter_backend=backend)
+            cells.append(bench(chunker, page_container, args.repeats))
+        (langchain_sec, langchain_total, _), (native_sec, native_total, native_chunks) = cells
+        snapped = sum(chunk["chunk_content"][-1] in ".?!" for chunk in native_chunks) / max(1, len(native_chunks))
+        print(f"{n_pages} | {langchain_sec:.2f}s, {langchain_total} | {native_sec:.2f}s, {native_total}, x{langchain_sec / native_sec:.2f} | {snapped:.0%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the native multi-granularity splitter against RecursiveCharacterTextSplitter")
+    parser.add_argument("--tokenizer", default=None, help="HuggingFace tokenizer path (default: character windows)")
+    parser.add_argument("--pages", default="10,50,200")
+    parser.add_argument("--chars-per-page", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=1)
+    main(parser.parse_args())
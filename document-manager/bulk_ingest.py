@@ -0,0 +1,406 @@
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+load_dotenv()
+
+# heavy modules (models, parsers, database) are imported inside functions: worker processes are spawned and
+# must read the adjusted environment (see fn_init_worker) before llm_scheduler and the parsers are configured
+
+IMAGE_EXTENSIONS = ["pptx", "jpeg", "jpg", "png"]
+# created by fn_init_worker in every worker process
+worker_embedder = None
+
+class Checkpoint():
+    """
+    Append-only JSON lines, one entry per state change of a file (the last one wins):
+        {"path", "doc_id", "vector_doc_id", "chunk_set_id", "content_hash", "status": "created" | "done" | "failed", "error"}
+    Documents rows are created once (status "created"); an interrupted run reprocesses the same doc_id and
+    upserts the same deterministic chunk ids, so nothing is duplicated.
+    """
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.entries = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["path"]] = entry
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def status(self, path: str):
+        entry = self.entries.get(path)
+        return None if entry is None else entry["status"]
+
+    def write(self, entries: list[dict]):
+        for entry in entries:
+            self.entries[entry["path"]] = entry
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+def fn_collect_files(args, supported) -> list[dict]:
+    # directory walk or JSON lines manifest; proc_type "auto": image formats as "image", the rest as "text"
+    files = []
+    if args.manifest is not None:
+        with open(args.manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    files.append({"path": os.path.abspath(item["path"]), "title": item.get("title"), "proc_type": item.get("proc_type", args.proc_type)})
+    else:
+        for root, _, names in os.walk(args.input):
+            for name in sorted(names):
+                files.append({"path": os.path.abspath(os.path.join(root, name)), "title": None, "proc_type": args.proc_type})
+    collected = []
+    for item in files:
+        item["extension"] = os.path.splitext(item["path"])[1].lower()[1:]
+        item["title"] = (item["title"] or os.path.basename(item["path"]))[:100]
+        if item["proc_type"] == "auto":
+            item["proc_type"] = "image" if item["extension"] in IMAGE_EXTENSIONS else "text"
+        if not supported(item["extension"], item["proc_type"]):
+            print(f"skip unsupported file / path={item['path']}, proc_type={item['proc_type']}")
+            continue
+        collected.append(item)
+    return collected
+
+def fn_create_documents(files: list[dict], username: str) -> list[dict]:
+    """
+    One transaction for all new files: Documents rows, and chunk sets so that identical content is processed once.
+    Returns checkpoint entries; vector_doc_id is the doc_id whose chunks are stored (== doc_id for files to process).
+    """
+    import database
+    from spool import hash_file
+    from sqlalchemy import select
+
+    for item in files:
+        with open(item["path"], "rb") as f:
+            item["content_hash"] = hash_file(f)
+
+    with database.rdb_session() as db:
+        if db.execute(select(database.Users.id).where(database.Users.username == username)).first() is None:
+            raise ValueError(f"User not found (username={username})")
+        documents = [
+            database.Documents(user_username=username, title=item["title"], extension=item["extension"], proc_type=item["proc_type"], content_hash=item["content_hash"])
+            for item in files
+        ]
+        db.add_all(documents)
+        db.flush()
+
+        groups = defaultdict(list)
+        for item, doc in zip(files, documents):
+            groups[f"{item['content_hash']}:{item['proc_type']}"].append((item, doc))
+        existing = {
+            chunk_set.fingerprint: chunk_set
+            for chunk_set in db.execute(select(database.ChunkSets).where(database.ChunkSets.fingerprint.in_(list(groups.keys())))).scalars()
+        }
+        entries = []
+        for fingerprint, members in groups.items():
+            chunk_set = existing.get(fingerprint)
+            if (chunk_set is not None) and (chunk_set.status != "done"):
+                # being ingested by the service right now -> process independently, as fn_link_chunk_set does
+                for item, doc in members:
+                    entries.append({"path": item["path"], "doc_id": doc.id, "vector_doc_id": doc.id, "chunk_set_id": None, "content_hash": item["content_hash"], "status": "created"})
+                continue
+            if chunk_set is None:
+                # the first file of the group owns the vectors
+                chunk_set = database.ChunkSets(fingerprint=fingerprint, vector_doc_id=members[0][1].id, ref_count=0, status="processing")
+                db.add(chunk_set)
+                db.flush()
+            chunk_set.ref_count += len(members)
+            for item, doc in members:
+                doc.chunk_set_id = chunk_set.id
+                status = "done" if chunk_set.status == "done" else "created"
+                if status == "done":
+                    doc.progress = 100
+                entries.append({"path": item["path"], "doc_id": doc.id, "vector_doc_id": chunk_set.vector_doc_id, "chunk_set_id": chunk_set.id, "content_hash": item["content_hash"], "status": status})
+        db.commit()
+    return entries
+
+def fn_complete_documents(entries: list[dict], pages: dict[int, list[tuple[int, str]]]):
+    # owners and the files sharing their chunks are finished together, in one transaction
+    import database
+    from sqlalchemy import update, delete
+
+    with database.rdb_session() as db:
+        db.execute(update(database.Documents), [{"id": entry["doc_id"], "progress": 100} for entry in entries])
+        owners = list(pages)
+        if owners:
+            db.execute(delete(database.DocumentPages).where(database.DocumentPages.doc_id.in_(owners)))
+            db.add_all([
+                database.DocumentPages(doc_id=doc_id, page_number=page_number, fingerprint=fingerprint)
+                for doc_id, doc_pages in pages.items() for page_number, fingerprint in doc_pages
+            ])
+        chunk_set_ids = list({entry["chunk_set_id"] for entry in entries if entry["chunk_set_id"] is not None})
+        if chunk_set_ids:
+            db.execute(update(database.ChunkSets).where(database.ChunkSets.id.in_(chunk_set_ids)).values(status="done"))
+        db.commit()
+
+def fn_fail_documents(entries: list[dict]):
+    # partially ingested content must not be reused: the chunk set is dropped and every file is processed on its own next time
+    import database
+    from sqlalchemy import update, delete
+
+    chunk_set_ids = list({entry["chunk_set_id"] for entry in entries if entry["chunk_set_id"] is not None})
+    with database.rdb_session() as db:
+        # -1: failed, like a failed job of the service
+        db.execute(update(database.Documents), [{"id": entry["doc_id"], "progress": -1} for entry in entries])
+        if chunk_set_ids:
+            db.execute(update(database.Documents).where(database.Documents.chunk_set_id.in_(chunk_set_ids)).values(chunk_set_id=None))
+            db.execute(delete(database.ChunkSets).where(database.ChunkSets.id.in_(chunk_set_ids)))
+        db.commit()
+    for entry in entries:
+        entry["vector_doc_id"], entry["chunk_set_id"] = entry["doc_id"], None
+
+def fn_init_worker(n_workers: int):
+    # parallelism is across documents: no nested parser pools, and the LLM rate limits are split between workers
+    os.environ["PARSER_N_WORKERS"] = "1"
+    os.environ["IMAGE_N_WORKERS"] = "1"
+    for name in ["LLM_REQUESTS_PER_MINUTE", "LLM_TOKENS_PER_MINUTE"]:
+        if float(os.getenv(name, 0)) > 0:
+            os.environ[name] = str(float(os.getenv(name)) / n_workers)
+    global worker_embedder
+    from embedder import create_embedder
+    worker_embedder = create_embedder()
+    # PPTX converters of this worker use their own profiles (CONVERTER_PROFILE_DIR/pid-<pid>/), stopped when the pool shuts down
+    import converter
+    from multiprocessing.util import Finalize
+    Finalize(None, converter.close_converter_pool, exitpriority=10)
+
+def fn_ingest_file(path: str, extension: str, proc_type: str, doc_id: int, embed_batch_size: int):
+    # parse -> chunk -> embed in a worker process; the parent writes the rows
+    from pipelines import pipeline_registry
+    from insert_buffer import VectorInsertBuffer, embed_batch
+    from incremental import fingerprint_pages
+    from dedup import MinHashDeduplicator
+
+    pipeline = pipeline_registry.get(extension, proc_type)
+    with open(path, "rb") as f:
+        page_container = pipeline.parser.parse(f)
+    buffer = VectorInsertBuffer(doc_id, max_rows=sys.maxsize, max_bytes=sys.maxsize, max_latency=float("inf"))
+    deduplicator = MinHashDeduplicator.from_env()
+    n_dropped = 0
+    for idx, chunker in enumerate(pipeline.chunkers):
+        generator = chunker.chunk(page_container)
+        next(generator)
+        chunks = list(generator)
+        if deduplicator is not None:
+            kept = deduplicator.filter(idx, chunks)
+            n_dropped += len(chunks) - len(kept)
+            chunks = kept
+        buffer.add(idx, chunks)
+    batch = buffer.drain()
+    if batch is not None:
+        embed_batch(batch, worker_embedder, embed_batch_size)
+    return {
+        "doc_id": doc_id,
+        "pages": fingerprint_pages(page_container),
+        "columns": None if batch is None else batch.columns,
+        "n_bytes": 0 if batch is None else batch.n_bytes,
+        "dedup_dropped": n_dropped,
+    }
+
+class BulkWriter():
+    """
+    Rows of many documents are upserted together in batches of max_rows; a document is complete once all its rows are written.
+    add() and flush() return (completed doc_ids, {failed doc_id: error}). An upsert that fails after its retries fails
+    the documents with rows in that batch only: their other buffered rows are dropped and their stored rows deleted.
+    """
+    def __init__(self, collection, field_names: list[str], max_rows: int, max_retries: int = 3):
+        from insert_buffer import COLUMNS
+        self.collection = collection
+        self.field_names = field_names
+        self.max_rows = max_rows
+        self.max_retries = max_retries
+        self.columns = {name: [] for name in COLUMNS + ["vector"]}
+        self.owners = []
+        self.remaining = defaultdict(int)
+        self.n_rows = 0
+        self.n_flushes = 0
+
+    def add(self, doc_id: int, columns: dict[str, list]) -> tuple[list[int], dict[int, str]]:
+        n_rows = len(columns["id"])
+        for name in self.columns:
+            self.columns[name].extend(columns[name])
+        self.owners.extend([doc_id] * n_rows)
+        self.remaining[doc_id] += n_rows
+        completed, failed = [], {}
+        while len(self.owners) >= self.max_rows:
+            flushed, errors = self.flush(self.max_rows)
+            completed += flushed
+            failed.update(errors)
+        return completed, failed
+
+    def drop(self, doc_ids: set[int]):
+        keep = [idx for idx, owner in enumerate(self.owners) if owner not in doc_ids]
+        for name in self.columns:
+            self.columns[name] = [self.columns[name][idx] for idx in keep]
+        self.owners = [self.owners[idx] for idx in keep]
+        for doc_id in doc_ids:
+            self.remaining.pop(doc_id, None)
+        try:
+            self.collection.delete(expr=f"doc_id in {sorted(doc_ids)}")
+        except Exception as e:
+            print(f"ERROR in BulkWriter.drop -> doc_ids={sorted(doc_ids)}, msg={e}")
+
+    def flush(self, n_rows: int | None = None) -> tuple[list[int], dict[int, str]]:
+        from insert_buffer import ColumnBatch, upsert_batch
+        n_rows = len(self.owners) if n_rows is None else n_rows
+        if n_rows == 0:
+            return [], {}
+        batch = ColumnBatch({name: values[:n_rows] for name, values in self.columns.items()}, self.owners[:n_rows], 0, "bulk")
+        try:
+            upsert_batch(batch, self.collection, self.field_names, max_retries=self.max_retries)
+        except Exception as e:
+            failed = set(batch.owners)
+            self.drop(failed)
+            return [], {doc_id: str(e) for doc_id in failed}
+        for name in self.columns:
+            del self.columns[name][:n_rows]
+        del self.owners[:n_rows]
+        self.n_rows += n_rows
+        self.n_flushes += 1
+        completed = []
+        for doc_id, count in batch.owner_counts().items():
+            self.remaining[doc_id] -= count
+            if self.remaining[doc_id] == 0:
+                del self.remaining[doc_id]
+                completed.append(doc_id)
+        return completed, {}
+
+def main(args):
+    from pipelines import pipeline_registry
+    import database
+
+    def supported(extension, proc_type):
+        try:
+            pipeline_registry.resolve(extension, proc_type)
+            return True
+        except ValueError:
+            return False
+
+    database.create_tables()
+    files = fn_collect_files(args, supported)
+    checkpoint = Checkpoint(args.checkpoint)
+    skip = ["done", "failed"] if args.skip_failed else ["done"]
+    todo = [item for item in files if checkpoint.status(item["path"]) not in skip]
+    new_files = [item for item in todo if item["path"] not in checkpoint.entries]
+    print(f"bulk_ingest / files={len(files)}, done={len(files) - len(todo)}, resumed={len(todo) - len(new_files)}, new={len(new_files)}")
+    for start in range(0, len(new_files), args.create_batch_size):
+        checkpoint.write(fn_create_documents(new_files[start:start + args.create_batch_size], args.username))
+
+    by_path = {item["path"]: item for item in todo}
+    entries = [checkpoint.entries[item["path"]] for item in todo if checkpoint.status(item["path"]) != "done"]
+    # files sharing content wait for the file that owns the chunks
+    followers = defaultdict(list)
+    jobs = []
+    for entry in entries:
+        if entry["vector_doc_id"] == entry["doc_id"]:
+            jobs.append(entry)
+        else:
+            followers[entry["vector_doc_id"]].append(entry)
+    owned = {entry["doc_id"] for entry in jobs}
+    # owners finished in an earlier run: their followers are done already
+    ready = [entry for vector_doc_id, group in followers.items() if vector_doc_id not in owned for entry in group]
+    if ready:
+        fn_complete_documents(ready, {})
+        checkpoint.write([{**entry, "status": "done"} for entry in ready])
+
+    collection = database.open_collection()
+    writer = BulkWriter(collection, [col.name for col in database.fields], args.insert_rows)
+    by_doc_id = {entry["doc_id"]: entry for entry in jobs}
+    written_pages = {}
+    totals = {"docs": 0, "failed": 0, "pages": 0, "chunks": 0, "bytes": 0, "dedup_dropped": 0}
+    started_at = time.perf_counter()
+
+    def complete(doc_ids):
+        if not doc_ids:
+            return
+        group = [by_doc_id[doc_id] for doc_id in doc_ids] + [entry for doc_id in doc_ids for entry in followers.get(doc_id, [])]
+        fn_complete_documents(group, {doc_id: written_pages.pop(doc_id) for doc_id in doc_ids})
+        checkpoint.write([{**entry, "status": "done"} for entry in group])
+        totals["docs"] += len(group)
+
+    def fail(entry, error):
+        group = [entry] + followers.get(entry["doc_id"], [])
+        fn_fail_documents(group)
+        checkpoint.write([{**member, "status": "failed", "error": error} for member in group])
+        totals["failed"] += len(group)
+        print(f"ERROR in bulk_ingest -> path={entry['path']}, msg={error}")
+
+    def settle(completed, failed):
+        complete(completed)
+        for doc_id, error in failed.items():
+            written_pages.pop(doc_id, None)
+            fail(by_doc_id[doc_id], error)
+
+    def report(final=False):
+        elapsed = max(time.perf_counter() - started_at, 1e-9)
+        print(
+            f"{'total' if final else 'progress'} / docs={totals['docs']}/{len(entries)}, failed={totals['failed']}, chunks={totals['chunks']}, "
+            f"docs/s={totals['docs'] / elapsed:.2f}, pages/s={totals['pages'] / elapsed:.1f}, chunks/s={totals['chunks'] / elapsed:.1f}, "
+            f"MB/s={totals['bytes'] / 1024 ** 2 / elapsed:.2f}, elapsed={elapsed:.1f}s"
+        )
+
+    context = multiprocessing.get_context("spawn")
+    reported_at = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=fn_init_worker, initargs=(args.workers,)) as executor:
+        pending = {}
+        queue = deque(jobs)
+        while queue or pending:
+            # a bounded number of documents in flight: results carry their vectors
+            while queue and (len(pending) < args.workers * 2):
+                entry = queue.popleft()
+                item = by_path[entry["path"]]
+                future = executor.submit(fn_ingest_file, entry["path"], item["extension"], item["proc_type"], entry["doc_id"], args.embed_batch_size)
+                pending[future] = entry
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    fail(entry, str(e))
+                    continue
+                written_pages[entry["doc_id"]] = result["pages"]
+                totals["pages"] += len(result["pages"])
+                totals["bytes"] += result["n_bytes"]
+                totals["dedup_dropped"] += result["dedup_dropped"]
+                if result["columns"] is None:
+                    complete([entry["doc_id"]])
+                    continue
+                totals["chunks"] += len(result["columns"]["id"])
+                settle(*writer.add(entry["doc_id"], result["columns"]))
+            if time.perf_counter() - reported_at >= args.report_interval:
+                report()
+                reported_at = time.perf_counter()
+    settle(*writer.flush())
+    checkpoint.close()
+    report(final=True)
+    print(f"bulk_ingest / inserts={writer.n_flushes}, rows={writer.n_rows}, dedup_dropped={totals['dedup_dropped']}, checkpoint={checkpoint.path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory or manifest of files directly (no HTTP), parallel across documents")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", default=None, help="directory to walk")
+    source.add_argument("--manifest", default=None, help='JSON lines: {"path": ..., "proc_type": ..., "title": ...} (proc_type and title optional)')
+    parser.add_argument("--username", required=True, help="owner of the created documents (must exist)")
+    parser.add_argument("--proc-type", default="auto", help="text | image | plain | auto (auto: pptx/jpeg/jpg/png as image, the rest as text)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="parse/chunk/embed processes, each loads its own embedder")
+    parser.add_argument("--insert-rows", type=int, default=2048, help="rows per Milvus upsert")
+    parser.add_argument("--embed-batch-size", type=int, default=int(os.getenv("EMBEDDING_BATCH_SIZE", 256)))
+    parser.add_argument("--create-batch-size", type=int, default=1000, help="Documents rows per transaction")
+    parser.add_argument("--checkpoint", default="./.bulk-ingest/checkpoint.jsonl")
+    parser.add_argument("--skip-failed", action="store_true", help="do not retry files that failed in an earlier run")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="seconds between throughput lines")
+    main(parser.parse_args())
@@ -0,0 +1,149 @@
+import os
+import time
+import json
+import uuid
+import hashlib
+import argparse
+from dotenv import load_dotenv
+load_dotenv()
+
+def make_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+class DiskCache():
+    """
+    Content-addressed file cache: one file per key under <cache_dir>/<namespace>/<key[:2]>/<key>.
+    Hits refresh the file mtime, and the least recently used files are evicted once the cache exceeds max_bytes.
+    Writes are atomic (temp file + rename), so several processes can share the directory.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.size = None
+
+    def get_path(self, namespace: str, key: str):
+        return os.path.join(self.cache_dir, namespace, key[:2], key)
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        if not self.enabled:
+            return None
+        path = self.get_path(namespace, key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+            return value
+        except (FileNotFoundError, OSError):
+            return None
+
+    def set(self, namespace: str, key: str, value: bytes):
+        if not self.enabled:
+            return
+        path = self.get_path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+        if self.size is None:
+            self.size = self.stats()["bytes"]
+        else:
+            self.size += len(value)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def get_json(self, namespace: str, key: str):
+        value = self.get(namespace, key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, namespace: str, key: str, value):
+        self.set(namespace, key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def iter_files(self, namespace: str | None = None):
+        root = self.cache_dir if namespace is None else os.path.join(self.cache_dir, namespace)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def evict(self, target_ratio: float = 0.9):
+        # least recently used first, down to target_ratio * max_bytes
+        files = sorted(self.iter_files(), key=lambda x: x[2])
+        size = sum(file_size for _, file_size, _ in files)
+        n_evicted = 0
+        for path, file_size, _ in files:
+            if size <= self.max_bytes * target_ratio:
+                break
+            try:
+                os.remove(path)
+                size -= file_size
+                n_evicted += 1
+            except FileNotFoundError:
+                pass
+        self.size = size
+        return n_evicted
+
+    def purge(self, namespace: str | None = None, older_than_seconds: float | None = None):
+        now = time.time()
+        n_purged = 0
+        for path, _, mtime in list(self.iter_files(namespace)):
+            if (older_than_seconds is None) or (now - mtime > older_than_seconds):
+                try:
+                    os.remove(path)
+                    n_purged += 1
+                except FileNotFoundError:
+                    pass
+        self.size = None
+        return n_purged
+
+    def stats(self, namespace: str | None = None):
+        n_files, n_bytes, oldest, newest = 0, 0, None, None
+        for _, file_size, mtime in self.iter_files(namespace):
+            n_files += 1
+            n_bytes += file_size
+            oldest = mtime if oldest is None else min(oldest, mtime)
+            newest = mtime if newest is None else max(newest, mtime)
+        return {"files": n_files, "bytes": n_bytes, "oldest": oldest, "newest": newest}
+
+pipeline_cache = None
+
+def get_pipeline_cache() -> DiskCache:
+    global pipeline_cache
+    if pipeline_cache is None:
+        pipeline_cache = DiskCache(
+            os.path.join(os.getenv("CACHE_DIR", "./.cache/"), "pipeline"),
+            max_bytes=int(os.getenv("PIPELINE_CACHE_MAX_BYTES", 10 * 1024 ** 3)),
+            enabled=os.getenv("PIPELINE_CACHE_ENABLED", "true").lower() == "true",
+        )
+    return pipeline_cache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and purge the render / LLM response cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats_parser = subparsers.add_parser("stats")
+    stats_parser.add_argument("--namespace", default=None, help="render or llm (default: all)")
+    purge_parser = subparsers.add_parser("purge")
+    purge_parser.add_argument("--namespace", default=None, help="render or llm (default: all)")
+    purge_parser.add_argument("--older-than-days", type=float, default=None)
+    subparsers.add_parser("evict")
+    args = parser.parse_args()
+
+    cache = get_pipeline_cache()
+    if args.command == "stats":
+        namespaces = [args.namespace] if args.namespace else ["render", "llm"]
+        for namespace in namespaces:
+            stats = cache.stats(namespace)
+            print(f"{namespace}: files={stats['files']}, bytes={stats['bytes']}, oldest={stats['oldest']}, newest={stats['newest']}")
+        print(f"cache_dir={cache.cache_dir}, max_bytes={cache.max_bytes}")
+    elif args.command == "purge":
+        older_than_seconds = None if args.older_than_days is None else args.older_than_days * 86400
+        print(f"purged files={cache.purge(args.namespace, older_than_seconds)}")
+    elif args.command == "evict":
+        print(f"evicted files={cache.evict()}")
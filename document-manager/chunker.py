@@ -1,4 +1,5 @@
 SEED = 42
+import time
 import numpy as np
 import pandas as pd
 import re
@@ -8,17 +9,69 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from transformers import AutoTokenizer
 from openai import OpenAI
 import Levenshtein
+from cache import get_pipeline_cache, make_key
+from llm_scheduler import scheduler, estimate_tokens
+from splitter import MultiGranularitySplitter
+import metrics
+import tracing
 from dotenv import load_dotenv
 load_dotenv()
 
+def generate_completions(client, model, messages, sampling_params, n_trials, seed=None):
+    # completions are cached by prompt + model + sampling params + seed, so retried ingestions skip finished calls
+    cache = get_pipeline_cache()
+    cache_key = make_key("chat.completions", model, messages, sampling_params, seed)
+    contents = cache.get_json("llm", cache_key)
+    if contents is not None:
+        return contents
+    n = sampling_params.get("n", 1)
+    max_tokens = sampling_params.get("max_tokens", sampling_params.get("max_completion_tokens", 0))
+    def create():
+        started_at = time.perf_counter()
+        try:
+            with tracing.tracer.start_as_current_span("llm.completion", attributes={"model": model, "n": n}):
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    extra_body=sampling_params,
+                    **({} if seed is None else {"seed": seed}),
+                )
+        except Exception:
+            metrics.LLM_CALL_SECONDS.labels("error").observe(time.perf_counter() - started_at)
+            raise
+        metrics.LLM_CALL_SECONDS.labels("ok").observe(time.perf_counter() - started_at)
+        return completion
+
+    try:
+        completion = scheduler.call(
+            create,
+            priority_class="ingestion",
+            n_tokens=estimate_tokens(messages, max_tokens=max_tokens, n=n),
+            max_retries=n_trials - 1,
+        )
+    except Exception as e:
+        completion = None
+        print(f"ERROR in generation -> msg={e}")
+    if completion is None:
+        return None
+    contents = [cmpl.message.content for cmpl in completion.choices]
+    cache.set_json("llm", cache_key, contents)
+    return contents
+
 class RuleBasedTextChunker():
     def __init__(
-            self, tokenizer_path=None,
+            self, tokenizer_path=None, splitter_backend="native", tokenizer=None,
     ):
-        if tokenizer_path is None:
+        # tokenizer: an already loaded tokenizer, shared with other chunkers (see pipelines.py)
+        if tokenizer is not None:
+            self.tokenizer = tokenizer
+        elif tokenizer_path is None:
             self.tokenizer = None
         else:
             self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        # native: one tokenization shared by every window size (splitter.py), langchain: one splitter per config
+        self.splitter_backend = splitter_backend
+        self.splitter = MultiGranularitySplitter(self.tokenizer)
 
     @staticmethod
     def compress_text(x, max_text_len=2000):
@@ -32,7 +85,24 @@ class RuleBasedTextChunker():
         splitted_query = ["".join(i)[:n_characters] for i in np.array_split(list(compressed_query), n_buckets)]
         score = pd.Series([sum([q in r for q in splitted_query]) for r in reference], index=page_container["page_number"].to_list())
         return score.sort_values(ascending=False)
-    
+
+    @staticmethod
+    def get_page_offsets(page_container, page_separator):
+        # start offset of each page inside page_separator.join(page_content)
+        lengths = page_container["page_content"].str.len().to_numpy()
+        return np.concatenate([[0], np.cumsum(lengths[:-1] + len(page_separator))]) if len(lengths) else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def search_page_number_by_offset(start_index, end_index, page_offsets, page_numbers):
+        # page holding the largest part of [start_index, end_index)
+        first = max(0, np.searchsorted(page_offsets, start_index, side="right") - 1)
+        last = max(first, np.searchsorted(page_offsets, end_index, side="left") - 1)
+        if first == last:
+            return page_numbers[first]
+        bounds = np.append(page_offsets[first:last + 1], end_index)
+        bounds[0] = start_index
+        return page_numbers[first + int(np.argmax(np.diff(bounds)))]
+
     def chunk(
             self, page_container, page_separator="\n\n",
             splitter_config=[
@@ -40,6 +110,11 @@ class RuleBasedTextChunker():
                 {"type": "rule_long", "params": {"chunk_size": 768, "chunk_overlap": 768 // 4, "separators": [""]}},
             ],
     ):
+        texts = page_separator.join(page_container["page_content"])
+        if self.splitter_backend == "native":
+            yield from self.chunk_native(page_container, texts, page_separator, splitter_config)
+            return
+
         if self.tokenizer is None:
             splitter_container = {
                 config["type"]: RecursiveCharacterTextSplitter(**config["params"])
@@ -51,7 +126,6 @@ class RuleBasedTextChunker():
                 for config in splitter_config
             }
 
-        texts = page_separator.join(page_container["page_content"])
         chunk_container = {}
         total_chunks = 0
         for chunk_type, splitter in splitter_container.items():
@@ -73,19 +147,41 @@ class RuleBasedTextChunker():
                 }
                 yield output
 
+    def chunk_native(self, page_container, texts, page_separator, splitter_config):
+        chunk_container = self.splitter.split(texts, splitter_config)
+        yield sum(len(chunks) for chunks in chunk_container.values())
+
+        # chunks carry character offsets, so the page number is a lookup instead of a text search
+        page_offsets = self.get_page_offsets(page_container, page_separator)
+        page_numbers = page_container["page_number"].to_list()
+        for chunk_type, chunks in chunk_container.items():
+            for chunk_id, chunk_data in enumerate(chunks):
+                yield {
+                    "page_number": self.search_page_number_by_offset(chunk_data["start_index"], chunk_data["end_index"], page_offsets, page_numbers),
+                    "chunk_type": chunk_type,
+                    "chunk_id": chunk_id,
+                    "chunk_content": chunk_data["chunk_content"],
+                    "start_index": chunk_data["start_index"],
+                    "end_index": chunk_data["end_index"],
+                }
+
     
 class LLMBasedTextChunker():
     def __init__(
             self, tokenizer_path=None,
             llm_server_config={"base_url": "http://localhost:9001/v1", "api_key": "token-abc123"},
             llm_model_type="openai", llm_model_name="default", llm_n_trials=5, llm_max_len=8192, llm_max_tokens=1024, llm_min_tokens=16,
+            tokenizer=None, client=None,
     ):
-        if tokenizer_path is None:
+        # tokenizer, client: already created objects, shared with other chunkers (see pipelines.py)
+        if tokenizer is not None:
+            self.tokenizer = tokenizer
+        elif tokenizer_path is None:
             self.tokenizer = None
         else:
             self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
         if llm_model_type == "openai":
-            self.client = OpenAI()
+            self.client = OpenAI(max_retries=0) if client is None else client
             self.sampling_params = {
                 "max_completion_tokens": llm_max_tokens,
                 "n": 1,
@@ -94,7 +190,7 @@ class LLMBasedTextChunker():
                 "frequency_penalty": 0.5,
             }
         else:
-            self.client = OpenAI(**llm_server_config)
+            self.client = OpenAI(**llm_server_config, max_retries=0) if client is None else client
             self.sampling_params = {
                 "max_tokens": llm_max_tokens,
                 "min_tokens": llm_min_tokens,
@@ -160,28 +256,17 @@ class LLMBasedTextChunker():
         for chunk_type, chunks in chunk_container.items():
             for chunk_id, chunk_data in enumerate(tqdm(chunks, desc=f"create documents... ({chunk_type})")):
                 # generation
-                cnt = 0
-                while cnt < self.llm_max_trials:
-                    try:
-                        completion = self.client.chat.completions.create(
-                            model=self.llm_model_name,
-                            messages=[
-                                {"role": "user", "content": self.prompt_template["user"].format(context=chunk_data.strip()).strip()},
-                            ],
-                            extra_body=self.sampling_params,
-                            seed=SEED,
-                        )
-                        break
-                    except Exception as e:
-                        completion = None
-                        cnt += 1
-                        print(f"ERROR in generation -> retry / msg={e}, iteration={cnt}")
-                        continue
-                if completion is None:
+                contents = generate_completions(
+                    self.client, self.llm_model_name,
+                    [
+                        {"role": "user", "content": self.prompt_template["user"].format(context=chunk_data.strip()).strip()},
+                    ],
+                    self.sampling_params, self.llm_max_trials, seed=SEED,
+                )
+                if contents is None:
                     print(f"nothing generated -> skip chunking")
                     continue
-                for chunk_id, cmpl in enumerate(completion.choices):
-                    gened_data = cmpl.message.content
+                for chunk_id, gened_data in enumerate(contents):
                     # searching page number
                     score = self.search_page_number(gened_data, page_container)
                     output = {
@@ -198,10 +283,11 @@ class LLMBasedImageChunker():
             self,
             llm_server_config={"base_url": "http://localhost:9001/v1", "api_key": "token-abc123"},
             llm_model_type="openai", llm_model_name="default", llm_n_trials=5, llm_max_len=8192, llm_max_tokens=1024, llm_min_tokens=16,
-            
+            client=None,
         ):
+        # client: an already created OpenAI client, shared with other chunkers (see pipelines.py)
         if llm_model_type == "openai":
-            self.client = OpenAI()
+            self.client = OpenAI(max_retries=0) if client is None else client
             self.sampling_params = {
                 "max_completion_tokens": llm_max_tokens,
                 "n": 1,
@@ -210,7 +296,7 @@ class LLMBasedImageChunker():
                 "frequency_penalty": 0.5,
             }
         else:
-            self.client = OpenAI(**llm_server_config)
+            self.client = OpenAI(**llm_server_config, max_retries=0) if client is None else client
             self.sampling_params = {
                 "max_tokens": llm_max_tokens,
                 "min_tokens": llm_min_tokens,
@@ -239,33 +325,23 @@ class LLMBasedImageChunker():
 
         for idx, row in page_container.iterrows():
             # generation
-            cnt = 0
-            while cnt < self.llm_max_trials:
-                try:
-                    completion = self.client.chat.completions.create(
-                        model=self.llm_model_name,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": self.prompt_template["user"].strip()},
-                                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{row['page_content']}"}}
-                                ]
-                            }
-                        ],
-                        extra_body=self.sampling_params,
-                    )
-                    break
-                except Exception as e:
-                    completion = None
-                    cnt += 1
-                    print(f"ERROR in generation -> retry / msg={e}, iteration={cnt}")
-                    continue
-            if completion is None:
+            contents = generate_completions(
+                self.client, self.llm_model_name,
+                [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": self.prompt_template["user"].strip()},
+                            {"type": "image_url", "image_url": {"url": f"data:{row.get('mime_type', 'image/jpeg')};base64,{row['page_content']}"}}
+                        ]
+                    }
+                ],
+                self.sampling_params, self.llm_max_trials,
+            )
+            if contents is None:
                 print(f"nothing generated -> skip chunking")
                 continue
-            for chunk_id, cmpl in enumerate(completion.choices):
-                gened_data = cmpl.message.content
+            for chunk_id, gened_data in enumerate(contents):
                 output = {
                     "page_number": row["page_number"],
                     "chunk_type": "image",
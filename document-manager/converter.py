@@ -0,0 +1,266 @@
+import os
+import sys
+import time
+import queue
+import shutil
+import socket
+import signal
+import pathlib
+import platform
+import threading
+import subprocess
+from dotenv import load_dotenv
+load_dotenv()
+
+class ConversionError(Exception):
+    pass
+
+class Converter():
+    """
+    Interface of a single conversion slot. A slot is used by one conversion at a time.
+    Implementations: SofficeConverter, UnoServerConverter, LocalConverter (stand-in without LibreOffice).
+    """
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self) -> bool:
+        return True
+
+    def convert(self, src_path: str, out_dir: str, timeout: float) -> str:
+        raise NotImplementedError
+
+def kill_process(process: subprocess.Popen):
+    if process.poll() is not None:
+        return
+    try:
+        if platform.system() != "Windows":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+def find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def default_soffice_path():
+    return r"C:\Program Files\LibreOffice\program\soffice.exe" if platform.system() == "Windows" else "soffice"
+
+class SofficeConverter(Converter):
+    # one soffice process per conversion (start-up cost on every file), each slot keeps its own (warm) user profile
+    def __init__(self, slot: int, profile_root: str, binary: str | None = None):
+        self.profile_dir = os.path.abspath(os.path.join(profile_root, f"profile-{slot}"))
+        self.binary = default_soffice_path() if binary is None else binary
+
+    def convert(self, src_path, out_dir, timeout):
+        process = subprocess.Popen(
+            [
+                self.binary, f"-env:UserInstallation={pathlib.Path(self.profile_dir).as_uri()}",
+                "--headless", "--norestore", "--nolockcheck",
+                "--convert-to", "pdf", "--outdir", out_dir, src_path,
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True,
+        )
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process(process)
+            raise ConversionError(f"conversion timed out after {timeout}s (src_path={src_path})")
+        dst_path = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(src_path))[0]}.pdf")
+        if (process.returncode != 0) or (not os.path.exists(dst_path)):
+            raise ConversionError(f"conversion failed (returncode={process.returncode}, stderr={stderr.decode('utf-8', 'ignore').strip()})")
+        return dst_path
+
+class UnoServerConverter(Converter):
+    # long-lived office process (unoserver) per slot, conversions are sent over its socket
+    # port_base None: free ports are picked at start, so several server processes on one host do not collide
+    def __init__(self, slot: int, profile_root: str, port_base: int | None = None, startup_timeout: float = 60.0):
+        self.profile_dir = os.path.abspath(os.path.join(profile_root, f"profile-{slot}"))
+        self.port_base = port_base
+        self.port = None if port_base is None else port_base + slot * 2
+        self.uno_port = None if port_base is None else self.port + 1
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    def start(self):
+        if self.port_base is None:
+            self.port, self.uno_port = find_free_port(), find_free_port()
+        self.process = subprocess.Popen(
+            [
+                "unoserver", "--interface", "127.0.0.1", "--port", str(self.port), "--uno-port", str(self.uno_port),
+                "--user-installation", pathlib.Path(self.profile_dir).as_uri(),
+            ],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise ConversionError(f"unoserver exited during start-up (returncode={self.process.returncode})")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.5)
+        self.stop()
+        raise ConversionError(f"unoserver did not start within {self.startup_timeout}s (port={self.port})")
+
+    def stop(self):
+        if self.process is not None:
+            kill_process(self.process)
+            self.process = None
+
+    def is_alive(self):
+        return (self.process is not None) and (self.process.poll() is None)
+
+    def convert(self, src_path, out_dir, timeout):
+        dst_path = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(src_path))[0]}.pdf")
+        try:
+            result = subprocess.run(
+                ["unoconvert", "--host", "127.0.0.1", "--port", str(self.port), "--convert-to", "pdf", src_path, dst_path],
+                capture_output=True, timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise ConversionError(f"conversion timed out after {timeout}s (src_path={src_path})")
+        if (result.returncode != 0) or (not os.path.exists(dst_path)):
+            raise ConversionError(f"conversion failed (returncode={result.returncode}, stderr={result.stderr.decode('utf-8', 'ignore').strip()})")
+        return dst_path
+
+class LocalConverter(Converter):
+    # stand-in for tests and machines without LibreOffice: a python process copies the source (e.g. a PDF) after `delay` seconds
+    def __init__(self, slot: int, profile_root: str, delay: float = 0.0):
+        self.slot = slot
+        self.delay = delay
+
+    def convert(self, src_path, out_dir, timeout):
+        dst_path = os.path.join(out_dir, f"{os.path.splitext(os.path.basename(src_path))[0]}.pdf")
+        process = subprocess.Popen(
+            [
+                sys.executable, "-c", "import sys, time, shutil; time.sleep(float(sys.argv[1])); shutil.copyfile(sys.argv[2], sys.argv[3])",
+                str(self.delay), src_path, dst_path,
+            ],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True,
+        )
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process(process)
+            raise ConversionError(f"conversion timed out after {timeout}s (src_path={src_path})")
+        if (process.returncode != 0) or (not os.path.exists(dst_path)):
+            raise ConversionError(f"conversion failed (returncode={process.returncode}, stderr={stderr.decode('utf-8', 'ignore').strip()})")
+        return dst_path
+
+converter_backends = {
+    "soffice": lambda slot, profile_root: SofficeConverter(slot, profile_root, binary=os.getenv("SOFFICE_PATH")),
+    "unoserver": lambda slot, profile_root: UnoServerConverter(
+        slot, profile_root, port_base=int(os.getenv("UNOSERVER_PORT_BASE")) if os.getenv("UNOSERVER_PORT_BASE") else None,
+    ),
+    "local": lambda slot, profile_root: LocalConverter(slot, profile_root),
+}
+
+def default_converter_backend() -> str:
+    # CONVERTER_BACKEND unset: the persistent unoserver backend whenever it is installed, soffice otherwise
+    if os.getenv("CONVERTER_BACKEND"):
+        return os.getenv("CONVERTER_BACKEND")
+    return "unoserver" if (shutil.which("unoserver") and shutil.which("unoconvert")) else "soffice"
+
+def register_converter(name: str, factory):
+    # factory(slot, profile_root) -> Converter
+    converter_backends[name] = factory
+
+class ConverterPool():
+    """
+    Fixed number of converter slots shared by all concurrent ingestion jobs.
+    A hung conversion is killed after `timeout` and its slot is restarted.
+    convert() blocks until a slot is free and the conversion is done: call it from a worker thread, not the event loop.
+    """
+    def __init__(self, converter_factory, n_workers: int = 2, profile_root: str = "./.cache/converter/", timeout: float = 180.0, acquire_timeout: float = 1800.0):
+        self.profile_root = profile_root
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.n_waiting = 0
+        self.n_restarts = 0
+        self.started = set()
+        for slot in range(n_workers):
+            self.idle.put(converter_factory(slot, profile_root))
+
+    def convert(self, src_path: str, out_dir: str) -> str:
+        with self.lock:
+            self.n_waiting += 1
+        try:
+            converter = self.idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise ConversionError(f"no converter available within {self.acquire_timeout}s")
+        finally:
+            with self.lock:
+                self.n_waiting -= 1
+        try:
+            if id(converter) not in self.started:
+                converter.start()
+                self.started.add(id(converter))
+            elif not converter.is_alive():
+                self.restart(converter)
+            try:
+                return converter.convert(src_path, out_dir, self.timeout)
+            except ConversionError:
+                # the office process may be stuck -> give the next job a fresh one
+                self.restart(converter)
+                raise
+        finally:
+            self.idle.put(converter)
+
+    def restart(self, converter: Converter):
+        with self.lock:
+            self.n_restarts += 1
+        try:
+            converter.restart()
+        except Exception as e:
+            print(f"ERROR in ConverterPool.restart -> msg={e}")
+
+    def stats(self):
+        return {"idle": self.idle.qsize(), "waiting": self.n_waiting, "restarts": self.n_restarts}
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().stop()
+
+converter_pool = None
+converter_pool_lock = threading.Lock()
+
+def get_converter_pool() -> ConverterPool:
+    global converter_pool
+    with converter_pool_lock:
+        if converter_pool is None:
+            # office profiles are locked by their process: every server worker (and bulk ingest worker) gets its own
+            converter_pool = ConverterPool(
+                converter_backends[default_converter_backend()],
+                n_workers=int(os.getenv("CONVERTER_N_WORKERS", 2)),
+                profile_root=os.path.join(os.getenv("CONVERTER_PROFILE_DIR", "./.cache/converter/"), f"pid-{os.getpid()}"),
+                timeout=float(os.getenv("CONVERTER_TIMEOUT", 180)),
+            )
+        return converter_pool
+
+def close_converter_pool():
+    # stops the office processes and removes this process' profiles
+    global converter_pool
+    with converter_pool_lock:
+        if converter_pool is not None:
+            converter_pool.close()
+            shutil.rmtree(converter_pool.profile_root, ignore_errors=True)
+            converter_pool = None
+
+def set_converter_pool(pool: ConverterPool):
+    global converter_pool
+    with converter_pool_lock:
+        converter_pool = pool
@@ -0,0 +1,92 @@
+import os
+import re
+import zlib
+import numpy as np
+from collections import defaultdict
+from dotenv import load_dotenv
+load_dotenv()
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+class MinHashDeduplicator():
+    """
+    Drops chunks whose estimated Jaccard similarity (MinHash over character shingles) with an already kept chunk
+    is at least `threshold`. Candidates are found with LSH banding, so each chunk is compared with a few others only.
+    scope: "chunker" compares chunks of the same chunker, "document" compares across all chunkers of the document.
+    The first chunk seen is kept; one instance is used per document.
+    """
+    def __init__(self, threshold=0.9, scope="chunker", num_perm=64, bands=16, shingle_size=5, seed=1):
+        if scope not in ["chunker", "document"]:
+            raise ValueError(f"Invalid dedup scope (scope={scope})")
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm must be a multiple of bands (num_perm={num_perm}, bands={bands})")
+        rng = np.random.RandomState(seed)
+        # a, b < 2^32 and shingle hashes < 2^32, so a * x + b fits in uint64
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.threshold = threshold
+        self.scope = scope
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.signatures = defaultdict(list)
+        self.buckets = defaultdict(lambda: defaultdict(list))
+        self.checked = defaultdict(int)
+        self.dropped = defaultdict(int)
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("DEDUP_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            threshold=float(os.getenv("DEDUP_THRESHOLD", 0.9)),
+            scope=os.getenv("DEDUP_SCOPE", "chunker"),
+            num_perm=int(os.getenv("DEDUP_NUM_PERM", 64)),
+            bands=int(os.getenv("DEDUP_BANDS", 16)),
+            shingle_size=int(os.getenv("DEDUP_SHINGLE_SIZE", 5)),
+        )
+
+    def shingles(self, text: str) -> np.ndarray:
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        k = self.shingle_size
+        grams = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+        return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        return (((np.outer(hashes, self.a) + self.b) % MERSENNE_PRIME) & MAX_HASH).min(axis=0)
+
+    def is_duplicate(self, scope_key, text: str) -> bool:
+        signature = self.signature(text)
+        signatures = self.signatures[scope_key]
+        buckets = self.buckets[scope_key]
+        band_keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+        candidates = {idx for band_key in band_keys for idx in buckets.get(band_key, [])}
+        for idx in candidates:
+            if np.mean(signatures[idx] == signature) >= self.threshold:
+                return True
+        for band_key in band_keys:
+            buckets[band_key].append(len(signatures))
+        signatures.append(signature)
+        return False
+
+    def filter(self, owner: int, chunks: list[dict]) -> list[dict]:
+        scope_key = owner if self.scope == "chunker" else None
+        kept = []
+        for chunk in chunks:
+            self.checked[owner] += 1
+            if self.is_duplicate(scope_key, chunk["chunk_content"]):
+                self.dropped[owner] += 1
+            else:
+                kept.append(chunk)
+        return kept
+
+    def stats(self):
+        return {
+            "scope": self.scope,
+            "threshold": self.threshold,
+            "checked": sum(self.checked.values()),
+            "dropped": sum(self.dropped.values()),
+            "dropped_by_chunker": dict(self.dropped),
+        }
@@ -32,3 +32,8 @@ class OpenAIEmbedder():
             dimensions=self.embed_dim,
         )
         return self.normalize_embeddings([item.embedding for item in response.data])
+
+def create_embedder():
+    if os.getenv("EMBEDDING_MODEL_TYPE") == "openai":
+        return OpenAIEmbedder(os.getenv("EMBEDDING_MODEL_ID"), embed_dim=int(os.getenv("EMBEDDING_DIMENSION")))
+    return HuggingFaceEmbedder(os.getenv("EMBEDDING_MODEL_ID"), embed_dim=int(os.getenv("EMBEDDING_DIMENSION")), batch_size=int(os.getenv("EMBEDDING_MODEL_BATCH_SIZE", 32)))
@@ -0,0 +1,134 @@
+import os
+import io
+import math
+import random
+import base64
+from PIL import Image
+import metrics
+from dotenv import load_dotenv
+load_dotenv()
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+def parse_pixel_budgets(value: str | None) -> dict:
+    # "gpt-4o-mini:1572864,default:1003520" -> {"gpt-4o-mini": 1572864, "default": 1003520}
+    budgets = {}
+    for item in (value or "").split(","):
+        if ":" in item:
+            model_name, pixels = item.rsplit(":", 1)
+            budgets[model_name.strip()] = int(pixels)
+    return budgets
+
+class ImagePreprocessor():
+    """
+    Prepares page images for vision chunking: crops white margins, downscales to a pixel budget
+    (aspect preserved), and picks the encoding (PNG for line art, JPEG/WebP otherwise).
+    Byte savings are measured against what the previous path sent (a PNG of the full-resolution image) on a sample
+    of pages: building that PNG costs the full render the preprocessing avoids.
+    """
+    def __init__(
+            self, max_pixels=1572864, photo_format="JPEG", quality=85, crop_margin=True,
+            margin_threshold=245, margin_padding=8, line_art_max_colors=256, baseline_sample_rate=0.05,
+    ):
+        self.max_pixels = max_pixels
+        self.photo_format = photo_format.upper()
+        self.quality = quality
+        self.crop_margin = crop_margin
+        self.margin_threshold = margin_threshold
+        self.margin_padding = margin_padding
+        self.line_art_max_colors = line_art_max_colors
+        self.baseline_sample_rate = baseline_sample_rate
+
+    @classmethod
+    def from_env(cls, model_name: str | None = None):
+        budgets = parse_pixel_budgets(os.getenv("IMAGE_PIXEL_BUDGETS"))
+        max_pixels = budgets.get(model_name, budgets.get("default", int(os.getenv("IMAGE_MAX_PIXELS", 1572864))))
+        return cls(
+            max_pixels=max_pixels,
+            photo_format=os.getenv("IMAGE_FORMAT", "JPEG"),
+            quality=int(os.getenv("IMAGE_QUALITY", 85)),
+            crop_margin=os.getenv("IMAGE_CROP_MARGIN", "true").lower() == "true",
+            baseline_sample_rate=float(os.getenv("IMAGE_BASELINE_SAMPLE_RATE", 0.05)),
+        )
+
+    def render_resolution(self, width_pt: float, height_pt: float, resolution: int):
+        # render no larger than the budget instead of rendering big and downscaling
+        pixels = (width_pt * resolution / 72) * (height_pt * resolution / 72)
+        if self.max_pixels and (pixels > self.max_pixels):
+            return max(36, int(resolution * math.sqrt(self.max_pixels / pixels)))
+        return resolution
+
+    def crop(self, img: Image.Image):
+        mask = img.convert("L").point(lambda x: 255 if x < self.margin_threshold else 0)
+        bbox = mask.getbbox()
+        if bbox is None:
+            return img
+        left, top, right, bottom = bbox
+        p = self.margin_padding
+        return img.crop((max(0, left - p), max(0, top - p), min(img.width, right + p), min(img.height, bottom + p)))
+
+    def downscale(self, img: Image.Image):
+        pixels = img.width * img.height
+        if (not self.max_pixels) or (pixels <= self.max_pixels):
+            return img
+        scale = math.sqrt(self.max_pixels / pixels)
+        return img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+
+    def encode(self, img: Image.Image):
+        img = img.convert("RGB")
+        buffer = io.BytesIO()
+        colors = img.getcolors(maxcolors=self.line_art_max_colors)
+        if (colors is not None) or (self.photo_format == "PNG"):
+            # few colors -> diagrams, text, line art: lossless palette PNG stays sharp and small
+            if colors is not None:
+                img = img.convert("P", palette=Image.ADAPTIVE, colors=max(len(colors), 2))
+            img.save(buffer, format="PNG", optimize=True)
+            image_format = "PNG"
+        elif self.photo_format == "WEBP":
+            img.save(buffer, format="WEBP", quality=self.quality, method=4)
+            image_format = "WEBP"
+        else:
+            img.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+            image_format = "JPEG"
+        return buffer.getvalue(), MIME_TYPES[image_format]
+
+    @staticmethod
+    def measure_png(img: Image.Image) -> int:
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.tell()
+
+    def process(self, img: Image.Image, baseline=None):
+        # baseline() -> the image the previous path encoded as PNG (default: img itself)
+        baseline_bytes = None
+        if random.random() < self.baseline_sample_rate:
+            baseline_bytes = self.measure_png(img if baseline is None else baseline())
+        if self.crop_margin:
+            img = self.crop(img)
+        img = self.downscale(img)
+        data, mime_type = self.encode(img)
+        return {
+            "page_content": base64.b64encode(data).decode("utf-8"),
+            "mime_type": mime_type,
+            "baseline_bytes": baseline_bytes,
+            "encoded_bytes": len(data),
+        }
+
+def report_bytes_saved(page_container, name=""):
+    if ("encoded_bytes" not in page_container) or (len(page_container) == 0):
+        return
+    encoded_bytes = int(page_container["encoded_bytes"].sum())
+    metrics.IMAGE_BYTES.labels("encoded").inc(encoded_bytes)
+    # saved bytes only on the sampled pages encoded by this call, where the previous payload was measured
+    # (pages served from the render cache were reported when they were encoded)
+    sampled = page_container[page_container["baseline_bytes"].notna()] if "baseline_bytes" in page_container else page_container.iloc[:0]
+    if "cached" in sampled:
+        sampled = sampled[sampled["cached"] != True]
+    baseline_bytes, sampled_bytes = int(sampled["baseline_bytes"].sum()) if len(sampled) else 0, int(sampled["encoded_bytes"].sum())
+    if len(sampled):
+        metrics.IMAGE_BYTES.labels("baseline").inc(baseline_bytes)
+        metrics.IMAGE_BYTES.labels("baseline_encoded").inc(sampled_bytes)
+    print(
+        f"image preprocessing {name}/ pages={len(page_container)}, encoded_bytes={encoded_bytes}, "
+        f"sampled_pages={len(sampled)}, baseline_bytes={baseline_bytes}, saved_bytes={baseline_bytes - sampled_bytes}"
+    )
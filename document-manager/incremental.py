@@ -0,0 +1,71 @@
+import re
+import hashlib
+from collections import defaultdict
+
+def fingerprint_page(page_content: str) -> str:
+    # whitespace-insensitive so that re-exported documents with identical text match
+    normalized = re.sub(r"\s+", " ", page_content).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def fingerprint_pages(page_container) -> list[tuple[int, str]]:
+    return [
+        (int(page_number), fingerprint_page(page_content))
+        for page_number, page_content in zip(page_container["page_number"], page_container["page_content"])
+    ]
+
+def diff_pages(old_pages: list[tuple[int, str]], new_pages: list[tuple[int, str]]):
+    """
+    Matches pages by fingerprint (in order, so repeated pages pair up one-to-one).
+    Returns
+        matched: {old_page_number: new_page_number} for unchanged pages
+        removed: old page numbers whose content disappeared
+        changed: new page numbers that need to be chunked and embedded
+    """
+    old_by_fingerprint = defaultdict(list)
+    for page_number, fingerprint in sorted(old_pages):
+        old_by_fingerprint[fingerprint].append(page_number)
+
+    matched = {}
+    changed = []
+    for page_number, fingerprint in sorted(new_pages):
+        if old_by_fingerprint[fingerprint]:
+            matched[old_by_fingerprint[fingerprint].pop(0)] = page_number
+        else:
+            changed.append(page_number)
+    removed = sorted(page_number for page_number, _ in old_pages if page_number not in matched)
+    return matched, removed, changed
+
+def affected_pages(matched: dict[int, int], removed: list[int], changed: list[int], context: int = 1):
+    """
+    Chunks span page boundaries but are stored under a single page, so the unchanged pages next to a change
+    (within context pages, old or new numbering) are deleted and chunked again together with it.
+    Returns
+        stale: old page numbers whose chunks are deleted
+        affected: new page numbers that are chunked and embedded
+    """
+    removed_set, changed_set = set(removed), set(changed)
+    stale, affected = set(removed), set(changed)
+    for old, new in matched.items():
+        offsets = range(-context, context + 1)
+        if any((new + offset) in changed_set for offset in offsets) or any((old + offset) in removed_set for offset in offsets):
+            stale.add(old)
+            affected.add(new)
+    return sorted(stale), sorted(affected)
+
+def group_windows(page_numbers: list[int]) -> list[list[int]]:
+    # contiguous runs of page numbers, e.g. [2, 3, 7] -> [[2, 3], [7]]
+    windows = []
+    for page_number in sorted(page_numbers):
+        if windows and (page_number == windows[-1][-1] + 1):
+            windows[-1].append(page_number)
+        else:
+            windows.append([page_number])
+    return windows
+
+def create_chunk_id(doc_id: int, chunk_type: str, page_number: int, chunk_content: str, occurrence: int = 0) -> str:
+    # content-derived id: unchanged chunks keep their id across re-ingestion
+    # occurrence numbers identical chunks on the same page (boilerplate, repeated completions), the first keeps the plain id
+    key = f"{doc_id}:{chunk_type}:{page_number}:{chunk_content}"
+    if occurrence > 0:
+        key = f"{key}:{occurrence}"
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
@@ -0,0 +1,122 @@
+import time
+import random
+from collections import Counter
+from incremental import create_chunk_id
+import metrics
+import tracing
+
+# column order of database.fields, the vector column is added after embedding
+COLUMNS = ["id", "doc_id", "page_number", "chunk_type", "chunk_id", "chunk_content"]
+
+class ColumnBatch():
+    def __init__(self, columns: dict[str, list], owners: list[int], n_bytes: int, reason: str):
+        self.columns = columns
+        self.owners = owners
+        self.n_bytes = n_bytes
+        self.reason = reason
+
+    def __len__(self):
+        return len(self.owners)
+
+    def owner_counts(self) -> Counter:
+        return Counter(self.owners)
+
+    def to_insert_data(self, field_names: list[str]) -> list[list]:
+        return [self.columns[name] for name in field_names]
+
+class VectorInsertBuffer():
+    """
+    Accumulates chunk rows as plain column lists and cuts them into large batches.
+    A batch is released when it reaches max_rows or max_bytes, or when the oldest row is max_latency seconds old.
+    Row ids are content-derived (create_chunk_id), so a batch can be upserted again after a partial failure;
+    identical chunks of the document get distinct ids by their occurrence count.
+    owners keeps the chunker index of every row, so progress is reported per chunker once a batch is stored.
+    """
+    def __init__(self, doc_id: int, max_rows: int = 512, max_bytes: int = 8 * 1024 ** 2, max_latency: float = 2.0):
+        self.doc_id = doc_id
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.flush_reasons = Counter()
+        # kept across drains: ids are unique for the whole document
+        self.occurrences = Counter()
+        self.reset()
+
+    def reset(self):
+        self.columns = {name: [] for name in COLUMNS}
+        self.owners = []
+        self.n_bytes = 0
+        self.first_added_at = None
+
+    def __len__(self):
+        return len(self.owners)
+
+    def add(self, owner: int, chunks: list[dict]):
+        for chunk in chunks:
+            content = chunk["chunk_content"]
+            key = (chunk["chunk_type"], int(chunk["page_number"]), content)
+            self.columns["id"].append(create_chunk_id(self.doc_id, *key, occurrence=self.occurrences[key]))
+            self.occurrences[key] += 1
+            self.columns["doc_id"].append(self.doc_id)
+            self.columns["page_number"].append(int(chunk["page_number"]))
+            self.columns["chunk_type"].append(chunk["chunk_type"])
+            self.columns["chunk_id"].append(int(chunk["chunk_id"]))
+            self.columns["chunk_content"].append(content)
+            self.owners.append(owner)
+            self.n_bytes += len(content.encode("utf-8"))
+        if self.owners and (self.first_added_at is None):
+            self.first_added_at = time.monotonic()
+
+    def time_to_flush(self):
+        # seconds until the latency bound forces a flush (None when empty)
+        if self.first_added_at is None:
+            return None
+        return max(0.0, self.max_latency - (time.monotonic() - self.first_added_at))
+
+    def flush_reason(self):
+        if len(self) >= self.max_rows:
+            return "rows"
+        if self.n_bytes >= self.max_bytes:
+            return "bytes"
+        if (self.first_added_at is not None) and (self.time_to_flush() <= 0):
+            return "time"
+        return None
+
+    def drain(self, reason: str = "final") -> ColumnBatch | None:
+        if not self.owners:
+            return None
+        batch = ColumnBatch(self.columns, self.owners, self.n_bytes, reason)
+        self.flush_reasons[reason] += 1
+        self.reset()
+        return batch
+
+def embed_batch(batch: ColumnBatch, embedder, embed_batch_size: int = 256):
+    # one embedder call per embed_batch_size rows instead of one per 4 chunks
+    contents = batch.columns["chunk_content"]
+    vectors = []
+    with tracing.tracer.start_as_current_span("embed_batch", attributes={"rows": len(batch), "flush_reason": batch.reason}):
+        for start in range(0, len(contents), embed_batch_size):
+            texts = contents[start:start + embed_batch_size]
+            metrics.EMBED_BATCH_SIZE.observe(len(texts))
+            with metrics.EMBED_SECONDS.time():
+                vectors.extend(embedder.embed(texts))
+    batch.columns["vector"] = vectors
+    return batch
+
+def upsert_batch(batch: ColumnBatch, collection, field_names: list[str], max_retries: int = 3, base_delay: float = 1.0):
+    # upsert by deterministic id: retrying after a partial write never duplicates rows
+    data = batch.to_insert_data(field_names)
+    attempt = 0
+    while True:
+        try:
+            with metrics.MILVUS_SECONDS.labels("upsert").time(), tracing.tracer.start_as_current_span("milvus.upsert", attributes={"rows": len(batch), "attempt": attempt}):
+                collection.upsert(data)
+            metrics.CHUNKS_STORED.inc(len(batch))
+            return
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            delay = random.uniform(0, base_delay * (2 ** attempt))
+            attempt += 1
+            print(f"ERROR in upsert_batch -> retry in {delay:.1f}s / msg={e}, attempt={attempt}")
+            time.sleep(delay)
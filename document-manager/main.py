@@ -1,30 +1,61 @@
 import os
 import io
+import time
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
 import numpy as np
-import pandas as pd
 from collections import defaultdict
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from parser import ParserTXT, ParserPDF, ParserPPTX, ParserPDFImage, ParserImage
-from chunker import RuleBasedTextChunker, LLMBasedTextChunker, LLMBasedImageChunker
-from embedder import HuggingFaceEmbedder, OpenAIEmbedder
-from sqlalchemy.orm import Session
+from fastapi.responses import Response, JSONResponse
+from embedder import HuggingFaceEmbedder, create_embedder
 from pymilvus import Collection
+from sqlalchemy import select, delete, update
+from sqlalchemy.exc import IntegrityError
+from progress import tracker
+from llm_scheduler import scheduler
+from pipeline import ChunkPipeline, PipelineError, monitor
+from pipelines import pipeline_registry
+from insert_buffer import VectorInsertBuffer, embed_batch, upsert_batch
+from dedup import MinHashDeduplicator
+from selection import mmr_select, token_report
+import metrics
+import tracing
+from components import registry
+import converter
+from spool import open_spooled_file, hash_file
+from incremental import fingerprint_pages, diff_pages, affected_pages, group_windows
 import database
 import schemas
 from dotenv import load_dotenv  
 from typing import List
-import uuid
 load_dotenv()
 
 # Create embedding model
-if os.getenv("EMBEDDING_MODEL_TYPE") == "openai":
-    embedder = OpenAIEmbedder(os.getenv("EMBEDDING_MODEL_ID"), embed_dim=int(os.getenv("EMBEDDING_DIMENSION")))
-else:
-    embedder = HuggingFaceEmbedder(os.getenv("EMBEDDING_MODEL_ID"), embed_dim=int(os.getenv("EMBEDDING_DIMENSION")))
+def fn_warmup_embedder(embedder):
+    # one full dummy batch: weights paged in, kernels and allocator ready before the first request (OpenAI embedder is not called)
+    if isinstance(embedder, HuggingFaceEmbedder):
+        embedder.embed(["warm-up"] * embedder.batch_size)
+
+registry.register("embedder", create_embedder, warmup=fn_warmup_embedder)
+# parsers, chunkers and their shared LLM clients are built at startup; a format that fails to build is retried per request
+registry.register("pipelines", pipeline_registry.build_all, required=False)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.start_sampler()
+    tracker.start_flusher()
+    registry.start()
+    yield
+    await tracker.stop_flusher()
+    await registry.stop()
+    converter.close_converter_pool()
+
+tracing.setup_tracing("document-manager")
 
 # Create FastAPI App
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[os.getenv('BACKEND_URL')],
@@ -32,55 +63,254 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# continues the backend's trace (traceparent header) for every request
+app.middleware("http")(tracing.trace_http_request)
 
-async def fn_insert_vector(data, doc_id, collection):
-    try:
-        df = pd.DataFrame(data)
-        df["id"] = [uuid.uuid4().hex for _ in range(len(df))]
-        df["doc_id"] = doc_id
-        df["vector"] = embedder.embed(df["chunk_content"].to_list())
-        collection.insert(df[[col.name for col in database.fields]])
-        return True
-    except Exception as e:
-        print(f"ERROR in fn_insert_vector -> msg={e}")
-        return False
+# Queue depth gauges, evaluated when /metrics is scraped
+for priority_class in ["interactive", "ingestion"]:
+    metrics.register_queue(f"llm_{priority_class}", lambda priority_class=priority_class: scheduler.metrics[priority_class]["queue_depth"])
+metrics.register_queue("converter", lambda: 0 if converter.converter_pool is None else converter.converter_pool.n_waiting)
+metrics.register_queue("progress_unflushed", lambda: len(tracker.dirty))
+
+async def fn_process(page_conatiner, chunkers, doc_id, collection, batch_size=4, vector_doc_id=None, progress_offset=0):
+    # vector_doc_id: doc_id stored with the vectors (differs from doc_id when chunks are shared)
+    vector_doc_id = doc_id if vector_doc_id is None else vector_doc_id
+    tracker.set_stage(doc_id, "chunking")
+    field_names = [col.name for col in database.fields]
+    # chunkers, embedding and Milvus upserts overlap; progress is counted when a batch is stored
+    pipeline = ChunkPipeline(
+        buffer=VectorInsertBuffer(
+            vector_doc_id,
+            max_rows=int(os.getenv("INSERT_BUFFER_MAX_ROWS", 512)),
+            max_bytes=int(os.getenv("INSERT_BUFFER_MAX_BYTES", 8 * 1024 ** 2)),
+            max_latency=float(os.getenv("INSERT_BUFFER_MAX_LATENCY", 2.0)),
+        ),
+        embed_fn=lambda batch: embed_batch(batch, registry.get("embedder"), int(os.getenv("EMBEDDING_BATCH_SIZE", 256))),
+        insert_fn=lambda batch: upsert_batch(batch, collection, field_names, max_retries=int(os.getenv("INSERT_MAX_RETRIES", 3))),
+        on_total=lambda idx, total: tracker.set_total(doc_id, progress_offset + idx, total),
+        on_inserted=lambda idx, n_chunks: tracker.advance(doc_id, progress_offset + idx, n_chunks),
+        on_chunker_done=lambda idx: tracker.complete_chunker(doc_id, progress_offset + idx),
+        batch_size=batch_size,
+        queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", 8)),
+        n_embed_workers=int(os.getenv("PIPELINE_EMBED_WORKERS", 1)),
+        n_insert_workers=int(os.getenv("PIPELINE_INSERT_WORKERS", 1)),
+        deduplicator=MinHashDeduplicator.from_env(),
+    )
+    with tracing.tracer.start_as_current_span("fn_process", attributes={"doc_id": doc_id, "pages": len(page_conatiner), "chunkers": len(chunkers)}) as span:
+        try:
+            result = await pipeline.run(chunkers, page_conatiner)
+        except PipelineError as e:
+            # the job fails like a chunker error: fn_ingest drops the chunk set, fn_replace keeps the old page fingerprints
+            monitor.record(doc_id, e.result)
+            raise
+        span.set_attributes({"elapsed_seconds": result["elapsed_seconds"], "rows_stored": result["stages"]["insert"]["items"]})
+    monitor.record(doc_id, result)
+    return result
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    return JSONResponse(status_code=200 if registry.is_ready() else 503, content=registry.status())
+
+@app.post("/api/document-manager/progress")
+async def get_progress(form_data: schemas.RequestProgress):
+    return {"jobs": tracker.snapshot(form_data.doc_ids)}
+
+@app.get("/api/document-manager/db-pool")
+async def db_pool_status():
+    return database.get_pool_status()
+
+@app.get("/api/document-manager/llm-scheduler")
+async def llm_scheduler_status():
+    return scheduler.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    content, content_type = metrics.render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/api/document-manager/pipeline-stats")
+async def pipeline_stats():
+    return monitor.summary()
 
-async def fn_update_progress(data, doc_id, total_chunks, max_progress_value, db):
+@app.get("/api/document-manager/formats")
+async def supported_formats():
+    return pipeline_registry.supported()
+
+def fn_create_pipeline(extension: str, proc_type: str):
+    # parser and chunkers are built once per format and shared, see pipelines.PipelineRegistry
     try:
-        doc = db.query(database.Documents).filter(
-            database.Documents.id == doc_id,
-        ).first()
-        if data is not None:
-            doc.progress += int((len(data) / total_chunks) * max_progress_value)
+        pipeline = pipeline_registry.get(extension, proc_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return pipeline.parser, pipeline.chunkers
+
+async def fn_save_pages(vector_doc_id: int, pages: list[tuple[int, str]]):
+    async with database.async_rdb_session() as db:
+        await db.execute(delete(database.DocumentPages).where(database.DocumentPages.doc_id == vector_doc_id))
+        db.add_all([
+            database.DocumentPages(doc_id=vector_doc_id, page_number=page_number, fingerprint=fingerprint)
+            for page_number, fingerprint in pages
+        ])
+        await db.commit()
+
+# Milvus client calls block: async callers run these helpers through asyncio.to_thread
+def fn_delete_vectors(vector_doc_id: int, collection: Collection, page_numbers: list[int] | None = None):
+    expr = f"doc_id == {vector_doc_id}"
+    if page_numbers is not None:
+        expr = f"{expr} and page_number in {page_numbers}"
+    with metrics.MILVUS_SECONDS.labels("delete").time():
+        collection.delete(expr=expr)
+
+def fn_move_vectors(vector_doc_id: int, new_doc_id: int, collection: Collection):
+    # rows keep their primary key, only doc_id is rewritten
+    with metrics.MILVUS_SECONDS.labels("query").time():
+        rows = collection.query(expr=f"doc_id == {vector_doc_id}", output_fields=[col.name for col in database.fields])
+    for row in rows:
+        row["doc_id"] = new_doc_id
+    if rows:
+        with metrics.MILVUS_SECONDS.labels("upsert").time():
+            collection.upsert(rows)
+
+def fn_shift_vectors(vector_doc_id: int, shifted: dict[int, int], collection: Collection):
+    # rows keep their primary key, only page_number is rewritten ({old_page_number: new_page_number})
+    with metrics.MILVUS_SECONDS.labels("query").time():
+        rows = collection.query(
+            expr=f"doc_id == {vector_doc_id} and page_number in {list(shifted.keys())}",
+            output_fields=[col.name for col in database.fields],
+        )
+    for row in rows:
+        row["page_number"] = shifted[row["page_number"]]
+    if rows:
+        with metrics.MILVUS_SECONDS.labels("upsert").time():
+            collection.upsert(rows)
+
+async def fn_release_vectors(doc_id: int, collection: Collection):
+    # vectors are purged only when the last document referencing them goes away
+    async with database.async_rdb_session() as db:
+        doc = await db.get(database.Documents, doc_id)
+        if doc is None:
+            raise HTTPException(status_code=404, detail=f"Document not found (doc_id={doc_id})")
+        vector_doc_id = doc.id
+        if doc.chunk_set_id is not None:
+            chunk_set = (await db.execute(
+                select(database.ChunkSets).where(database.ChunkSets.id == doc.chunk_set_id).with_for_update()
+            )).scalars().first()
+            if chunk_set is not None:
+                chunk_set.ref_count -= 1
+                if chunk_set.ref_count > 0:
+                    if chunk_set.vector_doc_id == doc_id:
+                        # the owner goes away: hand the vectors to a document that still references them
+                        successor_id = (await db.execute(
+                            select(database.Documents.id).where(
+                                database.Documents.chunk_set_id == chunk_set.id, database.Documents.id != doc_id
+                            ).order_by(database.Documents.id).limit(1)
+                        )).scalar()
+                        if successor_id is not None:
+                            await asyncio.to_thread(fn_move_vectors, doc_id, successor_id, collection)
+                            await db.execute(
+                                update(database.DocumentPages).where(database.DocumentPages.doc_id == doc_id).values(doc_id=successor_id)
+                            )
+                            chunk_set.vector_doc_id = successor_id
+                    doc.chunk_set_id = None
+                    await db.commit()
+                    return {"purged": False, "ref_count": chunk_set.ref_count}
+                vector_doc_id = chunk_set.vector_doc_id
+                await db.delete(chunk_set)
+            doc.chunk_set_id = None
+        await asyncio.to_thread(fn_delete_vectors, vector_doc_id, collection)
+        await db.execute(delete(database.DocumentPages).where(database.DocumentPages.doc_id == vector_doc_id))
+        await db.commit()
+    return {"purged": True, "ref_count": 0}
+
+async def fn_link_chunk_set(doc_id: int, proc_type: str, content_hash: str):
+    # returns (chunk_set_id, reused)
+    fingerprint = f"{content_hash}:{proc_type}"
+    async with database.async_rdb_session() as db:
+        try:
+            doc = await db.get(database.Documents, doc_id)
+            if doc is None:
+                raise HTTPException(status_code=404, detail=f"Document not found (doc_id={doc_id})")
+            chunk_set = (await db.execute(
+                select(database.ChunkSets).where(database.ChunkSets.fingerprint == fingerprint).with_for_update()
+            )).scalars().first()
+            if chunk_set is None:
+                # first upload of this content -> this document owns the vectors
+                chunk_set = database.ChunkSets(fingerprint=fingerprint, vector_doc_id=doc_id, ref_count=1, status="processing")
+                db.add(chunk_set)
+                await db.flush()
+                doc.chunk_set_id = chunk_set.id
+                await db.commit()
+                return chunk_set.id, False
+            if chunk_set.status == "done":
+                # already ingested -> reuse chunks and vectors
+                chunk_set.ref_count += 1
+                doc.chunk_set_id = chunk_set.id
+                await db.commit()
+                return chunk_set.id, True
+            # same content is still being ingested -> process independently
+            await db.rollback()
+            return None, False
+        except IntegrityError:
+            await db.rollback()
+            return None, False
+
+async def fn_complete_chunk_set(chunk_set_id: int, doc_id: int, success: bool):
+    async with database.async_rdb_session() as db:
+        chunk_set = await db.get(database.ChunkSets, chunk_set_id)
+        if chunk_set is None:
+            return
+        if success:
+            chunk_set.status = "done"
         else:
-            doc.progress += int(max_progress_value - doc.progress)
-        db.commit()
-        return True
+            # partially ingested content must not be reused
+            await db.delete(chunk_set)
+            doc = await db.get(database.Documents, doc_id)
+            if doc is not None:
+                doc.chunk_set_id = None
+        await db.commit()
+
+async def fn_ingest(file_obj, parser, chunkers, doc_id, proc_type, content_hash, collection):
+    chunk_set_id, reused = await fn_link_chunk_set(doc_id, proc_type, content_hash)
+    if reused:
+        metrics.log_sampled("ingest_reused", doc_id=doc_id, chunk_set_id=chunk_set_id)
+        tracker.start(doc_id, 0)
+        tracker.finish(doc_id)
+        await tracker.flush()
+        return
+
+    success = False
+    tracker.start(doc_id, len(chunkers))
+    try:
+        tracker.set_stage(doc_id, "parsing")
+        with metrics.PARSE_SECONDS.labels(type(parser).__name__).time(), tracing.tracer.start_as_current_span("parse", attributes={"parser": type(parser).__name__}):
+            # parsing is CPU bound and may wait for a converter slot: keep it off the event loop
+            page_container = await asyncio.to_thread(parser.parse, file_obj)
+        with tracing.tracer.start_as_current_span("save_pages"):
+            await fn_save_pages(doc_id, fingerprint_pages(page_container))
+
+        await fn_process(page_container, chunkers, doc_id, collection)
+        tracker.finish(doc_id)
+        success = True
     except Exception as e:
-        print(f"ERROR in fn_update_progress -> msg={e}")
-        db.rollback()
-        return False
-
-async def fn_process(page_conatiner, chunkers, doc_id, db, collection, batch_size=4):
-    max_progress_value = 100.0 / len(chunkers)
-    for idx, chunker in enumerate(chunkers):
-        chunk_generator = chunker.chunk(page_conatiner)
-        total_chunks = next(chunk_generator)
-        # chunking, embedding, loading
-        data = []
-        for chunk in chunk_generator:
-            data.append(chunk)
-            if len(data) >= batch_size:
-                # Insert vector
-                if await fn_insert_vector(data, doc_id, collection):
-                    # Update progress
-                    await fn_update_progress(data, doc_id, total_chunks, max_progress_value, db)
-                data = []
-        if data:
-            # Insert vector
-            if await fn_insert_vector(data, doc_id, collection):
-                # Update progress
-                await fn_update_progress(None, doc_id, total_chunks, max_progress_value * (idx + 1), db)
+        tracker.finish(doc_id, error=str(e))
+        # batches stored before the failure must not show up in retrieval
+        try:
+            await asyncio.to_thread(fn_delete_vectors, doc_id, collection)
+            async with database.async_rdb_session() as db:
+                await db.execute(delete(database.DocumentPages).where(database.DocumentPages.doc_id == doc_id))
+                await db.commit()
+        except Exception as purge_error:
+            print(f"ERROR in fn_ingest -> doc_id={doc_id}, msg=failed to purge partial vectors: {purge_error}")
+        raise
+    finally:
+        # the final state is always persisted right away
+        await tracker.flush()
+        if chunk_set_id is not None:
+            await fn_complete_chunk_set(chunk_set_id, doc_id, success)
 
 @app.post("/api/document-manager/process-document")
 async def process_document(
@@ -88,53 +318,138 @@ async def process_document(
     extension: str = Form(...),
     proc_type: str = Form(...),
     doc_id: int = Form(...),
-    db: Session = Depends(database.GetRDB),
     collection: Collection = Depends(database.GetVectorDB)
 ):  
-    print(f"extension={extension}, proc_type={proc_type}, doc_id={doc_id}")
-    if proc_type == "text":
-        if extension in ["txt"]:
-            parser = ParserTXT()
-            chunkers = [RuleBasedTextChunker(), LLMBasedTextChunker(llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"))]
-        elif extension in ["pdf"]:
-            parser = ParserPDF()
-            chunkers = [RuleBasedTextChunker(), LLMBasedTextChunker(llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"))]
-        else:
-            raise HTTPException(status_code=400, detail=f"Invalid file extension (extension={extension}, proc_type={proc_type})")
-    elif proc_type == "image":
-        if extension in ["pptx"]:
-            parser = ParserPPTX()
-            chunkers = [LLMBasedImageChunker(llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"))]
-        elif extension in ["pdf"]:
-            parser = ParserPDFImage()
-            chunkers = [LLMBasedImageChunker(llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"))]
-        elif extension in ["jpeg", "jpg", "png"]:
-            parser = ParserImage()
-            chunkers = [LLMBasedImageChunker(llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"))]
-        else:
-            raise HTTPException(status_code=400, detail=f"Invalid file extension (extension={extension}, proc_type={proc_type})")            
-    elif proc_type == "plain":
-        parser = ParserTXT()
-        chunkers = [RuleBasedTextChunker(), LLMBasedTextChunker(llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"))]
-    else:
-        raise HTTPException(status_code=400, detail=f"Invalid processing type (proc_type={proc_type})")
-
-    print("parsing")
+    metrics.log_sampled("process_document", extension=extension, proc_type=proc_type, doc_id=doc_id)
+    parser, chunkers = fn_create_pipeline(extension, proc_type)
     file_content = await file.read()
-    page_container = parser.parse(io.BytesIO(file_content))
-    print("end parsing")
-
-    print("start processing")
-    await fn_process(page_container, chunkers, doc_id, db, collection)
-    print("end processing")
+    content_hash = hashlib.sha256(file_content).hexdigest()
+    await fn_ingest(io.BytesIO(file_content), parser, chunkers, doc_id, proc_type, content_hash, collection)
+    return {"message": "Request received successfully"}
 
+@app.post("/api/document-manager/process-document-ref")
+async def process_document_ref(
+    form_data: schemas.RequestProcessDocument,
+    collection: Collection = Depends(database.GetVectorDB)
+):
+    metrics.log_sampled("process_document_ref", extension=form_data.extension, proc_type=form_data.proc_type, doc_id=form_data.doc_id, file_path=form_data.file_path)
+    parser, chunkers = fn_create_pipeline(form_data.extension, form_data.proc_type)
+    try:
+        file_obj = open_spooled_file(form_data.file_path)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with file_obj:
+        content_hash = form_data.content_hash if form_data.content_hash else hash_file(file_obj)
+        await fn_ingest(file_obj, parser, chunkers, form_data.doc_id, form_data.proc_type, content_hash, collection)
     return {"message": "Request received successfully"}
 
-def fn_vector_search(query_vector: List[float], collection: Collection) -> list[schemas.RetrieveDocument]:
-    results = collection.search(
-        data=query_vector, anns_field="vector", param={"metric_type": "IP", "params": {"nprobe": os.getenv("MILVUS_SEARCH_CLUSTERS")}}, limit=5,
-        output_fields=["doc_id", "page_number", "chunk_content"],
-    )[0]
+@app.post("/api/document-manager/delete-document")
+async def delete_document(
+    form_data: schemas.RequestDeleteDocument,
+    collection: Collection = Depends(database.GetVectorDB)
+):
+    result = await fn_release_vectors(form_data.doc_id, collection)
+    message = "Document vectors purged" if result["purged"] else "Document reference released"
+    return {"message": message, **result}
+
+async def fn_replace(file_obj, parser, chunkers, doc_id, proc_type, content_hash, collection):
+    async with database.async_rdb_session() as db:
+        doc = await db.get(database.Documents, doc_id)
+        if doc is None:
+            raise HTTPException(status_code=404, detail=f"Document not found (doc_id={doc_id})")
+        chunk_set = None if doc.chunk_set_id is None else await db.get(database.ChunkSets, doc.chunk_set_id)
+        vector_doc_id = doc.id if chunk_set is None else chunk_set.vector_doc_id
+        reusable = (await db.execute(
+            select(database.ChunkSets.id).where(
+                database.ChunkSets.fingerprint == f"{content_hash}:{proc_type}",
+                database.ChunkSets.status == "done",
+            )
+        )).first()
+        old_pages = [tuple(row) for row in (await db.execute(
+            select(database.DocumentPages.page_number, database.DocumentPages.fingerprint).where(
+                database.DocumentPages.doc_id == vector_doc_id
+            )
+        )).all()]
+
+    # shared chunks must not be modified, reusable content needs no work, legacy documents have no page fingerprints
+    if ((chunk_set is not None) and (chunk_set.ref_count > 1)) or (reusable is not None) or (not old_pages):
+        await fn_release_vectors(doc_id, collection)
+        await fn_ingest(file_obj, parser, chunkers, doc_id, proc_type, content_hash, collection)
+        return {"mode": "full"}
+
+    tracker.start(doc_id, 0)
+    try:
+        tracker.set_stage(doc_id, "parsing")
+        with metrics.PARSE_SECONDS.labels(type(parser).__name__).time(), tracing.tracer.start_as_current_span("parse", attributes={"parser": type(parser).__name__}):
+            page_container = await asyncio.to_thread(parser.parse, file_obj)
+        new_pages = fingerprint_pages(page_container)
+        matched, removed, changed = diff_pages(old_pages, new_pages)
+        # changed pages are redone together with their neighbours, whose chunks may hold text of the changed page
+        stale, affected = affected_pages(matched, removed, changed)
+        windows = group_windows(affected)
+        metrics.log_sampled("replace", doc_id=doc_id, unchanged=len(matched), removed=len(removed), changed=len(changed), rechunked=len(affected), windows=len(windows))
+
+        tracker.start(doc_id, len(chunkers) * len(windows))
+        # tombstone vectors whose pages disappeared, changed or border a change
+        if stale:
+            await asyncio.to_thread(fn_delete_vectors, vector_doc_id, collection, stale)
+        # unchanged pages that moved keep their chunk ids, only page_number is rewritten
+        shifted = {old: new for old, new in matched.items() if (old != new) and (old not in stale)}
+        if shifted:
+            await asyncio.to_thread(fn_shift_vectors, vector_doc_id, shifted, collection)
+        # re-chunk and re-embed only the affected page windows
+        for window_idx, window in enumerate(windows):
+            window_container = page_container[page_container["page_number"].isin(window)].reset_index(drop=True)
+            await fn_process(window_container, chunkers, doc_id, collection, vector_doc_id=vector_doc_id, progress_offset=window_idx * len(chunkers))
+
+        # only once every window is stored
+        await fn_save_pages(vector_doc_id, new_pages)
+        async with database.async_rdb_session() as db:
+            doc = await db.get(database.Documents, doc_id)
+            doc.content_hash = content_hash
+            if doc.chunk_set_id is not None:
+                chunk_set = await db.get(database.ChunkSets, doc.chunk_set_id)
+                chunk_set.fingerprint = f"{content_hash}:{proc_type}"
+            await db.commit()
+        tracker.finish(doc_id)
+    except Exception as e:
+        tracker.finish(doc_id, error=str(e))
+        # pages may already be shifted or tombstoned: without fingerprints the next replace re-ingests the whole document
+        try:
+            async with database.async_rdb_session() as db:
+                await db.execute(delete(database.DocumentPages).where(database.DocumentPages.doc_id == vector_doc_id))
+                await db.commit()
+        except Exception as reset_error:
+            print(f"ERROR in fn_replace -> doc_id={doc_id}, msg=failed to reset page fingerprints: {reset_error}")
+        raise
+    finally:
+        await tracker.flush()
+    return {"mode": "incremental", "unchanged": len(matched), "removed": len(removed), "changed": len(changed), "rechunked": len(affected)}
+
+@app.post("/api/document-manager/replace-document-ref")
+async def replace_document_ref(
+    form_data: schemas.RequestProcessDocument,
+    collection: Collection = Depends(database.GetVectorDB)
+):
+    metrics.log_sampled("replace_document_ref", extension=form_data.extension, proc_type=form_data.proc_type, doc_id=form_data.doc_id, file_path=form_data.file_path)
+    parser, chunkers = fn_create_pipeline(form_data.extension, form_data.proc_type)
+    try:
+        file_obj = open_spooled_file(form_data.file_path)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with file_obj:
+        content_hash = form_data.content_hash if form_data.content_hash else hash_file(file_obj)
+        result = await fn_replace(file_obj, parser, chunkers, form_data.doc_id, form_data.proc_type, content_hash, collection)
+    return {"message": "Request received successfully", **result}
+
+def fn_vector_search(query_vector: List[float], collection: Collection, with_vectors: bool = False) -> list[schemas.RetrieveDocument]:
+    # stored vectors are only fetched when the selection needs them (RERANK_MODE=mmr)
+    output_fields = ["doc_id", "page_number", "chunk_content"] + (["vector"] if with_vectors else [])
+    with metrics.MILVUS_SECONDS.labels("search").time():
+        results = collection.search(
+            data=query_vector, anns_field="vector", param={"metric_type": "IP", "params": {"nprobe": os.getenv("MILVUS_SEARCH_CLUSTERS")}}, limit=5,
+            output_fields=output_fields,
+        )[0]
 
     searched_chunks = []
     if len(results) > 0:
@@ -142,8 +457,7 @@ def fn_vector_search(query_vector: List[float], collection: Collection) -> list[
         dynamic_threshold = (results.distances[0] * (1 - float(os.getenv("DYNAMIC_SCORE_THRESHOLD", 0.15)))) \
             if os.getenv("DYNAMIC_SCORE_THRESHOLD_STRATEGY", "pct") == "pct" \
             else (results.distances[0] - float(os.getenv("DYNAMIC_SCORE_THRESHOLD", 0.5)))
-        print(f"fn_vector_search / top1_score: {round(results.distances[0], 5)}, static_threshold={round(static_threshold, 5)}, dynamic_threshold={round(dynamic_threshold, 5)}")
-        
+        dropped = []
         for res in results:
             if (res.distance > dynamic_threshold) and (res.distance > static_threshold):
                 searched_chunks.append(schemas.RetrieveDocument(
@@ -151,23 +465,31 @@ def fn_vector_search(query_vector: List[float], collection: Collection) -> list[
                     doc_id=res.entity.get('doc_id'),
                     chunk_content=res.entity.get('chunk_content'),
                     page_number=res.entity.get('page_number'),
-                    score=res.distance
+                    score=res.distance,
+                    vector=res.entity.get('vector'),
                 ))
-                print(f"fn_vector_search / selected item -> (id: {res.id}, distance: {round(res.distance, 5)})")
             else:
-                print(f"fn_vector_search / dropped item -> (id: {res.id}, distance: {round(res.distance, 5)})")
+                dropped.append((res.id, round(res.distance, 5)))
+        metrics.log_sampled(
+            "vector_search", top1_score=round(results.distances[0], 5), static_threshold=round(static_threshold, 5), dynamic_threshold=round(dynamic_threshold, 5),
+            selected=[(doc.id, round(doc.score, 5)) for doc in searched_chunks], dropped=dropped,
+        )
 
     return searched_chunks
 
-def fn_retrieve_chunks(history_messages: list[schemas.ChatMessage], collection: Collection) -> list[list[schemas.RetrieveDocument]]:
+def fn_retrieve_chunks(history_messages: list[schemas.ChatMessage], collection: Collection, mode: str = "score") -> list[list[schemas.RetrieveDocument]]:
     # reverse history messages
     retrieve_chunks = []
     history_messages = history_messages[::-1]
     current_message = history_messages[0]
 
     # process on current message
-    query_vector = embedder.embed([current_message.user])
-    searched_chunks = fn_vector_search(query_vector, collection)
+    with metrics.EMBED_SECONDS.time(), tracing.tracer.start_as_current_span("embed_query"):
+        query_vector = registry.get("embedder").embed([current_message.user])
+    metrics.EMBED_BATCH_SIZE.observe(1)
+    with tracing.tracer.start_as_current_span("vector_search") as span:
+        searched_chunks = fn_vector_search(query_vector, collection, with_vectors=(mode == "mmr"))
+        span.set_attribute("searched_chunks", len(searched_chunks))
     retrieve_chunks.append(searched_chunks)
 
     if len(history_messages) > 1:
@@ -176,15 +498,18 @@ def fn_retrieve_chunks(history_messages: list[schemas.ChatMessage], collection:
         for msg in history_messages:
             if isinstance(msg.chunk_ids, list):
                 if len(msg.chunk_ids) == 0:
-                    print(f"fn_retrieve_chunks / chunk_ids is empty / user_input={msg.user}")
+                    metrics.log_sampled("history_chunks_missing", reason="chunk_ids is empty")
                     retrieve_chunks.append([])
                 else:
-                    results = collection.query(
-                        expr=f"id in {msg.chunk_ids}",
-                        output_fields=["doc_id", "page_number", "chunk_content"],
-                    )
+                    # history chunks are scored against their stored vectors in both modes (cheaper than embedding them again)
+                    with metrics.MILVUS_SECONDS.labels("query").time(), tracing.tracer.start_as_current_span("history_query", attributes={"chunk_ids": len(msg.chunk_ids)}):
+                        results = collection.query(
+                            expr=f"id in {msg.chunk_ids}",
+                            output_fields=["doc_id", "page_number", "chunk_content", "vector"],
+                        )
                     if len(results) > 0:
-                        scores = (np.array(query_vector) @ np.array(embedder.embed([res.get('chunk_content') for res in results])).T)[0]
+                        # stored vectors are already normalized: no need to embed the chunks again
+                        scores = (np.array(query_vector) @ np.array([res.get('vector') for res in results]).T)[0]
                         msg_chunks = []
                         for res, score in zip(results, scores):
                             msg_chunks.append(
@@ -193,20 +518,25 @@ def fn_retrieve_chunks(history_messages: list[schemas.ChatMessage], collection:
                                     doc_id=res.get('doc_id'),
                                     chunk_content=res.get('chunk_content'),
                                     page_number=res.get('page_number'),
-                                    score=score
+                                    score=score,
+                                    vector=res.get('vector') if mode == "mmr" else None,
                                 )   
                             )
                         retrieve_chunks.append(msg_chunks)
                     else:
-                        print(f"fn_retrieve_chunks / results is empty / user_input={msg.user}, chunk_ids={msg.chunk_ids}")
+                        metrics.log_sampled("history_chunks_missing", reason="results is empty", chunk_ids=msg.chunk_ids)
                         retrieve_chunks.append([])
             else:
-                print(f"fn_retrieve_chunks / chunk_ids is None / user_input={msg.user}")
+                metrics.log_sampled("history_chunks_missing", reason="chunk_ids is None")
                 retrieve_chunks.append([])
 
     return searched_chunks, retrieve_chunks[::-1]
 
-def fn_rerank_chunks(retrieve_chunks: list[list[schemas.RetrieveDocument]]) -> list[schemas.RetrieveDocument]:
+def fn_rerank_chunks(retrieve_chunks: list[list[schemas.RetrieveDocument]], mode: str | None = None) -> tuple[list[schemas.RetrieveDocument], dict]:
+    # mode: "score" (top-k by decayed score) or "mmr" (top-k with redundant chunks skipped, see selection.mmr_select)
+    mode = os.getenv("RERANK_MODE", "score") if mode is None else mode
+    started_at = time.perf_counter()
+    k = int(os.getenv("NUM_RETRIEVE_DOCS"))
     multiplier = np.logspace(0, 1, len(retrieve_chunks))
     multiplier /= multiplier.max()
     score_container = {}
@@ -217,19 +547,67 @@ def fn_rerank_chunks(retrieve_chunks: list[list[schemas.RetrieveDocument]]) -> l
             else:
                 score_container[doc.id]["score"] = max(score_container[doc.id]["score"], doc.score * m)
     sorted_keys = sorted(score_container.keys(), key=lambda x: score_container[x]["score"], reverse=True)
-    reranked_chunks = []
-    for k in sorted_keys[:int(os.getenv("NUM_RETRIEVE_DOCS"))]:
-        print(f"fn_rerank_chunks / final selected item -> (id={score_container[k]['doc'].id}, score={score_container[k]['score']})")
-        reranked_chunks.append(score_container[k]["doc"])
-    return reranked_chunks
+    baseline_keys = sorted_keys[:k]
+    if mode == "mmr" and sorted_keys:
+        candidates = [score_container[key]["doc"] for key in sorted_keys]
+        dim = max((len(doc.vector) for doc in candidates if doc.vector), default=1)
+        vectors = np.array([doc.vector if doc.vector else [0.0] * dim for doc in candidates], dtype=np.float32)
+        relevance = np.array([score_container[key]["score"] for key in sorted_keys])
+        selected_keys = [sorted_keys[i] for i in mmr_select(
+            relevance, vectors, k,
+            mmr_lambda=float(os.getenv("RERANK_MMR_LAMBDA", 0.7)),
+            redundancy_threshold=float(os.getenv("RERANK_REDUNDANCY_THRESHOLD", 0.9)),
+        )]
+    else:
+        selected_keys = baseline_keys
+    reranked_chunks = [score_container[key]["doc"] for key in selected_keys]
+    metrics.RERANK_SECONDS.labels(mode).observe(time.perf_counter() - started_at)
+
+    # tokens saved against the plain top-k selection
+    selection = {"mode": mode, **token_report([score_container[key]["doc"] for key in baseline_keys], reranked_chunks)}
+    metrics.log_sampled(
+        "rerank", mode=mode, selected=[(key, round(score_container[key]["score"], 5)) for key in selected_keys],
+        tokens_baseline=selection["tokens_baseline"], tokens_saved=selection["tokens_saved"],
+    )
+    return reranked_chunks, selection
+
+async def fn_resolve_doc_ids(chat_id: int, vector_doc_ids: set[int]) -> dict[int, int]:
+    # vectors of reused content are stored under the owner's doc_id: point sources at the chat user's own document
+    if not vector_doc_ids:
+        return {}
+    async with database.async_rdb_session() as db:
+        rows = (await db.execute(
+            select(database.ChunkSets.vector_doc_id, database.Documents.id)
+            .join(database.Documents, database.Documents.chunk_set_id == database.ChunkSets.id)
+            .join(database.Chats, database.Chats.username == database.Documents.user_username)
+            .where(database.Chats.id == chat_id, database.ChunkSets.vector_doc_id.in_(vector_doc_ids))
+            .order_by(database.Documents.id)
+        )).all()
+    doc_ids = {}
+    for vector_doc_id, doc_id in rows:
+        if (vector_doc_id not in doc_ids) or (doc_id == vector_doc_id):
+            doc_ids[vector_doc_id] = doc_id
+    return doc_ids
 
 @app.post("/api/document-manager/retrieval")
 async def retrieval(
     form_data: schemas.RequestRetrieveDocument,
     collection: Collection = Depends(database.GetVectorDB)
 ):  
-    # retrieve chunks
-    searched_chunks, retrieved_chunks = fn_retrieve_chunks(form_data.messages, collection)
-    # rerank chunks
-    retrieved_chunks = fn_rerank_chunks(retrieved_chunks)
-    return {"searched_docs": searched_chunks, "retrieved_docs": retrieved_chunks}
\ No newline at end of file
+    with metrics.RETRIEVAL_SECONDS.time():
+        mode = os.getenv("RERANK_MODE", "score")
+        # retrieve chunks
+        searched_chunks, retrieved_chunks = fn_retrieve_chunks(form_data.messages, collection, mode)
+        # rerank chunks
+        with tracing.tracer.start_as_current_span("rerank") as span:
+            retrieved_chunks, selection = fn_rerank_chunks(retrieved_chunks, mode)
+            span.set_attributes({"mode": selection["mode"], "selected": len(retrieved_chunks), "tokens_saved": selection["tokens_saved"]})
+        doc_ids = await fn_resolve_doc_ids(form_data.chat_id, {doc.doc_id for doc in searched_chunks + retrieved_chunks})
+        for doc in searched_chunks + retrieved_chunks:
+            doc.doc_id = doc_ids.get(doc.doc_id, doc.doc_id)
+    return {"searched_docs": searched_chunks, "retrieved_docs": retrieved_chunks, "selection": selection}
+
+# PRELOAD_COMPONENTS=embedder with a pre-forking server (gunicorn --preload -k uvicorn.workers.UvicornWorker):
+# the model is loaded once in the master and its pages are shared copy-on-write by the workers (CPU only: CUDA cannot be initialized before fork)
+if os.getenv("PRELOAD_COMPONENTS"):
+    registry.preload([name.strip() for name in os.getenv("PRELOAD_COMPONENTS").split(",") if name.strip()])
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import random
+import threading
+from dotenv import load_dotenv
+load_dotenv()
+# PROMETHEUS_MULTIPROC_DIR is read when prometheus_client is imported (hence after load_dotenv): with a pre-forking
+# server (gunicorn, several workers) every worker writes its values there and a scrape aggregates all of them
+from prometheus_client import Histogram, Counter, Gauge, CollectorRegistry, multiprocess, generate_latest, CONTENT_TYPE_LATEST
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+PARSE_SECONDS = Histogram("docmgr_parse_seconds", "Document parsing duration", ["parser"], buckets=LATENCY_BUCKETS)
+CHUNK_SECONDS = Histogram("docmgr_chunk_batch_seconds", "Time to produce one batch of chunks", ["chunker"], buckets=LATENCY_BUCKETS)
+LLM_CALL_SECONDS = Histogram("docmgr_llm_call_seconds", "Chunker LLM call duration (excluding scheduler wait)", ["outcome"], buckets=LATENCY_BUCKETS)
+EMBED_BATCH_SIZE = Histogram("docmgr_embed_batch_size", "Texts per embedding call", buckets=(1, 4, 16, 32, 64, 128, 256, 512, 1024, 4096))
+EMBED_SECONDS = Histogram("docmgr_embed_seconds", "Embedding call duration", buckets=LATENCY_BUCKETS)
+MILVUS_SECONDS = Histogram("docmgr_milvus_seconds", "Milvus operation duration", ["operation"], buckets=LATENCY_BUCKETS)
+RERANK_SECONDS = Histogram("docmgr_rerank_seconds", "fn_rerank_chunks duration", ["mode"], buckets=LATENCY_BUCKETS)
+RETRIEVAL_SECONDS = Histogram("docmgr_retrieval_seconds", "Retrieval endpoint end-to-end duration", buckets=LATENCY_BUCKETS)
+CHUNKS_STORED = Counter("docmgr_chunks_stored_total", "Chunks embedded and stored")
+CHUNKS_DEDUPLICATED = Counter("docmgr_chunks_deduplicated_total", "Chunks dropped as near-duplicates")
+# encoded: every page image sent to the vision model; baseline / baseline_encoded: sampled pages, the previous
+# full-resolution PNG and the image now sent instead (saved = baseline - baseline_encoded)
+IMAGE_BYTES = Counter("docmgr_image_bytes_total", "Page image bytes sent to the vision model", ["kind"])
+QUEUE_DEPTH = Gauge("docmgr_queue_depth", "Items waiting in ingestion queues", ["queue"], multiprocess_mode="livesum")
+
+queue_functions = {}
+sampler_pid = None
+
+def sample_queues(interval: float):
+    while True:
+        for name, fn in list(queue_functions.items()):
+            try:
+                QUEUE_DEPTH.labels(name).set(fn())
+            except Exception as e:
+                print(f"ERROR in sample_queues -> name={name}, msg={e}")
+        time.sleep(interval)
+
+def start_sampler():
+    # called from the FastAPI lifespan, i.e. in each worker after the fork: a thread running in the parent at fork time
+    # could hold the metric file lock and deadlock the workers
+    global sampler_pid
+    if MULTIPROC_DIR and (sampler_pid != os.getpid()):
+        sampler_pid = os.getpid()
+        threading.Thread(target=sample_queues, args=(float(os.getenv("METRICS_SAMPLE_INTERVAL", 5.0)),), daemon=True).start()
+
+def register_queue(name: str, fn):
+    if not MULTIPROC_DIR:
+        # gauge evaluated at scrape time
+        QUEUE_DEPTH.labels(name).set_function(fn)
+        return
+    # multiprocess mode: the scraped worker cannot evaluate the other workers' queues, each worker writes its own
+    # value periodically (start_sampler) and the scrape sums the live workers
+    queue_functions[name] = fn
+
+def render_metrics():
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def child_exit(server, worker):
+    # gunicorn server hook, load it with "-c python:metrics": drops the live gauge values of an exited worker
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(worker.pid)
+
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+
+def log_sampled(event: str, sample_rate: float | None = None, **fields):
+    # structured log line for hot paths, written for a fraction of the calls only
+    if random.random() < (LOG_SAMPLE_RATE if sample_rate is None else sample_rate):
+        print(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, ensure_ascii=False, default=str))
@@ -1,12 +1,117 @@
 import os
 import io
+import hashlib
+import shutil
 import base64
+import numpy as np
 import pandas as pd
 import pdfplumber
 from operator import itemgetter
 from PIL import Image
 import uuid
-import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from cache import get_pipeline_cache, make_key
+from image_preprocess import ImagePreprocessor, report_bytes_saved
+from converter import get_converter_pool, ConversionError
+from dotenv import load_dotenv
+load_dotenv()
+
+process_pools = {}
+
+def get_process_pool(n_workers: int):
+    # spawn (not fork): the service process holds threads, sockets and model weights
+    if n_workers not in process_pools:
+        process_pools[n_workers] = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"))
+    return process_pools[n_workers]
+
+def get_pdf_source(file_obj):
+    # workers open the PDF independently: pass a path when the file is on disk, bytes otherwise
+    if isinstance(file_obj, (str, os.PathLike)):
+        return os.fspath(file_obj)
+    name = getattr(file_obj, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name
+    file_obj.seek(0)
+    data = file_obj.read()
+    file_obj.seek(0)
+    return data
+
+def split_page_range(n_pages: int, n_workers: int, min_pages_per_worker: int):
+    n_tasks = max(1, min(n_workers * 2, n_pages // max(min_pages_per_worker, 1)))
+    size, remainder = divmod(n_pages, n_tasks)
+    ranges, start = [], 0
+    for i in range(n_tasks):
+        end = start + size + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def parse_pdf_pages(source, start: int, end: int):
+    parser = ParserPDF(n_workers=1)
+    with pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source)) as doc:
+        return [
+            {"page_number": page_number + 1, "page_content": parser.get_page_data(doc.pages[page_number]).strip()}
+            for page_number in range(start, end)
+        ]
+
+def hash_file_obj(file_obj):
+    sha256 = hashlib.sha256()
+    for block in iter(lambda: file_obj.read(1024 * 1024), b""):
+        sha256.update(block)
+    file_obj.seek(0)
+    return sha256.hexdigest()
+
+def hash_source(source):
+    sha256 = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+    else:
+        sha256.update(source)
+    return sha256.hexdigest()
+
+def render_pdf_pages(source, start: int, end: int, resolution: int, preprocessor: ImagePreprocessor, file_hash: str | None = None):
+    # rendered pages are cached by file hash + page + resolution (+ preprocessing), so retries skip rendering
+    cache = get_pipeline_cache()
+    page_container, doc = [], None
+    try:
+        for page_number in range(start, end):
+            key = None if file_hash is None else make_key("pdf-page", file_hash, page_number, resolution, vars(preprocessor))
+            cached = None if key is None else cache.get_json("render", key)
+            if cached is not None:
+                # cached pages were measured when they were encoded: flagged so their savings are not reported again
+                page_container.append({**cached, "cached": True})
+                continue
+            if doc is None:
+                doc = pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source))
+            page = doc.pages[page_number]
+            img = page.to_image(resolution=preprocessor.render_resolution(page.width, page.height, resolution)).original
+            # baseline: the full-resolution PNG that was sent before preprocessing
+            item = {"page_number": page_number + 1, **preprocessor.process(img, baseline=lambda: page.to_image(resolution=resolution).original)}
+            if key is not None:
+                cache.set_json("render", key, item)
+            page_container.append({**item, "cached": False})
+    finally:
+        if doc is not None:
+            doc.close()
+    return page_container
+
+def render_pdf(file_obj, resolution: int, preprocessor: ImagePreprocessor, n_workers: int, min_pages_per_worker: int = 2):
+    source = get_pdf_source(file_obj)
+    file_hash = hash_source(source)
+    with pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source)) as doc:
+        n_pages = len(doc.pages)
+    if (n_workers <= 1) or (n_pages < min_pages_per_worker * 2):
+        return pd.DataFrame(render_pdf_pages(source, 0, n_pages, resolution, preprocessor, file_hash))
+    # parallel rendering and encoding, results are collected in page order
+    pool = get_process_pool(n_workers)
+    futures = [
+        pool.submit(render_pdf_pages, source, start, end, resolution, preprocessor, file_hash)
+        for start, end in split_page_range(n_pages, n_workers, min_pages_per_worker)
+    ]
+    return pd.DataFrame([page for future in futures for page in future.result()])
 
 class ParserTXT():
     def __init__(self):
@@ -21,8 +126,9 @@ class ParserTXT():
         return page_container
     
 class ParserPDF():
-    def __init__(self):
-        pass
+    def __init__(self, n_workers=None, min_pages_per_worker=8):
+        self.n_workers = int(os.getenv("PARSER_N_WORKERS", 1)) if n_workers is None else n_workers
+        self.min_pages_per_worker = min_pages_per_worker
     
     @staticmethod
     def is_overlap(box1, box2):
@@ -45,57 +151,90 @@ class ParserPDF():
         table = croppage.extract_table({"vertical_strategy": "lines", "explicit_vertical_lines": [edgel["x0"], edger["x1"]]})
         return [[]] if table is None else table
 
+    @staticmethod
+    def group_lines(contents: list[str], coords: np.ndarray):
+        # words sharing the same line key are joined in order of appearance, the line keeps the first word's coord
+        if len(contents) == 0:
+            return [], np.empty((0, 4))
+        keys = (coords[:, 1] + coords[:, 3] / 2).astype(int)
+        _, first_idx, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        # renumber lines by first appearance (np.unique sorts by key)
+        group_order = np.argsort(first_idx, kind="stable")
+        rank = np.empty_like(group_order)
+        rank[group_order] = np.arange(len(group_order))
+        line_ids = rank[inverse.reshape(-1)]
+        word_order = np.argsort(line_ids, kind="stable")
+        boundaries = np.flatnonzero(np.diff(line_ids[word_order])) + 1
+        lines = [" ".join(contents[i] for i in idx) for idx in np.split(word_order, boundaries)]
+        return lines, coords[first_idx[group_order]]
+
+    @staticmethod
+    def overlap_mask(boxes1: np.ndarray, boxes2: np.ndarray):
+        # (N, M) mask, same inclusive rule as is_overlap
+        if (len(boxes1) == 0) or (len(boxes2) == 0):
+            return np.zeros((len(boxes1), len(boxes2)), dtype=bool)
+        b1, b2 = boxes1[:, None, :], boxes2[None, :, :]
+        separated = (b1[..., 2] < b2[..., 0]) | (b2[..., 2] < b1[..., 0]) | (b1[..., 3] < b2[..., 1]) | (b2[..., 3] < b1[..., 1])
+        return ~separated
+
     def get_page_data(self, page):
-        page_data = {"text": [], "table": []}
         # create text data
-        for word in page.extract_words(keep_blank_chars=True):
-            page_data["text"].append({
-                "content": word["text"],
-                "coord": (word["x0"], word["top"], word["x1"], word["bottom"]),
-            })
-        # create table data
-        for table in page.find_tables():
-            data = self.extract_table(page, table)
-            if len(data) >= 2:
-                tb = pd.DataFrame(data[1:], columns=data[0])
-                tb.columns = tb.columns.fillna("")
-                tb = tb.fillna("")
-                tb = tb.drop(tb.columns[tb.nunique() == 1], axis=1)
-                page_data["table"].append({
-                    "content": tb.to_markdown(),
-                    "coord": table.bbox,
-                })
-        # create dataframe
-        page_data = {k: pd.DataFrame(v) for k, v in page_data.items()}
-        # post-processing for text
-        if len(page_data["text"]) > 0:
-            page_data["text"] = page_data["text"].groupby(page_data["text"]["coord"].apply(lambda x: (x[1] + x[3] / 2)).astype("int"), sort=False, as_index=False).agg({"content": " ".join, "coord": "first"})
-        # post-processing for table
-        if len(page_data["table"]) > 0:
-            page_data["table"] = page_data["table"].groupby(page_data["table"]["coord"].apply(lambda x: (x[1] + x[3] / 2)).astype("int"), sort=False, as_index=False).agg({"content": " ".join, "coord": "first"})
-            page_data["table"]["content"] = page_data["table"]["content"].apply(lambda x: f"<표>\n{x}\n</표>")
-            for tb_coord in page_data["table"]["coord"]:
-                mask = page_data["text"]["coord"].apply(lambda x: not self.is_overlap(x, tb_coord))
-                page_data["text"] = page_data["text"][mask].reset_index(drop=True)
-        df = pd.concat([pd.DataFrame(page_data["text"]), pd.DataFrame(page_data["table"])], axis=0).reset_index(drop=True)
-        df = df.iloc[df["coord"].apply(lambda x: x[1]).argsort()].reset_index(drop=True)
-        return "\n".join(df["content"])
+        words = page.extract_words(keep_blank_chars=True)
+        text_contents, text_coords = self.group_lines(
+            [word["text"] for word in words],
+            np.array([(word["x0"], word["top"], word["x1"], word["bottom"]) for word in words], dtype=float).reshape(-1, 4),
+        )
+        # create table data (table detection needs ruling lines -> skip pages without horizontal edges)
+        table_contents, table_coords = [], []
+        if page.horizontal_edges:
+            for table in page.find_tables():
+                data = self.extract_table(page, table)
+                if len(data) >= 2:
+                    tb = pd.DataFrame(data[1:], columns=data[0])
+                    tb.columns = tb.columns.fillna("")
+                    tb = tb.fillna("")
+                    tb = tb.drop(tb.columns[tb.nunique() == 1], axis=1)
+                    table_contents.append(tb.to_markdown())
+                    table_coords.append(table.bbox)
+        table_contents, table_coords = self.group_lines(table_contents, np.array(table_coords, dtype=float).reshape(-1, 4))
+        table_contents = [f"<표>\n{x}\n</표>" for x in table_contents]
+        # drop text lines overlapping tables
+        keep = ~self.overlap_mask(text_coords, table_coords).any(axis=1)
+        text_contents = [content for content, k in zip(text_contents, keep) if k]
+        text_coords = text_coords[keep]
+        # merge and sort by top coordinate
+        contents = text_contents + table_contents
+        order = np.argsort(np.concatenate([text_coords[:, 1], table_coords[:, 1]]), kind="stable")
+        return "\n".join(contents[i] for i in order)
 
-    def parse(self, file_obj: io.BytesIO):
-        doc = pdfplumber.open(file_obj)
-        page_container = []
-        for page_number, page in enumerate(doc.pages):
-            page_container.append({
-                "page_number": page_number + 1,
-                "page_content": self.get_page_data(page).strip(),
-            })
-        page_container = pd.DataFrame(page_container)
-        return page_container
+    def parse(self, file_obj: io.BytesIO, max_pages=None):
+        source = get_pdf_source(file_obj)
+        with pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source)) as doc:
+            n_pages = len(doc.pages) if max_pages is None else min(len(doc.pages), max_pages)
+            if (self.n_workers <= 1) or (n_pages < self.min_pages_per_worker * 2):
+                page_container = []
+                for page_number, page in enumerate(doc.pages[:n_pages]):
+                    page_container.append({
+                        "page_number": page_number + 1,
+                        "page_content": self.get_page_data(page).strip(),
+                    })
+                return pd.DataFrame(page_container)
+        # parallel: each worker parses a contiguous page range, results are collected in page order
+        pool = get_process_pool(self.n_workers)
+        futures = [
+            pool.submit(parse_pdf_pages, source, start, end)
+            for start, end in split_page_range(n_pages, self.n_workers, self.min_pages_per_worker)
+        ]
+        page_container = [page for future in futures for page in future.result()]
+        return pd.DataFrame(page_container)
 
 class ParserPPTX():
-    def __init__(self, cache_dir="./.cache/parser-pptx/", resolution=300):
-        self.cache_dir = cache_dir
+    def __init__(self, cache_dir="./.cache/parser-pptx/", resolution=300, converter_pool=None, preprocessor=None, n_workers=None):
+        self.cache_dir = os.path.abspath(cache_dir)
         self.resolution = resolution
+        self.converter_pool = converter_pool
+        self.preprocessor = ImagePreprocessor.from_env(os.getenv("CHUNK_MODEL_NAME")) if preprocessor is None else preprocessor
+        self.n_workers = int(os.getenv("IMAGE_N_WORKERS", 1)) if n_workers is None else n_workers
 
     @staticmethod
     def encode_image(buffer):
@@ -104,6 +243,12 @@ class ParserPPTX():
         return data
 
     def pptx_to_pdf(self, file_obj: io.BytesIO):
+        # converted PDFs are cached by the PPTX content hash
+        file_obj.seek(0)
+        cache_key = make_key("pptx-pdf", hash_file_obj(file_obj))
+        cached = get_pipeline_cache().get("render", cache_key)
+        if cached is not None:
+            return io.BytesIO(cached)
         if not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
         # 임시 PPTX 파일 생성
@@ -112,18 +257,19 @@ class ParserPPTX():
         dst_path = os.path.join(self.cache_dir, f"{file_id}.pdf")
         with open(src_path, 'wb') as f:
             file_obj.seek(0)
-            f.write(file_obj.read())
+            shutil.copyfileobj(file_obj, f)
         try:
-            # PPTX를 PDF로 변환
-            libreoffice_path = r'"C:\Program Files\LibreOffice\program\soffice.exe"' if platform.system() == "Windows" else "soffice"
-            os.system(f"{libreoffice_path} --headless --convert-to pdf --outdir {self.cache_dir} {src_path}")
+            # PPTX를 PDF로 변환 (공유 converter pool 사용, timeout 시 ConversionError)
+            converter_pool = get_converter_pool() if self.converter_pool is None else self.converter_pool
+            dst_path = converter_pool.convert(src_path, self.cache_dir)
             print(f"complete conversion from PPTX to PDF / output_path={dst_path}")
             with open(dst_path, 'rb') as f:
                 file_obj = io.BytesIO(f.read())
+            get_pipeline_cache().set("render", cache_key, file_obj.getvalue())
             return file_obj
-        except Exception as e:
+        except ConversionError as e:
             print(f"error in conversion -> {e}")
-            return None
+            raise
         finally:
             # 임시 파일 정리
             if os.path.exists(src_path):
@@ -133,28 +279,19 @@ class ParserPPTX():
 
     def parse(self, file_obj: io.BytesIO):
         try:
-            doc = pdfplumber.open(self.pptx_to_pdf(file_obj))
-            page_container = []
-            for page_number, page in enumerate(doc.pages):
-                print(f"page_number={page_number}")
-                buffer = io.BytesIO()
-                img = page.to_image(resolution=self.resolution).original
-                img.save(buffer, format="png")
-                page_container.append({
-                    "page_number": page_number + 1,
-                    "page_content": self.encode_image(buffer),
-                })
-            page_container = pd.DataFrame(page_container)
+            page_container = render_pdf(self.pptx_to_pdf(file_obj), self.resolution, self.preprocessor, self.n_workers)
+            report_bytes_saved(page_container, "(pptx) ")
             return page_container
+        except ConversionError:
+            raise
         except Exception as e:
             print(f"error in parsing -> {e}")
-        finally:
-            if 'buffer' in locals():
-                buffer.close()
 
 class ParserPDFImage():
-    def __init__(self, resolution=300):
+    def __init__(self, resolution=300, preprocessor=None, n_workers=None):
         self.resolution = resolution
+        self.preprocessor = ImagePreprocessor.from_env(os.getenv("CHUNK_MODEL_NAME")) if preprocessor is None else preprocessor
+        self.n_workers = int(os.getenv("IMAGE_N_WORKERS", 1)) if n_workers is None else n_workers
 
     @staticmethod
     def encode_image(buffer):
@@ -164,27 +301,15 @@ class ParserPDFImage():
     
     def parse(self, file_obj: io.BytesIO):
         try:
-            doc = pdfplumber.open(file_obj)
-            page_container = []
-            for page_number, page in enumerate(doc.pages):
-                buffer = io.BytesIO()
-                img = page.to_image(resolution=self.resolution).original
-                img.save(buffer, format="png")
-                page_container.append({
-                    "page_number": page_number + 1,
-                    "page_content": self.encode_image(buffer),
-                })
-            page_container = pd.DataFrame(page_container)
+            page_container = render_pdf(file_obj, self.resolution, self.preprocessor, self.n_workers)
+            report_bytes_saved(page_container, "(pdf) ")
             return page_container
         except Exception as e:
             print(f"error in parsing -> {e}")
-        finally:
-            if 'buffer' in locals():
-                buffer.close()
     
 class ParserImage():
-    def __init__(self):
-        pass
+    def __init__(self, preprocessor=None):
+        self.preprocessor = ImagePreprocessor.from_env(os.getenv("CHUNK_MODEL_NAME")) if preprocessor is None else preprocessor
 
     @staticmethod
     def encode_image(buffer):
@@ -193,16 +318,21 @@ class ParserImage():
         return data
     
     def parse(self, file_obj: io.BytesIO):
-        try:
+        cache = get_pipeline_cache()
+        file_obj.seek(0)
+        cache_key = make_key("image", hash_file_obj(file_obj), vars(self.preprocessor))
+        item = cache.get_json("render", cache_key)
+        cached = item is not None
+        if not cached:
             img = Image.open(file_obj)
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            page_container = [{
-                "page_number": 1,
-                "page_content": self.encode_image(buffer),
-            }]
-            page_container = pd.DataFrame(page_container)
-            return page_container
-        finally:
-            if 'buffer' in locals():
-                buffer.close()
+            img.load()
+            item = self.preprocessor.process(img)
+            cache.set_json("render", cache_key, item)
+        page_container = [{
+            "page_number": 1,
+            **item,
+            "cached": cached,
+        }]
+        page_container = pd.DataFrame(page_container)
+        report_bytes_saved(page_container, "(image) ")
+        return page_container
@@ -0,0 +1,270 @@
+import time
+import asyncio
+from collections import deque
+import metrics
+import tracing
+
+DONE = object()
+# queues of the running pipelines, summed into the docmgr_queue_depth gauge
+running_queues = {"chunk": set(), "embed": set(), "insert": set()}
+for name, queues in running_queues.items():
+    metrics.register_queue(f"pipeline_{name}", lambda queues=queues: sum(queue.qsize() for queue in queues))
+
+class StageStats():
+    def __init__(self, name: str, n_workers: int):
+        self.name = name
+        self.n_workers = n_workers
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+
+    def to_dict(self, elapsed: float):
+        capacity = max(elapsed * self.n_workers, 1e-9)
+        return {
+            "workers": self.n_workers,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            # waiting on a full downstream queue (backpressure)
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "utilization": round(min(self.busy_seconds / capacity, 1.0), 3),
+        }
+
+class PipelineError(Exception):
+    # raised by ChunkPipeline.run when a batch could not be embedded or stored; result holds the run statistics
+    def __init__(self, message: str, result: dict):
+        super().__init__(message)
+        self.result = result
+
+class ChunkPipeline():
+    """
+    chunk -> buffer -> embed -> insert, connected by bounded queues.
+    Every chunker produces concurrently (sync generators are advanced in worker threads, one batch per hop),
+    near-duplicates are dropped before they reach the buffer (dedup.MinHashDeduplicator, optional),
+    the buffer (insert_buffer.VectorInsertBuffer) cuts the chunk stream into large column batches,
+    embedding and insertion run in their own workers, and a full queue blocks the stage in front of it.
+
+    embed_fn(batch) -> batch with vectors, insert_fn(batch) -> None; both are sync and run in threads.
+    A failed batch does not stop the other workers, but run() raises PipelineError at the end: the vectors are incomplete.
+    on_total(chunker_idx, total), on_inserted(chunker_idx, n_chunks), on_chunker_done(chunker_idx) report progress.
+    """
+    def __init__(
+            self, buffer, embed_fn, insert_fn, on_total=None, on_inserted=None, on_chunker_done=None,
+            batch_size=4, queue_size=8, n_embed_workers=1, n_insert_workers=1, deduplicator=None,
+    ):
+        self.buffer = buffer
+        self.deduplicator = deduplicator
+        self.embed_fn = embed_fn
+        self.insert_fn = insert_fn
+        self.on_total = on_total or (lambda idx, total: None)
+        self.on_inserted = on_inserted or (lambda idx, n: None)
+        self.on_chunker_done = on_chunker_done or (lambda idx: None)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.n_embed_workers = n_embed_workers
+        self.n_insert_workers = n_insert_workers
+
+    @staticmethod
+    def next_batch(generator, batch_size):
+        batch = []
+        for item in generator:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                break
+        return batch
+
+    async def put(self, queue: asyncio.Queue, item, stats: StageStats):
+        start = time.perf_counter()
+        await queue.put(item)
+        stats.blocked_seconds += time.perf_counter() - start
+
+    async def run(self, chunkers, page_container):
+        chunk_queue = asyncio.Queue(maxsize=self.queue_size)
+        embed_queue = asyncio.Queue(maxsize=self.queue_size)
+        insert_queue = asyncio.Queue(maxsize=self.queue_size)
+        stats = {
+            "chunk": StageStats("chunk", len(chunkers)),
+            "embed": StageStats("embed", self.n_embed_workers),
+            "insert": StageStats("insert", self.n_insert_workers),
+        }
+        # rows not yet stored per chunker; a chunker is done when it stopped producing and nothing is pending
+        pending = [0] * len(chunkers)
+        producing = [True] * len(chunkers)
+
+        def release(idx, n_chunks, stored):
+            pending[idx] -= n_chunks
+            if stored:
+                self.on_inserted(idx, n_chunks)
+            if (not producing[idx]) and (pending[idx] == 0):
+                self.on_chunker_done(idx)
+
+        def settle(batch, stored):
+            for idx, n_chunks in batch.owner_counts().items():
+                release(idx, n_chunks, stored)
+
+        async def produce(idx, chunker):
+            with tracing.tracer.start_as_current_span("chunker", attributes={"chunker": type(chunker).__name__}) as span:
+                start = time.perf_counter()
+                generator = chunker.chunk(page_container)
+                total = await asyncio.to_thread(next, generator)
+                stats["chunk"].busy_seconds += time.perf_counter() - start
+                self.on_total(idx, total)
+                n_chunks = 0
+                while True:
+                    start = time.perf_counter()
+                    chunks = await asyncio.to_thread(self.next_batch, generator, self.batch_size)
+                    stats["chunk"].busy_seconds += time.perf_counter() - start
+                    if not chunks:
+                        break
+                    metrics.CHUNK_SECONDS.labels(type(chunker).__name__).observe(time.perf_counter() - start)
+                    stats["chunk"].batches += 1
+                    stats["chunk"].items += len(chunks)
+                    n_chunks += len(chunks)
+                    pending[idx] += len(chunks)
+                    await self.put(chunk_queue, (idx, chunks), stats["chunk"])
+                span.set_attribute("chunks", n_chunks)
+            producing[idx] = False
+            if pending[idx] == 0:
+                self.on_chunker_done(idx)
+
+        async def batch():
+            while True:
+                try:
+                    item = await asyncio.wait_for(chunk_queue.get(), timeout=self.buffer.time_to_flush())
+                except asyncio.TimeoutError:
+                    item = None
+                if item is DONE:
+                    chunk_queue.task_done()
+                    column_batch = self.buffer.drain("final")
+                    if column_batch is not None:
+                        await embed_queue.put(column_batch)
+                    return
+                if item is not None:
+                    idx, chunks = item
+                    if self.deduplicator is not None:
+                        # MinHash is CPU bound: off the event loop (batch() is the only caller, so calls never overlap)
+                        kept = await asyncio.to_thread(self.deduplicator.filter, idx, chunks)
+                        if len(kept) < len(chunks):
+                            # dropped duplicates are finished work: they count towards progress without being embedded
+                            release(idx, len(chunks) - len(kept), True)
+                            metrics.CHUNKS_DEDUPLICATED.inc(len(chunks) - len(kept))
+                        chunks = kept
+                    if chunks:
+                        self.buffer.add(idx, chunks)
+                    chunk_queue.task_done()
+                reason = self.buffer.flush_reason()
+                if reason is not None:
+                    await embed_queue.put(self.buffer.drain(reason))
+
+        async def embed():
+            while True:
+                column_batch = await embed_queue.get()
+                try:
+                    start = time.perf_counter()
+                    try:
+                        column_batch = await asyncio.to_thread(self.embed_fn, column_batch)
+                    except Exception as e:
+                        stats["embed"].errors += 1
+                        print(f"ERROR in ChunkPipeline.embed -> msg={e}")
+                        settle(column_batch, False)
+                        continue
+                    finally:
+                        stats["embed"].busy_seconds += time.perf_counter() - start
+                    stats["embed"].batches += 1
+                    stats["embed"].items += len(column_batch)
+                    await self.put(insert_queue, column_batch, stats["embed"])
+                finally:
+                    # only after the hand-off, so that joining the queues in order sees every batch
+                    embed_queue.task_done()
+
+        async def insert():
+            while True:
+                column_batch = await insert_queue.get()
+                start = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self.insert_fn, column_batch)
+                    stats["insert"].batches += 1
+                    stats["insert"].items += len(column_batch)
+                    settle(column_batch, True)
+                except Exception as e:
+                    stats["insert"].errors += 1
+                    print(f"ERROR in ChunkPipeline.insert -> msg={e}")
+                    settle(column_batch, False)
+                finally:
+                    stats["insert"].busy_seconds += time.perf_counter() - start
+                    insert_queue.task_done()
+
+        started_at = time.perf_counter()
+        for name, queue in [("chunk", chunk_queue), ("embed", embed_queue), ("insert", insert_queue)]:
+            running_queues[name].add(queue)
+        batcher = asyncio.create_task(batch())
+        workers = [asyncio.create_task(embed()) for _ in range(self.n_embed_workers)]
+        workers += [asyncio.create_task(insert()) for _ in range(self.n_insert_workers)]
+        producers = [asyncio.create_task(produce(idx, chunker)) for idx, chunker in enumerate(chunkers)]
+        try:
+            # a failing chunker fails the whole document, as before
+            await asyncio.gather(*producers)
+            await chunk_queue.put(DONE)
+            await batcher
+            await embed_queue.join()
+            await insert_queue.join()
+        finally:
+            for worker in producers + workers + [batcher]:
+                worker.cancel()
+            await asyncio.gather(*producers, *workers, batcher, return_exceptions=True)
+            for name, queue in [("chunk", chunk_queue), ("embed", embed_queue), ("insert", insert_queue)]:
+                running_queues[name].discard(queue)
+        elapsed = time.perf_counter() - started_at
+        result = {
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(stats["insert"].items / elapsed, 1) if elapsed > 0 else 0.0,
+            "flushes": dict(self.buffer.flush_reasons),
+            "dedup": None if self.deduplicator is None else self.deduplicator.stats(),
+            "stages": {name: stage.to_dict(elapsed) for name, stage in stats.items()},
+        }
+        if stats["embed"].errors or stats["insert"].errors:
+            raise PipelineError(
+                f"ChunkPipeline failed (embed_errors={stats['embed'].errors}, insert_errors={stats['insert'].errors})", result
+            )
+        return result
+
+class PipelineMonitor():
+    # recent pipeline runs, served by /api/document-manager/pipeline-stats
+    def __init__(self, max_runs: int = 50):
+        self.runs = deque(maxlen=max_runs)
+
+    def record(self, doc_id: int, result: dict):
+        self.runs.append({"doc_id": doc_id, "finished_at": time.time(), **result})
+        stages = result["stages"]
+        bottleneck = max(stages, key=lambda name: stages[name]["utilization"])
+        print(
+            f"pipeline / doc_id={doc_id}, elapsed={result['elapsed_seconds']}s, rows_per_second={result['rows_per_second']}, bottleneck={bottleneck}, "
+            + ", ".join(f"{name}={stage['utilization']:.0%}" for name, stage in stages.items())
+            + ("" if result.get("dedup") is None else f", dedup_dropped={result['dedup']['dropped']}/{result['dedup']['checked']}")
+        )
+
+    def summary(self):
+        totals = {}
+        for run in self.runs:
+            for name, stage in run["stages"].items():
+                total = totals.setdefault(name, {"busy_seconds": 0.0, "blocked_seconds": 0.0, "items": 0, "errors": 0, "capacity_seconds": 0.0})
+                total["busy_seconds"] += stage["busy_seconds"]
+                total["blocked_seconds"] += stage["blocked_seconds"]
+                total["items"] += stage["items"]
+                total["errors"] += stage["errors"]
+                total["capacity_seconds"] += run["elapsed_seconds"] * stage["workers"]
+        for total in totals.values():
+            total["utilization"] = round(total["busy_seconds"] / total["capacity_seconds"], 3) if total["capacity_seconds"] else 0.0
+        elapsed = sum(run["elapsed_seconds"] for run in self.runs)
+        rows = sum(run["stages"]["insert"]["items"] for run in self.runs)
+        return {
+            "runs": len(self.runs),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.0,
+            "stages": totals,
+            "recent": list(self.runs)[-10:],
+        }
+
+monitor = PipelineMonitor()
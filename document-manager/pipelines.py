@@ -0,0 +1,120 @@
+import os
+import threading
+from openai import OpenAI
+from parser import ParserTXT, ParserPDF, ParserPPTX, ParserPDFImage, ParserImage
+from chunker import RuleBasedTextChunker, LLMBasedTextChunker, LLMBasedImageChunker
+from dotenv import load_dotenv
+load_dotenv()
+
+class PipelineDefinition():
+    # parsers and chunkers keep no per-document state, one instance serves concurrent requests
+    def __init__(self, proc_type: str, extension: str, parser, chunkers: list):
+        self.proc_type = proc_type
+        self.extension = extension
+        self.parser = parser
+        self.chunkers = chunkers
+
+class PipelineRegistry():
+    """
+    Maps (proc_type, extension) to a parser and chunkers that are built once and shared by every request.
+    extension "*" matches any extension of the proc_type.
+    factory(registry) returns (parser, chunkers); it takes OpenAI clients and tokenizers from registry.shared(),
+    so the process keeps one connection pool per LLM server and loads each tokenizer once.
+
+    A new format is one call, e.g.
+        pipeline_registry.register("text", ["md"], lambda registry: (ParserTXT(), text_chunkers(registry)))
+    """
+    def __init__(self):
+        self.factories = {}
+        self.pipelines = {}
+        self.resources = {}
+        self.lock = threading.RLock()
+
+    def register(self, proc_type: str, extensions: list[str], factory):
+        with self.lock:
+            for extension in extensions:
+                self.factories[(proc_type, extension)] = factory
+                self.pipelines.pop((proc_type, extension), None)
+
+    def shared(self, key, factory):
+        with self.lock:
+            if key not in self.resources:
+                self.resources[key] = factory()
+            return self.resources[key]
+
+    def resolve(self, extension: str, proc_type: str):
+        for key in [(proc_type, extension), (proc_type, "*")]:
+            if key in self.factories:
+                return key
+        if all(registered != proc_type for registered, _ in self.factories):
+            raise ValueError(f"Invalid processing type (proc_type={proc_type})")
+        raise ValueError(f"Invalid file extension (extension={extension}, proc_type={proc_type})")
+
+    def get(self, extension: str, proc_type: str) -> PipelineDefinition:
+        key = self.resolve(extension, proc_type)
+        with self.lock:
+            if key not in self.pipelines:
+                parser, chunkers = self.factories[key](self)
+                self.pipelines[key] = PipelineDefinition(key[0], key[1], parser, chunkers)
+            return self.pipelines[key]
+
+    def build_all(self):
+        # a format that fails to build (e.g. missing API key) is left to be retried by its first request
+        for proc_type, extension in list(self.factories):
+            try:
+                self.get(extension, proc_type)
+            except Exception as e:
+                print(f"ERROR in PipelineRegistry.build_all -> proc_type={proc_type}, extension={extension}, msg={e}")
+        return self
+
+    def supported(self) -> dict[str, list[str]]:
+        formats = {}
+        for proc_type, extension in self.factories:
+            formats.setdefault(proc_type, []).append(extension)
+        return formats
+
+def llm_server_config() -> dict:
+    return {
+        "base_url": os.getenv("CHUNK_MODEL_URL", "http://localhost:9001/v1"),
+        "api_key": os.getenv("CHUNK_API_KEY", "token-abc123"),
+    }
+
+def llm_client(registry: PipelineRegistry):
+    if os.getenv("CHUNK_MODEL_TYPE") == "openai":
+        return registry.shared(("client", "openai"), lambda: OpenAI(max_retries=0))
+    config = llm_server_config()
+    return registry.shared(("client", config["base_url"]), lambda: OpenAI(**config, max_retries=0))
+
+def chunk_tokenizer(registry: PipelineRegistry):
+    # CHUNK_TOKENIZER_PATH unset: character based splitting, as before
+    tokenizer_path = os.getenv("CHUNK_TOKENIZER_PATH")
+    if not tokenizer_path:
+        return None
+    from transformers import AutoTokenizer
+    return registry.shared(("tokenizer", tokenizer_path), lambda: AutoTokenizer.from_pretrained(tokenizer_path))
+
+def text_chunkers(registry: PipelineRegistry) -> list:
+    tokenizer = chunk_tokenizer(registry)
+    return [
+        RuleBasedTextChunker(tokenizer=tokenizer),
+        LLMBasedTextChunker(
+            llm_server_config=llm_server_config(), llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"),
+            tokenizer=tokenizer, client=llm_client(registry),
+        ),
+    ]
+
+def image_chunkers(registry: PipelineRegistry) -> list:
+    return [
+        LLMBasedImageChunker(
+            llm_server_config=llm_server_config(), llm_model_type=os.getenv("CHUNK_MODEL_TYPE"), llm_model_name=os.getenv("CHUNK_MODEL_NAME"),
+            client=llm_client(registry),
+        ),
+    ]
+
+pipeline_registry = PipelineRegistry()
+pipeline_registry.register("text", ["txt"], lambda registry: (ParserTXT(), text_chunkers(registry)))
+pipeline_registry.register("text", ["pdf"], lambda registry: (ParserPDF(), text_chunkers(registry)))
+pipeline_registry.register("image", ["pptx"], lambda registry: (ParserPPTX(), image_chunkers(registry)))
+pipeline_registry.register("image", ["pdf"], lambda registry: (ParserPDFImage(), image_chunkers(registry)))
+pipeline_registry.register("image", ["jpeg", "jpg", "png"], lambda registry: (ParserImage(), image_chunkers(registry)))
+pipeline_registry.register("plain", ["*"], lambda registry: (ParserTXT(), text_chunkers(registry)))
@@ -0,0 +1,218 @@
+import os
+import time
+import asyncio
+import threading
+from collections import Counter
+from sqlalchemy import select, update
+import database
+
+class JobProgress():
+    def __init__(self, doc_id: int, n_chunkers: int):
+        self.doc_id = doc_id
+        self.stage = "queued"
+        self.chunk_totals = [None] * n_chunkers
+        self.chunk_dones = [0] * n_chunkers
+        self.started_at = time.time()
+        self.chunking_started_at = None
+        self.updated_at = self.started_at
+        self.finished_at = None
+        self.error = None
+
+    @property
+    def chunks_total(self):
+        return sum(total for total in self.chunk_totals if total is not None)
+
+    @property
+    def chunks_done(self):
+        return sum(self.chunk_dones)
+
+    @property
+    def progress(self):
+        # 100 and -1 are terminal: progress streams stop following the document
+        if self.stage == "done":
+            return 100
+        if self.stage == "failed":
+            return -1
+        if len(self.chunk_totals) == 0:
+            return 0
+        ratios = []
+        for done, total in zip(self.chunk_dones, self.chunk_totals):
+            if total is None:
+                ratios.append(0.0)
+            elif total == 0:
+                ratios.append(1.0)
+            else:
+                ratios.append(min(done / total, 1.0))
+        ratio = sum(ratios) / len(ratios)
+        # 100 is reserved for completed jobs
+        return min(int(ratio * 100), 99)
+
+    @property
+    def eta_seconds(self):
+        if (self.chunking_started_at is None) or (self.stage in ["done", "failed"]):
+            return None
+        ratio = self.progress / 100
+        if ratio <= 0:
+            return None
+        elapsed = time.time() - self.chunking_started_at
+        return round(elapsed * (1 - ratio) / ratio, 1)
+
+    def to_dict(self):
+        return {
+            "doc_id": self.doc_id,
+            "stage": self.stage,
+            "progress": self.progress,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "eta_seconds": self.eta_seconds,
+            "error": self.error,
+            "updated_at": self.updated_at,
+        }
+
+class ProgressTracker():
+    """
+    Keeps ingestion progress in memory and writes it to Postgres at a bounded rate.
+    Progress events are served from memory, so polling clients never touch the database.
+    Updates of evicted jobs (e.g. a document deleted while it was ingested) are ignored.
+    """
+    def __init__(self, flush_interval: float = 2.0, retention_seconds: float = 300.0, max_flush_retries: int = 5):
+        self.flush_interval = flush_interval
+        self.retention_seconds = retention_seconds
+        self.max_flush_retries = max_flush_retries
+        self.jobs = {}
+        self.dirty = set()
+        self.flush_failures = Counter()
+        self.lock = threading.Lock()
+        self.flush_task = None
+
+    def start(self, doc_id: int, n_chunkers: int):
+        with self.lock:
+            job = JobProgress(doc_id, n_chunkers)
+            self.jobs[doc_id] = job
+            self.dirty.add(doc_id)
+            return job
+
+    def set_stage(self, doc_id: int, stage: str):
+        with self.lock:
+            job = self.jobs.get(doc_id)
+            if job is None:
+                return
+            job.stage = stage
+            job.updated_at = time.time()
+
+    def set_total(self, doc_id: int, chunker_idx: int, total_chunks: int):
+        with self.lock:
+            job = self.jobs.get(doc_id)
+            if job is None:
+                return
+            job.chunk_totals[chunker_idx] = total_chunks
+            if job.chunking_started_at is None:
+                job.chunking_started_at = time.time()
+            job.updated_at = time.time()
+
+    def advance(self, doc_id: int, chunker_idx: int, n_chunks: int):
+        with self.lock:
+            job = self.jobs.get(doc_id)
+            if job is None:
+                return
+            job.chunk_dones[chunker_idx] += n_chunks
+            job.updated_at = time.time()
+            self.dirty.add(doc_id)
+
+    def complete_chunker(self, doc_id: int, chunker_idx: int):
+        with self.lock:
+            job = self.jobs.get(doc_id)
+            if job is None:
+                return
+            # some chunks may be skipped (e.g. failed generation), the chunker is finished anyway
+            if job.chunk_totals[chunker_idx] is None:
+                job.chunk_totals[chunker_idx] = job.chunk_dones[chunker_idx]
+            job.chunk_dones[chunker_idx] = max(job.chunk_dones[chunker_idx], job.chunk_totals[chunker_idx])
+            job.updated_at = time.time()
+            self.dirty.add(doc_id)
+
+    def finish(self, doc_id: int, error: str | None = None):
+        with self.lock:
+            job = self.jobs.get(doc_id)
+            if job is None:
+                return
+            job.stage = "failed" if error else "done"
+            job.error = error
+            job.finished_at = job.updated_at = time.time()
+            self.dirty.add(doc_id)
+
+    def snapshot(self, doc_ids: list[int]) -> list[dict]:
+        with self.lock:
+            return [self.jobs[doc_id].to_dict() for doc_id in doc_ids if doc_id in self.jobs]
+
+    def evict_finished(self):
+        with self.lock:
+            now = time.time()
+            expired = [
+                doc_id for doc_id, job in self.jobs.items()
+                if (job.finished_at is not None) and (now - job.finished_at > self.retention_seconds) and (doc_id not in self.dirty)
+            ]
+            for doc_id in expired:
+                del self.jobs[doc_id]
+                self.flush_failures.pop(doc_id, None)
+
+    async def flush(self):
+        with self.lock:
+            rows = [{"id": doc_id, "progress": self.jobs[doc_id].progress} for doc_id in self.dirty if doc_id in self.jobs]
+            self.dirty = set()
+        if not rows:
+            return 0
+        try:
+            async with database.async_rdb_session() as db:
+                # single bulk UPDATE by primary key for all changed jobs
+                await db.execute(update(database.Documents), rows)
+                await db.commit()
+            with self.lock:
+                for row in rows:
+                    self.flush_failures.pop(row["id"], None)
+            return len(rows)
+        except Exception as e:
+            print(f"ERROR in ProgressTracker.flush -> msg={e}")
+            await self.requeue_failed([row["id"] for row in rows])
+            return 0
+
+    async def requeue_failed(self, doc_ids: list[int]):
+        # rows of deleted documents are dropped, the others are retried up to max_flush_retries times
+        try:
+            async with database.async_rdb_session() as db:
+                existing = set((await db.execute(
+                    select(database.Documents.id).where(database.Documents.id.in_(doc_ids))
+                )).scalars().all())
+        except Exception:
+            existing = set(doc_ids)
+        with self.lock:
+            for doc_id in doc_ids:
+                self.flush_failures[doc_id] += 1
+                if (doc_id not in existing) or (self.flush_failures[doc_id] > self.max_flush_retries):
+                    print(f"ERROR in ProgressTracker.flush -> doc_id={doc_id}, msg=progress dropped (document exists: {doc_id in existing})")
+                    self.flush_failures.pop(doc_id, None)
+                elif doc_id in self.jobs:
+                    self.dirty.add(doc_id)
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            self.evict_finished()
+
+    def start_flusher(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.get_running_loop().create_task(self.run_flusher())
+
+    async def stop_flusher(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        # progress changed since the last tick is written before shutdown
+        await self.flush()
+
+tracker = ProgressTracker(
+    flush_interval=float(os.getenv("PROGRESS_FLUSH_INTERVAL", 2.0)),
+    retention_seconds=float(os.getenv("PROGRESS_RETENTION_SECONDS", 300)),
+    max_flush_retries=int(os.getenv("PROGRESS_FLUSH_RETRIES", 5)),
+)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List
 
 class ChatMessage(BaseModel):
@@ -17,6 +17,21 @@ class RetrieveDocument(BaseModel):
     page_number: int
     chunk_content: str
     score: float | None = None
+    # stored embedding, used for redundancy-aware selection only (never serialized)
+    vector: List[float] | None = Field(default=None, exclude=True)
 
 class ResponseRetrieveDocument(BaseModel):
     documents: List[RetrieveDocument]
+
+class RequestProgress(BaseModel):
+    doc_ids: List[int]
+
+class RequestProcessDocument(BaseModel):
+    doc_id: int
+    extension: str
+    proc_type: str
+    file_path: str
+    content_hash: str | None = None
+
+class RequestDeleteDocument(BaseModel):
+    doc_id: int
@@ -0,0 +1,46 @@
+import numpy as np
+import tiktoken
+
+encoding = None
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    global encoding
+    if encoding is None:
+        encoding = tiktoken.get_encoding(encoding_name)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def mmr_select(relevance: np.ndarray, vectors: np.ndarray, k: int, mmr_lambda: float = 0.7, redundancy_threshold: float = 0.9) -> list[int]:
+    """
+    Maximal marginal relevance: repeatedly picks argmax(lambda * relevance - (1 - lambda) * max similarity to the picked set).
+    Candidates whose similarity to an already picked chunk reaches redundancy_threshold are never picked,
+    so the result can be shorter than k. Rows of vectors are normalized here (all-zero rows = unknown, never redundant).
+    """
+    n = len(relevance)
+    if n == 0:
+        return []
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+    similarity = vectors @ vectors.T
+    selected = []
+    max_similarity = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    while (len(selected) < k) and available.any():
+        mmr = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity, -np.inf)
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+        available &= max_similarity < redundancy_threshold
+    return selected
+
+def token_report(baseline_docs: list, selected_docs: list) -> dict:
+    # tokens saved by the selection against the plain top-k (baseline_docs), docs carry .id and .chunk_content
+    selected_ids = {doc.id for doc in selected_docs}
+    tokens_baseline = sum(count_tokens(doc.chunk_content) for doc in baseline_docs)
+    tokens_selected = sum(count_tokens(doc.chunk_content) for doc in selected_docs)
+    return {
+        "tokens_baseline": tokens_baseline,
+        "tokens_selected": tokens_selected,
+        "tokens_saved": tokens_baseline - tokens_selected,
+        "skipped_ids": [doc.id for doc in baseline_docs if doc.id not in selected_ids],
+    }
@@ -0,0 +1,79 @@
+import re
+import numpy as np
+
+# a break ends after sentence punctuation followed by whitespace, or after a run of newlines
+BREAK_PATTERN = re.compile(r"(?<=[.!?。！？])\s+|\n+")
+
+def find_breaks(text: str) -> np.ndarray:
+    return np.fromiter((m.end() for m in BREAK_PATTERN.finditer(text)), dtype=np.int64)
+
+class MultiGranularitySplitter():
+    """
+    Token windows of several sizes over one tokenization of the text.
+    The text is tokenized once (offset mapping of a fast tokenizer, or characters when no tokenizer is given);
+    every (chunk_size, chunk_overlap) in splitter_config is cut from the same token offsets.
+    Window ends are pulled back to the nearest sentence / line break within snap_ratio * chunk_size tokens,
+    and the next window starts at the first break inside its overlap, so chunks rarely cut a sentence.
+    """
+    def __init__(self, tokenizer=None, snap_ratio: float = 0.15):
+        self.tokenizer = tokenizer
+        self.snap_ratio = snap_ratio
+
+    def get_offsets(self, text: str):
+        if self.tokenizer is None:
+            starts = np.arange(len(text), dtype=np.int64)
+            return starts, starts + 1
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        offsets = np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+        return offsets[:, 0], offsets[:, 1]
+
+    @staticmethod
+    def get_windows(n_tokens: int, break_tokens: np.ndarray, chunk_size: int, chunk_overlap: int, snap: int):
+        windows = []
+        start = 0
+        while start < n_tokens:
+            end = min(start + chunk_size, n_tokens)
+            if (end < n_tokens) and (len(break_tokens) > 0):
+                # last break in (end - snap, end]
+                i = np.searchsorted(break_tokens, end, side="right") - 1
+                if (i >= 0) and (break_tokens[i] > max(start, end - snap)):
+                    end = int(break_tokens[i])
+            windows.append((start, end))
+            if end >= n_tokens:
+                break
+            next_start = max(end - chunk_overlap, start + 1)
+            if len(break_tokens) > 0:
+                # first break in [next_start, next_start + snap) that still overlaps the window
+                i = np.searchsorted(break_tokens, next_start, side="left")
+                if (i < len(break_tokens)) and (break_tokens[i] < min(end, next_start + snap)):
+                    next_start = int(break_tokens[i])
+            start = next_start
+        return windows
+
+    def split(self, text: str, splitter_config: list[dict]) -> dict[str, list[dict]]:
+        """
+        splitter_config: [{"type": "rule_short", "params": {"chunk_size": 384, "chunk_overlap": 96}}, ...]
+        Returns {chunk_type: [{"chunk_content", "start_index", "end_index"}, ...]} with character offsets into text.
+        """
+        starts, ends = self.get_offsets(text)
+        n_tokens = len(starts)
+        # token index at which each break position begins
+        break_tokens = np.unique(np.searchsorted(starts, find_breaks(text), side="left"))
+        break_tokens = break_tokens[(break_tokens > 0) & (break_tokens < n_tokens)]
+
+        chunk_container = {}
+        for config in splitter_config:
+            chunk_size = config["params"]["chunk_size"]
+            chunk_overlap = config["params"].get("chunk_overlap", 0)
+            windows = self.get_windows(n_tokens, break_tokens, chunk_size, chunk_overlap, max(1, int(chunk_size * self.snap_ratio)))
+            chunks = []
+            for start, end in windows:
+                start_index, end_index = int(starts[start]), int(ends[end - 1])
+                content = text[start_index:end_index]
+                stripped = content.strip()
+                if not stripped:
+                    continue
+                start_index += len(content) - len(content.lstrip())
+                chunks.append({"chunk_content": stripped, "start_index": start_index, "end_index": start_index + len(stripped)})
+            chunk_container[config["type"]] = chunks
+        return chunk_container
@@ -0,0 +1,27 @@
+import os
+import hashlib
+from dotenv import load_dotenv
+load_dotenv()
+
+SPOOL_DIR = os.path.abspath(os.getenv("SPOOL_DIR", "./.spool/"))
+
+def resolve_spooled_path(file_path: str, spool_dir: str = SPOOL_DIR):
+    # only files inside the shared spool directory can be referenced
+    real_path = os.path.realpath(file_path)
+    real_spool_dir = os.path.realpath(spool_dir)
+    if os.path.commonpath([real_path, real_spool_dir]) != real_spool_dir:
+        raise ValueError(f"file is outside of spool directory (file_path={file_path})")
+    if not os.path.isfile(real_path):
+        raise FileNotFoundError(f"spooled file not found (file_path={file_path})")
+    return real_path
+
+def open_spooled_file(file_path: str):
+    # parsers read the spooled file directly from disk instead of an in-memory copy
+    return open(resolve_spooled_path(file_path), "rb")
+
+def hash_file(file_obj, block_size: int = 1024 * 1024):
+    sha256 = hashlib.sha256()
+    for block in iter(lambda: file_obj.read(block_size), b""):
+        sha256.update(block)
+    file_obj.seek(0)
+    return sha256.hexdigest()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# service modules are flat files in document-manager/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
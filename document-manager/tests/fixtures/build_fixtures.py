@@ -0,0 +1,81 @@
+# Regenerates the PDF fixtures and their expected page output (needs reportlab, not part of requirements.txt):
+#     python tests/fixtures/build_fixtures.py      (from document-manager/)
+# Expected output comes from the original pandas implementation (bench_parser.get_page_data_legacy), so the
+# tests pin ParserPDF.get_page_data to the behaviour it replaced.
+import os
+import sys
+import json
+import pdfplumber
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+FIXTURE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(FIXTURE_DIR)))
+from parser import ParserPDF
+from bench_parser import get_page_data_legacy
+
+def draw_table(pdf, rows, x, y, col_widths):
+    table = Table(rows, colWidths=col_widths)
+    table.setStyle(TableStyle([("GRID", (0, 0), (-1, -1), 0.5, colors.black), ("FONTSIZE", (0, 0), (-1, -1), 9)]))
+    _, height = table.wrapOn(pdf, 0, 0)
+    table.drawOn(pdf, x, y - height)
+    return y - height
+
+def build_text(path):
+    # two pages of plain text: words on one line are joined, lines are ordered top to bottom
+    pdf = canvas.Canvas(path, pagesize=A4, invariant=1)
+    width, height = A4
+    pdf.setFont("Helvetica", 11)
+    lines = [
+        "Quarterly report on ingestion throughput",
+        "The pipeline parses, chunks and embeds each document.",
+        "Chunks are stored with the page they start on.",
+    ]
+    for idx, line in enumerate(lines):
+        pdf.drawString(72, height - 72 - idx * 18, line)
+    # same baseline, separate text runs -> one line
+    pdf.drawString(72, height - 160, "Left column")
+    pdf.drawString(320, height - 160, "Right column")
+    pdf.showPage()
+    pdf.setFont("Helvetica", 11)
+    pdf.drawString(72, height - 300, "Second page, written lower first")
+    pdf.drawString(72, height - 90, "Second page heading")
+    pdf.showPage()
+    pdf.save()
+
+def build_table(path):
+    # text above and below a ruled table; the constant "Unit" column is dropped from the markdown
+    pdf = canvas.Canvas(path, pagesize=A4, invariant=1)
+    width, height = A4
+    pdf.setFont("Helvetica", 11)
+    pdf.drawString(72, height - 72, "Benchmark results")
+    bottom = draw_table(pdf, [
+        ["Stage", "Seconds", "Unit"],
+        ["parse", "1.25", "s"],
+        ["chunk", "3.50", "s"],
+        ["embed", "0.75", "s"],
+    ], 72, height - 100, [120, 80, 60])
+    pdf.setFont("Helvetica", 11)
+    pdf.drawString(72, bottom - 30, "Embedding is no longer the bottleneck.")
+    pdf.showPage()
+    pdf.save()
+
+def main():
+    parser = ParserPDF(n_workers=1)
+    for name, build in [("text", build_text), ("table", build_table)]:
+        pdf_path = os.path.join(FIXTURE_DIR, f"{name}.pdf")
+        build(pdf_path)
+        with pdfplumber.open(pdf_path) as doc:
+            expected = [
+                {"page_number": page_number + 1, "page_content": get_page_data_legacy(parser, page).strip()}
+                for page_number, page in enumerate(doc.pages)
+            ]
+        with open(os.path.join(FIXTURE_DIR, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(expected, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"{name}.pdf / pages={len(expected)}")
+
+if __name__ == "__main__":
+    main()
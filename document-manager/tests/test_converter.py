@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+import converter
+from converter import ConversionError, ConverterPool, LocalConverter
+
+class CountingConverter(LocalConverter):
+    def __init__(self, slot, profile_root, delay=0.0):
+        super().__init__(slot, profile_root, delay=delay)
+        self.n_starts = 0
+
+    def start(self):
+        self.n_starts += 1
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "slides.pptx"
+    path.write_bytes(b"%PDF-1.4 stand-in")
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    return str(path), str(out_dir)
+
+def make_pool(tmp_path, delay=0.0, **kwargs):
+    converters = []
+    def factory(slot, profile_root):
+        converters.append(CountingConverter(slot, profile_root, delay=delay))
+        return converters[-1]
+    return ConverterPool(factory, profile_root=str(tmp_path / "profiles"), **kwargs), converters
+
+def test_convert(tmp_path, source):
+    pool, converters = make_pool(tmp_path, n_workers=1)
+    dst_path = pool.convert(*source)
+    assert dst_path.endswith("slides.pdf")
+    with open(dst_path, "rb") as f:
+        assert f.read() == b"%PDF-1.4 stand-in"
+    # slots are started once, on first use
+    pool.convert(*source)
+    assert converters[0].n_starts == 1
+    assert pool.stats() == {"idle": 1, "waiting": 0, "restarts": 0}
+
+def test_hung_conversion_times_out_and_restarts_the_slot(tmp_path, source):
+    pool, converters = make_pool(tmp_path, delay=30.0, n_workers=1, timeout=0.5)
+    started_at = time.monotonic()
+    with pytest.raises(ConversionError, match="timed out"):
+        pool.convert(*source)
+    assert time.monotonic() - started_at < 10
+    assert pool.stats()["restarts"] == 1
+    assert converters[0].n_starts == 2
+    # the slot is back in the pool and converts again
+    converters[0].delay = 0.0
+    assert pool.convert(*source).endswith("slides.pdf")
+    assert pool.stats()["idle"] == 1
+
+def test_jobs_queue_for_a_free_slot(tmp_path, source):
+    pool, _ = make_pool(tmp_path, delay=0.5, n_workers=1)
+    results, waiting = [], []
+    threads = [threading.Thread(target=lambda: results.append(pool.convert(*source))) for _ in range(2)]
+    started_at = time.monotonic()
+    for thread in threads:
+        thread.start()
+    time.sleep(0.3)
+    waiting.append(pool.stats()["waiting"])
+    for thread in threads:
+        thread.join()
+    assert waiting == [1]
+    assert len(results) == 2
+    # one slot: the conversions ran one after the other
+    assert time.monotonic() - started_at >= 1.0
+    assert pool.stats()["waiting"] == 0
+
+def test_acquire_timeout(tmp_path, source):
+    pool, _ = make_pool(tmp_path, delay=1.5, n_workers=1, acquire_timeout=0.2)
+    busy = threading.Thread(target=pool.convert, args=source)
+    busy.start()
+    time.sleep(0.2)
+    with pytest.raises(ConversionError, match="no converter available"):
+        pool.convert(*source)
+    busy.join()
+    assert pool.stats()["waiting"] == 0
+
+def test_default_backend(monkeypatch):
+    monkeypatch.setenv("CONVERTER_BACKEND", "local")
+    assert converter.default_converter_backend() == "local"
+    monkeypatch.delenv("CONVERTER_BACKEND")
+    monkeypatch.setattr(converter.shutil, "which", lambda name: f"/usr/bin/{name}")
+    assert converter.default_converter_backend() == "unoserver"
+    monkeypatch.setattr(converter.shutil, "which", lambda name: None)
+    assert converter.default_converter_backend() == "soffice"
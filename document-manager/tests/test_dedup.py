@@ -0,0 +1,54 @@
+import pytest
+from dedup import MinHashDeduplicator
+
+TEXT = (
+    "The ingestion pipeline parses every document, splits it into chunks, embeds the chunks in batches "
+    "and upserts the vectors into Milvus together with their page numbers."
+)
+OTHER = "Retrieval embeds the question, searches the collection and reranks the candidates before prompting."
+
+def chunk(content):
+    return {"chunk_content": content}
+
+def test_exact_and_whitespace_duplicates_are_dropped():
+    deduplicator = MinHashDeduplicator()
+    kept = deduplicator.filter(0, [chunk(TEXT), chunk(OTHER), chunk(TEXT), chunk("  " + TEXT.upper().replace(" ", "\n"))])
+    assert [item["chunk_content"] for item in kept] == [TEXT, OTHER]
+    assert deduplicator.stats()["checked"] == 4
+    assert deduplicator.stats()["dropped"] == 2
+
+def test_threshold():
+    near = TEXT.replace("Milvus", "Milvus 2.4")
+    strict = MinHashDeduplicator(threshold=1.0)
+    assert len(strict.filter(0, [chunk(TEXT), chunk(near)])) == 2
+    loose = MinHashDeduplicator(threshold=0.5)
+    assert len(loose.filter(0, [chunk(TEXT), chunk(near)])) == 1
+
+def test_chunker_scope_keeps_duplicates_of_other_chunkers():
+    deduplicator = MinHashDeduplicator(scope="chunker")
+    assert len(deduplicator.filter(0, [chunk(TEXT)])) == 1
+    assert len(deduplicator.filter(1, [chunk(TEXT)])) == 1
+    assert len(deduplicator.filter(1, [chunk(TEXT)])) == 0
+    assert deduplicator.stats()["dropped_by_chunker"] == {1: 1}
+
+def test_document_scope_compares_across_chunkers():
+    deduplicator = MinHashDeduplicator(scope="document")
+    assert len(deduplicator.filter(0, [chunk(TEXT), chunk(OTHER)])) == 2
+    assert len(deduplicator.filter(1, [chunk(OTHER), chunk(TEXT)])) == 0
+    stats = deduplicator.stats()
+    assert (stats["checked"], stats["dropped"], stats["dropped_by_chunker"]) == (4, 2, {1: 2})
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        MinHashDeduplicator(scope="page")
+    with pytest.raises(ValueError):
+        MinHashDeduplicator(num_perm=60, bands=16)
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("DEDUP_ENABLED", "false")
+    assert MinHashDeduplicator.from_env() is None
+    monkeypatch.setenv("DEDUP_ENABLED", "true")
+    monkeypatch.setenv("DEDUP_SCOPE", "document")
+    monkeypatch.setenv("DEDUP_THRESHOLD", "0.8")
+    deduplicator = MinHashDeduplicator.from_env()
+    assert (deduplicator.scope, deduplicator.threshold) == ("document", 0.8)
@@ -0,0 +1,55 @@
+from incremental import affected_pages, create_chunk_id, diff_pages, fingerprint_page, group_windows
+
+def pages(*contents):
+    return [(page_number, fingerprint_page(content)) for page_number, content in enumerate(contents, start=1)]
+
+def test_fingerprint_ignores_whitespace():
+    assert fingerprint_page("a  b\nc ") == fingerprint_page(" a b c")
+    assert fingerprint_page("a b c") != fingerprint_page("a b d")
+
+def test_diff_pages():
+    old = pages("p1", "p2", "p3", "p4")
+    new = pages("p1", "p3", "p3 edited", "p4", "p5")
+    matched, removed, changed = diff_pages(old, new)
+    assert matched == {1: 1, 3: 2, 4: 4}
+    assert removed == [2]
+    assert changed == [3, 5]
+
+def test_diff_pages_pairs_repeated_pages_one_to_one():
+    old = pages("blank", "text", "blank")
+    new = pages("blank", "blank", "blank")
+    matched, removed, changed = diff_pages(old, new)
+    assert matched == {1: 1, 3: 2}
+    assert removed == [2]
+    assert changed == [3]
+
+def test_affected_pages_include_neighbours():
+    # old pages 1-8, page 4 edited, page 7 deleted
+    matched = {1: 1, 2: 2, 3: 3, 5: 5, 6: 6, 8: 7}
+    stale, affected = affected_pages(matched, removed=[4, 7], changed=[4])
+    assert stale == [3, 4, 5, 6, 7, 8]
+    assert affected == [3, 4, 5, 6, 7]
+
+def test_affected_pages_without_context():
+    stale, affected = affected_pages({1: 1, 3: 3}, removed=[2], changed=[2], context=0)
+    assert (stale, affected) == ([2], [2])
+
+def test_affected_pages_nothing_changed():
+    assert affected_pages({1: 1, 2: 2}, removed=[], changed=[]) == ([], [])
+
+def test_group_windows():
+    assert group_windows([7, 2, 3]) == [[2, 3], [7]]
+    assert group_windows([1, 2, 3]) == [[1, 2, 3]]
+    assert group_windows([]) == []
+
+def test_create_chunk_id_occurrence():
+    first = create_chunk_id(1, "semantic", 3, "same text")
+    assert first == create_chunk_id(1, "semantic", 3, "same text", occurrence=0)
+    second = create_chunk_id(1, "semantic", 3, "same text", occurrence=1)
+    third = create_chunk_id(1, "semantic", 3, "same text", occurrence=2)
+    assert len({first, second, third}) == 3
+    # deterministic, and scoped by document, chunker and page
+    assert second == create_chunk_id(1, "semantic", 3, "same text", occurrence=1)
+    assert first != create_chunk_id(2, "semantic", 3, "same text")
+    assert first != create_chunk_id(1, "rule", 3, "same text")
+    assert first != create_chunk_id(1, "semantic", 4, "same text")
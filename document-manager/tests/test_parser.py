@@ -0,0 +1,27 @@
+import os
+import io
+import json
+import pytest
+from parser import ParserPDF
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURES = ["text", "table"]
+
+def load_expected(name):
+    with open(os.path.join(FIXTURE_DIR, f"{name}.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.mark.parametrize("name", FIXTURES)
+def test_get_page_data_matches_golden_output(name):
+    page_container = ParserPDF(n_workers=1).parse(os.path.join(FIXTURE_DIR, f"{name}.pdf"))
+    assert page_container.to_dict("records") == load_expected(name)
+
+@pytest.mark.parametrize("name", FIXTURES)
+def test_parse_from_bytes(name):
+    with open(os.path.join(FIXTURE_DIR, f"{name}.pdf"), "rb") as f:
+        page_container = ParserPDF(n_workers=1).parse(io.BytesIO(f.read()))
+    assert page_container.to_dict("records") == load_expected(name)
+
+def test_parallel_parse_keeps_page_order():
+    page_container = ParserPDF(n_workers=2, min_pages_per_worker=1).parse(os.path.join(FIXTURE_DIR, "text.pdf"))
+    assert page_container.to_dict("records") == load_expected("text")
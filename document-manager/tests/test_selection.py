@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import selection
+from selection import mmr_select, token_report
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # the tiktoken encoding is downloaded on first use: count words instead
+    monkeypatch.setattr(selection, "count_tokens", lambda text: len(text.split()))
+
+def test_mmr_without_redundancy_is_top_k():
+    relevance = np.array([0.9, 0.8, 0.7, 0.6])
+    vectors = np.eye(4, dtype=np.float32)
+    assert mmr_select(relevance, vectors, k=3) == [0, 1, 2]
+
+def test_mmr_skips_redundant_candidates():
+    relevance = np.array([0.9, 0.85, 0.5])
+    # candidate 1 is a near copy of candidate 0
+    vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]], dtype=np.float32)
+    assert mmr_select(relevance, vectors, k=2) == [0, 2]
+    # nothing is left once the copy is skipped: the result is shorter than k
+    assert mmr_select(relevance, vectors, k=3) == [0, 2]
+    assert mmr_select(relevance, vectors, k=3, redundancy_threshold=1.01) == [0, 2, 1]
+
+def test_mmr_lambda_one_ranks_by_relevance():
+    relevance = np.array([0.9, 0.85, 0.5])
+    vectors = np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]], dtype=np.float32)
+    assert mmr_select(relevance, vectors, k=3, mmr_lambda=1.0, redundancy_threshold=1.01) == [0, 1, 2]
+
+def test_mmr_unknown_vectors_are_never_redundant():
+    relevance = np.array([0.9, 0.8])
+    vectors = np.zeros((2, 3), dtype=np.float32)
+    assert mmr_select(relevance, vectors, k=2) == [0, 1]
+    assert mmr_select(np.array([]), np.zeros((0, 3)), k=2) == []
+
+def test_token_report():
+    doc = lambda id, content: SimpleNamespace(id=id, chunk_content=content)
+    baseline = [doc("a", "one two three"), doc("b", "one two three"), doc("c", "four five")]
+    selected = [doc("a", "one two three"), doc("c", "four five"), doc("d", "six")]
+    assert token_report(baseline, selected) == {
+        "tokens_baseline": 8,
+        "tokens_selected": 6,
+        "tokens_saved": 2,
+        "skipped_ids": ["b"],
+    }
+    assert token_report(baseline, baseline)["tokens_saved"] == 0
@@ -0,0 +1,72 @@
+import re
+
+import numpy as np
+
+from splitter import MultiGranularitySplitter, find_breaks
+
+def word_tokenizer(text, **kwargs):
+    # fast-tokenizer stand-in: one token per word, with its character offsets
+    return {"offset_mapping": [(m.start(), m.end()) for m in re.finditer(r"\S+", text)]}
+
+TEXT = "Alpha beta gamma. Delta epsilon zeta. Eta theta iota."
+
+def test_find_breaks():
+    assert find_breaks("One. Two\n\nThree! Four").tolist() == [5, 10, 17]
+
+def test_windows_without_breaks_have_exact_size_and_overlap():
+    windows = MultiGranularitySplitter.get_windows(30, np.array([], dtype=np.int64), 10, 3, 1)
+    assert windows == [(0, 10), (7, 17), (14, 24), (21, 30)]
+
+def test_window_end_snaps_back_to_a_break():
+    # break at 8 lies within snap=3 of the end 10, break 18 is too far from 22
+    windows = MultiGranularitySplitter.get_windows(30, np.array([8, 18]), 10, 3, 3)
+    assert windows == [(0, 8), (5, 15), (12, 22), (19, 29), (26, 30)]
+
+def test_window_start_snaps_forward_to_a_break_in_the_overlap():
+    windows = MultiGranularitySplitter.get_windows(20, np.array([7]), 10, 4, 2)
+    assert windows == [(0, 10), (7, 17), (13, 20)]
+
+def test_split_with_tokenizer_offsets():
+    splitter = MultiGranularitySplitter(word_tokenizer, snap_ratio=0.5)
+    chunks = splitter.split(TEXT, [
+        {"type": "short", "params": {"chunk_size": 4, "chunk_overlap": 1}},
+        {"type": "long", "params": {"chunk_size": 6}},
+    ])
+    assert chunks == {
+        "short": [
+            {"chunk_content": "Alpha beta gamma.", "start_index": 0, "end_index": 17},
+            {"chunk_content": "gamma. Delta epsilon zeta.", "start_index": 11, "end_index": 37},
+            {"chunk_content": "zeta. Eta theta iota.", "start_index": 32, "end_index": 53},
+        ],
+        "long": [
+            {"chunk_content": "Alpha beta gamma. Delta epsilon zeta.", "start_index": 0, "end_index": 37},
+            {"chunk_content": "Eta theta iota.", "start_index": 38, "end_index": 53},
+        ],
+    }
+
+def test_split_by_characters():
+    splitter = MultiGranularitySplitter(snap_ratio=0.3)
+    chunks = splitter.split("One two three. Four five six. Seven eight nine.", [{"type": "rule", "params": {"chunk_size": 20, "chunk_overlap": 8}}])
+    assert chunks["rule"] == [
+        {"chunk_content": "One two three.", "start_index": 0, "end_index": 14},
+        {"chunk_content": "three. Four five si", "start_index": 8, "end_index": 27},
+        {"chunk_content": "five six. Seven eig", "start_index": 20, "end_index": 39},
+        {"chunk_content": "even eight nine.", "start_index": 31, "end_index": 47},
+    ]
+
+def test_offsets_point_into_the_text():
+    text = "  " + " ".join(f"Sentence number {i} ends here." for i in range(40)) + "\n\n\n"
+    splitter = MultiGranularitySplitter(word_tokenizer)
+    configs = [{"type": "short", "params": {"chunk_size": 16, "chunk_overlap": 4}}, {"type": "long", "params": {"chunk_size": 48, "chunk_overlap": 12}}]
+    for config, chunks in zip(configs, splitter.split(text, configs).values()):
+        assert chunks[0]["start_index"] == 2
+        assert chunks[-1]["end_index"] == len(text.rstrip())
+        for chunk in chunks:
+            assert text[chunk["start_index"]:chunk["end_index"]] == chunk["chunk_content"]
+            assert len(word_tokenizer(chunk["chunk_content"])["offset_mapping"]) <= config["params"]["chunk_size"]
+
+def test_whitespace_only_windows_are_skipped():
+    splitter = MultiGranularitySplitter()
+    chunks = splitter.split("abc" + " " * 10 + "def", [{"type": "rule", "params": {"chunk_size": 4}}])
+    assert [chunk["chunk_content"] for chunk in chunks["rule"]] == ["abc", "def"]
+    assert splitter.split("", [{"type": "rule", "params": {"chunk_size": 4}}]) == {"rule": []}
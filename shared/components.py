@@ -0,0 +1,107 @@
+import gc
+import time
+import asyncio
+import threading
+
+class Component():
+    def __init__(self, name: str, factory, warmup=None, close=None, required: bool = True):
+        self.name = name
+        self.factory = factory
+        self.warmup = warmup
+        self.close = close
+        self.required = required
+        self.value = None
+        self.state = "pending"
+        self.error = None
+        self.init_seconds = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        # initialized on first use; a failed initialization is retried by the next caller
+        if self.value is None:
+            with self.lock:
+                if self.value is None:
+                    self.state = "initializing"
+                    start = time.perf_counter()
+                    try:
+                        value = self.factory()
+                        if self.warmup is not None:
+                            self.warmup(value)
+                    except Exception as e:
+                        self.state, self.error = "failed", str(e)
+                        print(f"ERROR in Component.get -> name={self.name}, msg={e}")
+                        raise
+                    self.init_seconds = round(time.perf_counter() - start, 3)
+                    self.value, self.state, self.error = value, "ready", None
+                    print(f"component ready / name={self.name}, init_seconds={self.init_seconds}")
+        return self.value
+
+    def to_dict(self):
+        return {"state": self.state, "required": self.required, "init_seconds": self.init_seconds, "error": self.error}
+
+class ComponentRegistry():
+    """
+    Heavy service dependencies (models, database schema, vector DB connection) are registered here instead of being
+    created at import time. They are initialized by the first get(), in the background by start() (FastAPI lifespan),
+    or in the parent process by preload() before workers are forked.
+    /healthz only tells that the process is alive, /readyz that every required component is initialized.
+    """
+    def __init__(self):
+        self.components = {}
+        self.start_task = None
+
+    def register(self, name: str, factory, warmup=None, close=None, required: bool = True):
+        self.components[name] = Component(name, factory, warmup=warmup, close=close, required=required)
+
+    def get(self, name: str):
+        return self.components[name].get()
+
+    def preload(self, names: list[str]):
+        # only fork-safe components (model weights); connections and pools must be opened in each worker
+        for name in names:
+            self.get(name)
+        # keep preloaded objects out of the collector, so workers do not touch (and copy) their pages
+        gc.freeze()
+
+    async def initialize(self, retry_interval: float = 5.0):
+        async def init(component):
+            try:
+                await asyncio.to_thread(component.get)
+            except Exception:
+                pass
+        # failed components (e.g. database not up yet) are retried, an unready instance gets no traffic to retry them
+        while True:
+            pending = [component for component in self.components.values() if component.value is None]
+            if not pending:
+                return
+            await asyncio.gather(*[init(component) for component in pending])
+            if all(component.value is not None for component in pending):
+                return
+            await asyncio.sleep(retry_interval)
+
+    def start(self, retry_interval: float = 5.0):
+        # startup does not wait: the server answers /healthz while models load, /readyz turns 200 once done
+        if self.start_task is None:
+            self.start_task = asyncio.get_running_loop().create_task(self.initialize(retry_interval))
+
+    async def stop(self):
+        if self.start_task is not None:
+            self.start_task.cancel()
+            self.start_task = None
+        for component in self.components.values():
+            if (component.value is not None) and (component.close is not None):
+                try:
+                    result = component.close(component.value)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    print(f"ERROR in ComponentRegistry.stop -> name={component.name}, msg={e}")
+            component.value, component.state = None, "pending"
+
+    def is_ready(self) -> bool:
+        return all(component.state == "ready" for component in self.components.values() if component.required)
+
+    def status(self) -> dict:
+        return {"ready": self.is_ready(), "components": {name: component.to_dict() for name, component in self.components.items()}}
+
+registry = ComponentRegistry()
@@ -0,0 +1,50 @@
+import os
+import sys
+import argparse
+
+# Modules used unchanged by both services. The files in this directory are the only ones to edit: each service keeps
+# a generated copy next to its main.py, so it still deploys (and imports) on its own.
+#     python shared/sync.py           rewrite the service copies
+#     python shared/sync.py --check   exit 1 when a copy differs from its source (run by shared/tests)
+SHARED_MODULES = ["components.py", "llm_scheduler.py", "tracing.py"]
+SERVICES = ["backend", "document-manager"]
+
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SHARED_DIR)
+HEADER = "# Generated from shared/{name} by shared/sync.py: edit the source and run `python shared/sync.py`, not this copy.\n"
+
+def render(name: str) -> str:
+    with open(os.path.join(SHARED_DIR, name), "r", encoding="utf-8") as f:
+        return HEADER.format(name=name) + f.read()
+
+def copies():
+    for service in SERVICES:
+        for name in SHARED_MODULES:
+            yield os.path.join(ROOT_DIR, service, name), render(name)
+
+def find_drift() -> list[str]:
+    drifted = []
+    for path, expected in copies():
+        if not os.path.isfile(path):
+            drifted.append(path)
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() != expected:
+                drifted.append(path)
+    return drifted
+
+def main(args):
+    if args.check:
+        drifted = find_drift()
+        for path in drifted:
+            print(f"out of date: {os.path.relpath(path, ROOT_DIR)}")
+        sys.exit(1 if drifted else 0)
+    for path, expected in copies():
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.write(expected)
+        print(f"wrote {os.path.relpath(path, ROOT_DIR)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the shared modules into every service")
+    parser.add_argument("--check", action="store_true", help="only report copies that differ from shared/")
+    main(parser.parse_args())
@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sync
+
+def test_service_copies_match_shared_sources():
+    # fails when a copy was edited in place: edit shared/<module>.py and run `python shared/sync.py`
+    assert sync.find_drift() == []
+
+def test_edited_copy_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(sync, "ROOT_DIR", str(tmp_path))
+    for service in sync.SERVICES:
+        (tmp_path / service).mkdir()
+    sync.main(type("Args", (), {"check": False})())
+    assert sync.find_drift() == []
+    copy = tmp_path / "backend" / "tracing.py"
+    copy.write_text(copy.read_text(encoding="utf-8") + "# local fix\n", encoding="utf-8")
+    assert sync.find_drift() == [str(copy)]
@@ -0,0 +1,84 @@
+import os
+from opentelemetry import trace, propagate
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from dotenv import load_dotenv
+load_dotenv()
+
+# spans are no-ops until setup_tracing installs a provider
+tracer = trace.get_tracer("rag")
+# set when TRACE_EXPORTER=memory, finished spans are read with memory_exporter.get_finished_spans()
+memory_exporter = None
+
+def create_exporter(kind: str, service_name: str):
+    if kind == "file":
+        # one JSON span per line
+        path = os.getenv("TRACE_FILE_PATH", "../.traces/{service}.jsonl").format(service=service_name)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return ConsoleSpanExporter(out=open(path, "a", encoding="utf-8"), formatter=lambda span: span.to_json(indent=None) + "\n")
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        endpoint = os.getenv("TRACE_OTLP_ENDPOINT")
+        return OTLPSpanExporter(endpoint=endpoint) if endpoint else OTLPSpanExporter()
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "memory":
+        return InMemorySpanExporter()
+    raise ValueError(f"Invalid trace exporter (exporter={kind})")
+
+def setup_tracing(service_name: str, exporter: str | None = None, sample_rate: float | None = None):
+    """
+    exporter: none | file | otlp | console | memory (default TRACE_EXPORTER)
+    sample_rate: fraction of new traces recorded (default TRACE_SAMPLE_RATE); a request carrying a traceparent header
+        follows the caller's decision, so a trace is either complete across services or absent
+    """
+    global memory_exporter
+    kind = os.getenv("TRACE_EXPORTER", "none") if exporter is None else exporter
+    if kind == "none":
+        return None
+    rate = float(os.getenv("TRACE_SAMPLE_RATE", 0.1)) if sample_rate is None else sample_rate
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(rate)),
+    )
+    span_exporter = create_exporter(kind, service_name)
+    if kind == "memory":
+        memory_exporter = span_exporter
+        provider.add_span_processor(SimpleSpanProcessor(span_exporter))
+    else:
+        provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+    print(f"setup_tracing / service={service_name}, exporter={kind}, sample_rate={rate}")
+    return provider
+
+def start_span(name: str, context=None, **attributes):
+    # span that is not made current, for async generators that are resumed in other contexts; end it explicitly
+    # returns (span, context for child spans)
+    span = tracer.start_span(name, context=context, attributes=attributes)
+    return span, trace.set_span_in_context(span, context)
+
+def record_error(span, e: Exception):
+    span.record_exception(e)
+    span.set_status(Status(StatusCode.ERROR, str(e)))
+
+def inject_headers(context=None) -> dict:
+    # W3C traceparent of the current (or given) span for outgoing httpx calls
+    headers = {}
+    propagate.inject(headers, context=context)
+    return headers
+
+async def trace_http_request(request, call_next):
+    # server span continuing the caller's trace, registered with app.middleware("http")
+    with tracer.start_as_current_span(
+        f"{request.method} {request.url.path}",
+        context=propagate.extract(request.headers),
+        kind=SpanKind.SERVER,
+        attributes={"http.method": request.method, "http.route": request.url.path},
+    ) as span:
+        response = await call_next(request)
+        span.set_attribute("http.status_code", response.status_code)
+        return response